@@ -0,0 +1,129 @@
+"""
+Micro-benchmark del parseo de páginas de la API del BCRA (no necesita base de datos ni red).
+
+Compara, sobre las mismas páginas de 1000 cotizaciones:
+- dict_rows: el parseo anterior de bcra_api_pipeline.py (json, lista de diccionarios, un
+  DataFrame por página con pd.to_datetime/pd.to_numeric, y pd.concat, sin duplicados y
+  ordenado al final).
+- columnar: bcra_columns.py (orjson si está instalado, buffers numpy por página y un solo
+  DataFrame al final).
+
+Las páginas pueden ser respuestas guardadas de la API real (--pages-dir con archivos *.json, por
+ejemplo con curl '.../Cotizaciones/USD?fechadesde=2015-01-01&fechahasta=2019-12-31&limit=1000&offset=0')
+o generadas con el mismo formato que fake_bcra_server.py. Informa filas/segundo por etapa y la
+mejora, y escribe los resultados en JSON como run_benchmarks.py.
+
+Uso:
+    python benchmarks/bcra_parse_benchmark.py --pages 200 --repeat 5
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+from datetime import date, datetime
+
+import pandas as pd
+
+from benchmark_utils import StageRecorder, add_pipeline_to_path, compare_with_baseline
+from fake_bcra_server import CURRENCIES, MAX_LIMIT, build_evolution_page
+
+add_pipeline_to_path('exercise2_bcra_api')
+from bcra_columns import CotizacionesColumns, decode_json, orjson
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+def load_recorded_pages(pages_dir):
+    """Cuerpos (bytes) de las respuestas guardadas en pages_dir, en orden de nombre."""
+    paths = sorted(glob.glob(os.path.join(pages_dir, "*.json")))
+    if not paths:
+        raise FileNotFoundError(f"No hay páginas *.json en '{pages_dir}'.")
+    bodies = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            bodies.append(f.read())
+    return bodies
+
+def generate_pages(page_count):
+    """Páginas completas de MAX_LIMIT cotizaciones, recorriendo la serie desde 2002 de varias monedas."""
+    start_date, end_date = date(2002, 1, 1), date.today()
+    business_days_count = build_evolution_page(CURRENCIES[0], start_date, end_date, 1)["metadata"]["resultset"]["count"]
+    pages_per_currency = business_days_count // MAX_LIMIT
+    bodies = []
+    for page_number in range(page_count):
+        currency = CURRENCIES[page_number // pages_per_currency % len(CURRENCIES)]
+        offset = page_number % pages_per_currency * MAX_LIMIT
+        page = build_evolution_page(currency, start_date, end_date, MAX_LIMIT, offset)
+        bodies.append(json.dumps(page).encode("utf-8"))
+    return bodies
+
+def parse_dict_rows(bodies, monedas):
+    """Parseo anterior: lista de diccionarios y un DataFrame por página."""
+    frames = []
+    for body in bodies:
+        processed_records = []
+        for item in json.loads(body)['results']:
+            for detalle in item.get('detalle', []):
+                if detalle.get('codigoMoneda') in monedas:
+                    processed_records.append({
+                        'fecha': item.get('fecha'),
+                        'moneda': detalle.get('codigoMoneda'),
+                        'tipo_cambio': detalle.get('tipoCotizacion'),
+                        'fuente': 'BCRA'
+                    })
+        df_chunk = pd.DataFrame(processed_records)
+        df_chunk['fecha'] = pd.to_datetime(df_chunk['fecha']).dt.date
+        df_chunk['tipo_cambio'] = pd.to_numeric(df_chunk['tipo_cambio'], errors='coerce')
+        frames.append(df_chunk.dropna(subset=['tipo_cambio']))
+    df = pd.concat(frames, ignore_index=True).drop_duplicates(subset=['fecha', 'moneda'])
+    return df.sort_values(['fecha', 'moneda'], ignore_index=True)
+
+def parse_columnar(bodies, monedas):
+    """Parseo columnar: buffers numpy por página y un DataFrame al final."""
+    batches = [CotizacionesColumns.from_results(decode_json(body)['results'], monedas) for body in bodies]
+    return CotizacionesColumns.concat(batches).to_frame()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark del parseo de respuestas de la API del BCRA.")
+    parser.add_argument("--pages", type=int, default=200, help="Páginas a generar si no se indica --pages-dir.")
+    parser.add_argument("--pages-dir", default=None, help="Directorio con respuestas guardadas de la API (*.json).")
+    parser.add_argument("--repeat", type=int, default=5, help="Veces que se parsea el conjunto de páginas en cada etapa.")
+    parser.add_argument("--output", default=None, help="Archivo JSON de resultados (por defecto benchmarks/results/bcra_parse_<fecha>.json).")
+    parser.add_argument("--baseline", default=None, help="JSON de una corrida anterior contra el cual detectar regresiones.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Caída de rendimiento tolerada frente al baseline (0.2 = 20%%).")
+    args = parser.parse_args()
+
+    bodies = load_recorded_pages(args.pages_dir) if args.pages_dir else generate_pages(args.pages)
+    monedas = set(CURRENCIES)
+    print(
+        f"{len(bodies)} páginas ({sum(map(len, bodies)) / 1024 / 1024:.1f} MB), {args.repeat} repeticiones; "
+        f"decodificador JSON del parseo columnar: {'orjson' if orjson is not None else 'json'}."
+    )
+
+    # Sin tracemalloc: su costo por asignación distorsionaría la comparación de tiempos
+    recorder = StageRecorder(trace_memory=False)
+    parsed = {}
+    for stage_name, parse in (("dict_rows", parse_dict_rows), ("columnar", parse_columnar)):
+        with recorder.stage("bcra_parse", stage_name) as metrics:
+            for _ in range(args.repeat):
+                parsed[stage_name] = parse(bodies, monedas)
+            metrics["rows"] = len(parsed[stage_name]) * args.repeat
+            metrics["pages"] = len(bodies) * args.repeat
+
+    # Los dos caminos deben producir las mismas cotizaciones
+    expected = parsed["dict_rows"]
+    actual = parsed["columnar"].assign(fecha=parsed["columnar"]['fecha'].dt.date)
+    same_rows = expected[['fecha', 'moneda', 'tipo_cambio']].equals(actual[['fecha', 'moneda', 'tipo_cambio']])
+    recorder.results[-1]["ok"] = same_rows
+
+    dict_rows, columnar = recorder.results
+    speedup = dict_rows["wall_time_s"] / columnar["wall_time_s"] if columnar["wall_time_s"] else float("inf")
+    print(f"\nParseo columnar {speedup:.1f}x más rápido que el de diccionarios; mismas filas: {same_rows}.")
+
+    output_path = args.output or os.path.join(RESULTS_DIR, f"bcra_parse_{datetime.now():%Y%m%d_%H%M%S}.json")
+    recorder.write_results(output_path, {**vars(args), "orjson": orjson is not None, "speedup": round(speedup, 2)})
+
+    regressions = compare_with_baseline(recorder.results, args.baseline, args.threshold) if args.baseline else []
+    for regression in regressions:
+        print(f"REGRESIÓN: {regression}")
+    sys.exit(1 if not same_rows or regressions else 0)
@@ -0,0 +1,159 @@
+"""
+Prueba de carga y resistencia (soak) de la descarga del BCRA contra el simulador local
+(fake_bcra_server.py), sin base de datos ni red.
+
+Levanta el simulador con latencia, tope de peticiones por segundo, fallas inyectadas (429, 5xx,
+conexiones cortadas) y un tamaño de página menor al que pide el pipeline, y repite la descarga
+del historial completo de varias monedas con las mismas funciones que run_bcra_pipeline
+(plan_fetch_windows, fetch_windows y combine_block_frames). El planificador de ventanas se
+conserva entre iteraciones, así también se prueba su ajuste con lo observado.
+
+Cada iteración se verifica: ninguna ventana falló, cada moneda tiene exactamente un registro por
+día hábil de la serie y los valores coinciden con los del simulador. Informa peticiones,
+reintentos, latencia y filas/segundo por iteración, escribe los resultados en JSON como
+run_benchmarks.py y termina con código 1 si alguna verificación falla o, con --baseline, si el
+rendimiento cayó más que --threshold.
+
+Uso:
+    python benchmarks/bcra_soak_test.py --years 24 --iterations 3 --error-5xx 0.05 --max-limit 500
+    python benchmarks/bcra_soak_test.py --duration 600 --latency-ms 80 --jitter-ms 120 --max-rps 30
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from benchmark_utils import StageRecorder, add_pipeline_to_path, compare_with_baseline
+from fake_bcra_server import ENDPOINT, add_settings_arguments, business_days, quote_for, settings_from_args, start_fake_bcra_server
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+def point_pipeline_to_simulator(base_url, args):
+    """
+    Apunta bcra_api_pipeline al simulador. Debe llamarse antes de importarlo: lee las variables
+    de entorno al importarse y load_dotenv no pisa las que ya están definidas.
+    """
+    os.environ["BCRA_API_BASE_URL"] = base_url
+    os.environ["BCRA_API_ENDPOINT_EVOLUCION_MONEDA"] = ENDPOINT
+    os.environ["BCRA_API_COD_MONEDAS"] = ",".join(args.currencies)
+    # Cada iteración mide peticiones reales: sin caché de respuestas ni estado del planificador en disco
+    os.environ["BCRA_CACHE_ENABLED"] = "false"
+    os.environ["BCRA_PLANNER_STATE_PATH"] = ""
+    # Con fallas inyectadas hacen falta más reintentos que en producción, y esperas más cortas
+    # para que la prueba no dure lo que el backoff real
+    os.environ.setdefault("BCRA_FETCH_MAX_RETRIES", "8")
+    os.environ.setdefault("BCRA_FETCH_BACKOFF_BASE", "0.1")
+    os.environ.setdefault("BCRA_FETCH_BACKOFF_MAX", "5")
+
+def verify_history(df, currencies, start_date, end_date):
+    """
+    Verifica que el DataFrame tenga, por moneda, un registro por día hábil del rango y con el
+    valor del simulador. Retorna la lista de problemas encontrados.
+    """
+    problems = []
+    expected_days = sorted(business_days(start_date, end_date))
+    for currency in currencies:
+        rows = df[df['moneda'] == currency]
+        fechas = pd.to_datetime(rows['fecha']).dt.date.tolist()
+        if fechas != expected_days:
+            problems.append(f"{currency}: {len(fechas)} registros, se esperaban {len(expected_days)}")
+            continue
+        expected_quotes = np.array([quote_for(day, currency) for day in fechas])
+        if not np.allclose(rows['tipo_cambio'].to_numpy(dtype=np.float64), expected_quotes):
+            problems.append(f"{currency}: tipo_cambio distinto al del simulador")
+    return problems
+
+def run_iteration(bcra_api_pipeline, planner, currencies, start_date, end_date):
+    """
+    Descarga y combina el historial completo como run_bcra_pipeline, sin cargarlo.
+    Retorna (DataFrame con todas las ventanas, ventanas fallidas, estadísticas del cliente).
+    """
+    business_days_count = sum(1 for _ in business_days(start_date, end_date))
+    missing_ranges = {currency: [(start_date, end_date, business_days_count)] for currency in currencies}
+    client = bcra_api_pipeline.BCRAClient(headers=bcra_api_pipeline.BCRA_API_HEADERS)
+    try:
+        blocks, window_ranges, block_requests = bcra_api_pipeline.plan_fetch_windows(planner, missing_ranges)
+        block_frames = bcra_api_pipeline.fetch_windows(client, blocks, block_requests)
+        frames, failed_windows = [], 0
+        for (start_date_str, end_date_str), ranges, block_frame in zip(blocks, window_ranges, block_frames):
+            start_by_moneda = {moneda: range_start for moneda, (range_start, _) in ranges.items()}
+            df_block = bcra_api_pipeline.combine_block_frames(block_frame, start_by_moneda, start_date_str, end_date_str)
+            if df_block is None:
+                failed_windows += 1
+            else:
+                frames.append(df_block)
+        planner.observe(client.stats.page_rows, client.stats.page_days, client.stats.page_seconds)
+        client.report()
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['fecha', 'moneda', 'tipo_cambio'])
+        return df, failed_windows, client.stats.as_dict()
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prueba de carga y resistencia de la descarga del BCRA contra el simulador local.")
+    parser.add_argument("--years", type=int, default=24, help="Años de historia a descargar por iteración.")
+    parser.add_argument("--currencies", type=lambda value: [c.strip() for c in value.split(",") if c.strip()],
+                        default=["USD", "EUR"], help="Monedas separadas por coma.")
+    parser.add_argument("--iterations", type=int, default=3, help="Iteraciones mínimas.")
+    parser.add_argument("--duration", type=float, default=0, help="Seguir iterando hasta cumplir estos segundos (soak).")
+    parser.add_argument("--output", default=None, help="Archivo JSON de resultados (por defecto benchmarks/results/bcra_soak_<fecha>.json).")
+    parser.add_argument("--baseline", default=None, help="JSON de una corrida anterior contra el cual detectar regresiones.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Caída de rendimiento tolerada frente al baseline (0.2 = 20%%).")
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    end_date = date.today()
+    start_date = max(args.history_start, end_date - timedelta(days=365 * args.years))
+    server, base_url = start_fake_bcra_server(settings=settings_from_args(args))
+    point_pipeline_to_simulator(base_url, args)
+    add_pipeline_to_path('exercise2_bcra_api')
+    import bcra_api_pipeline
+    from bcra_planner import WindowPlanner
+
+    print(
+        f"Simulador en {base_url}: {args.years} años de {', '.join(args.currencies)}, página máxima {args.max_limit}, "
+        f"latencia {args.latency_ms:g}+{args.jitter_ms:g} ms, tope {args.max_rps:g}/s, "
+        f"fallas 429 {args.error_429:.0%}, 5xx {args.error_5xx:.0%}, cortes {args.drop_rate:.0%}."
+    )
+    # Sin tracemalloc: su costo por asignación distorsionaría las latencias medidas
+    recorder = StageRecorder(trace_memory=False)
+    planner = WindowPlanner(bcra_api_pipeline.BCRA_API_PAGE_LIMIT)
+    soak_start = time.perf_counter()
+    iteration = 0
+    try:
+        while iteration < args.iterations or time.perf_counter() - soak_start < args.duration:
+            iteration += 1
+            counts_before = dict(server.state.counts)
+            with recorder.stage("bcra_soak", f"iteration_{iteration}") as metrics:
+                df, failed_windows, stats = run_iteration(bcra_api_pipeline, planner, args.currencies, start_date, end_date)
+                metrics["rows"] = len(df)
+            # La verificación no suma al tiempo de la iteración
+            problems = verify_history(df, args.currencies, start_date, end_date)
+            if failed_windows:
+                problems.append(f"{failed_windows} ventanas fallaron después de los reintentos")
+            for problem in problems:
+                print(f"ERROR: {problem}")
+            recorder.verify_last(
+                len(df), ok=not problems, failed_windows=failed_windows, http_requests=stats["requests"],
+                retries=stats["retries"], p95_ms=stats["p95_ms"], window_days=planner.window_days(),
+                window_months=planner.window_months(),
+                server={key: value - counts_before[key] for key, value in server.state.counts.items()},
+            )
+    finally:
+        server.shutdown()
+
+    print(f"\nRespuestas del simulador: {server.state.counts}")
+    output_path = args.output or os.path.join(RESULTS_DIR, f"bcra_soak_{datetime.now():%Y%m%d_%H%M%S}.json")
+    recorder.write_results(output_path, {**vars(args), "history_start": args.history_start.isoformat()})
+
+    failed_stages = [r["stage"] for r in recorder.results if not r["ok"]]
+    if failed_stages:
+        print(f"Iteraciones con errores o resultados no verificados: {', '.join(failed_stages)}")
+    regressions = compare_with_baseline(recorder.results, args.baseline, args.threshold) if args.baseline else []
+    for regression in regressions:
+        print(f"REGRESIÓN: {regression}")
+    sys.exit(1 if failed_stages or regressions else 0)
@@ -0,0 +1,173 @@
+"""
+Utilidades de medición para la suite de benchmarks.
+
+StageRecorder mide cada etapa de un pipeline (tiempo de pared, filas, filas/segundo, pico de
+memoria y round-trips a la base de datos) y acumula los resultados para escribirlos en JSON.
+"""
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+def add_pipeline_to_path(exercise_dir):
+    """Agrega el src/ de un ejercicio al sys.path para importar sus módulos como lo hacen sus scripts."""
+    src_dir = os.path.join(REPO_ROOT, exercise_dir, 'src')
+    if src_dir not in sys.path:
+        sys.path.insert(0, src_dir)
+
+def get_max_rss_mb():
+    """Máximo de memoria residente del proceso hasta ahora, en MB (ru_maxrss está en KB en Linux)."""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(max_rss / divisor, 1)
+
+def get_git_commit():
+    """Commit actual del repositorio, para poder comparar resultados entre versiones."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+class RoundTripCounter:
+    """
+    Cuenta las sentencias enviadas a PostgreSQL por cualquier Engine de SQLAlchemy del proceso
+    (before_cursor_execute) más los flujos COPY registrados con count(). Es thread-safe porque
+    los pipelines ejecutan tablas en paralelo. Los procesos hijos (copia particionada) no se cuentan.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+        event.listen(Engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count()
+
+    def count(self, round_trips=1):
+        with self._lock:
+            self.value += round_trips
+
+    def wrap(self, module, function_name):
+        """Reemplaza module.function_name por una versión que cuenta un round-trip por llamada."""
+        function = getattr(module, function_name)
+
+        def counted(*args, **kwargs):
+            self.count()
+            return function(*args, **kwargs)
+
+        setattr(module, function_name, counted)
+
+class StageRecorder:
+    """Mide etapas y acumula sus resultados."""
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.round_trips = RoundTripCounter()
+        self.results = []
+
+    @contextmanager
+    def stage(self, pipeline, stage_name):
+        """
+        Mide el bloque como una etapa. El bloque recibe un dict donde puede informar 'rows'
+        (filas procesadas), 'ok' (si el resultado se verificó) y otras métricas propias.
+        """
+        metrics = {"rows": 0, "ok": True}
+        round_trips_before = self.round_trips.value
+        if self.trace_memory:
+            tracemalloc.start()
+        print(f"\n=== [{pipeline}] {stage_name} ===")
+        start_time = time.perf_counter()
+        try:
+            yield metrics
+        except Exception as e:
+            metrics["ok"] = False
+            metrics["error"] = str(e)
+            print(f"ERROR en la etapa {pipeline}/{stage_name}: {e}")
+        finally:
+            elapsed = time.perf_counter() - start_time
+            peak_memory = None
+            if self.trace_memory:
+                peak_memory = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+                tracemalloc.stop()
+            result = {
+                "pipeline": pipeline,
+                "stage": stage_name,
+                "wall_time_s": round(elapsed, 3),
+                "rows_per_s": round(metrics["rows"] / elapsed, 1) if elapsed > 0 else None,
+                "tracemalloc_peak_mb": peak_memory,
+                "max_rss_mb": get_max_rss_mb(),
+                "db_round_trips": self.round_trips.value - round_trips_before,
+                **metrics,
+            }
+            self.results.append(result)
+            # Sin tracemalloc no hay pico de memoria que informar
+            memory = f", pico {peak_memory} MB" if self.trace_memory else ""
+            print(
+                f"=== [{pipeline}] {stage_name}: {result['rows']} filas en {elapsed:.2f}s "
+                f"({result['rows_per_s']} filas/s), {result['db_round_trips']} round-trips{memory} ==="
+            )
+
+    def verify_last(self, rows, ok=True, **extra):
+        """
+        Completa la última etapa con las filas verificadas después de medirla, para que las
+        consultas de verificación no sumen al tiempo ni a los round-trips de la etapa.
+        """
+        result = self.results[-1]
+        result.update(rows=rows, ok=result["ok"] and ok, **extra)
+        result["rows_per_s"] = round(rows / result["wall_time_s"], 1) if result["wall_time_s"] > 0 else None
+        print(f"    Verificado: {rows} filas ({result['rows_per_s']} filas/s), ok={result['ok']}.")
+
+    def write_results(self, output_path, config):
+        """Escribe los resultados de todas las etapas en un archivo JSON."""
+        report = {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git_commit": get_git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": config,
+            "stages": self.results,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"\nResultados escritos en '{output_path}'.")
+        return report
+
+def compare_with_baseline(results, baseline_path, threshold):
+    """
+    Compara filas/segundo y tiempo de cada etapa contra un JSON de referencia. Retorna la lista
+    de regresiones: etapas cuyo rendimiento cayó más de 'threshold' (0.2 = 20%).
+    """
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(stage["pipeline"], stage["stage"]): stage for stage in json.load(f)["stages"]}
+
+    regressions = []
+    for stage in results:
+        previous = baseline.get((stage["pipeline"], stage["stage"]))
+        if not previous or not stage["ok"] or not previous.get("ok", True):
+            continue
+        if stage["rows"] and previous.get("rows_per_s"):
+            metric, current_value, previous_value = "rows_per_s", stage["rows_per_s"], previous["rows_per_s"]
+            regressed = current_value < previous_value * (1 - threshold)
+        else:
+            metric, current_value, previous_value = "wall_time_s", stage["wall_time_s"], previous["wall_time_s"]
+            regressed = current_value > previous_value * (1 + threshold)
+        if regressed:
+            regressions.append(
+                f"{stage['pipeline']}/{stage['stage']}: {metric} {previous_value} -> {current_value}"
+            )
+    return regressions
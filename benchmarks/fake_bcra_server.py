@@ -0,0 +1,319 @@
+"""
+Simulador local de la API de cotizaciones del BCRA, para medir y ajustar bcra_api_pipeline.py
+(concurrencia, paginación, reintentos) sin red y sin cargar la API real.
+
+Implementa el endpoint de evolución de una moneda (/estadisticascambiarias/v1.0/Cotizaciones/{moneda},
+con fechadesde, fechahasta, limit y offset) y el de todas las monedas de una fecha
+(/estadisticascambiarias/v1.0/Cotizaciones?fecha=). Responde con el mismo formato JSON que la API
+real (metadata.resultset y results[].detalle[]) sobre una serie determinística de días hábiles que
+va desde --history-start (2002-01-01) hasta hoy. El endpoint por fecha, como el real, responde un
+día sin cotización con el día hábil anterior.
+
+Para reproducir el comportamiento de la API real bajo carga se puede configurar:
+- Latencia por respuesta (--latency-ms, más un jitter aleatorio de hasta --jitter-ms).
+- Tope de peticiones por segundo (--max-rps): las que lo superan reciben 429 con Retry-After.
+- Tope de peticiones simultáneas (--max-in-flight): las que lo superan reciben 503.
+- Fallas inyectadas al azar: 429 (--error-429), 5xx (--error-5xx) y conexiones cortadas sin
+  respuesta (--drop-rate), como fracción de las peticiones.
+- Tamaño máximo de página (--max-limit): un 'limit' mayor se recorta, y metadata.resultset.limit
+  informa el aplicado, o se rechaza con 400 (--reject-oversized-limit).
+
+Se usa desde los benchmarks con start_fake_bcra_server(), o como servidor independiente al que se
+apunta el pipeline con BCRA_API_BASE_URL:
+
+    python benchmarks/fake_bcra_server.py --port 8080 --latency-ms 80 --max-rps 20 --error-5xx 0.02
+    BCRA_API_BASE_URL=http://127.0.0.1:8080 BCRA_API_ENDPOINT_EVOLUCION_MONEDA=/estadisticascambiarias/v1.0/Cotizaciones python exercise2_bcra_api/src/bcra_api_pipeline.py
+"""
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ENDPOINT = "/estadisticascambiarias/v1.0/Cotizaciones"
+MAX_LIMIT = 1000
+CURRENCIES = ("USD", "EUR", "BRL", "GBP", "JPY", "CHF", "CNY", "UYU", "CLP", "PYG")
+HISTORY_START_DATE = date(2002, 1, 1)
+
+def business_days(start_date, end_date):
+    """Días hábiles (lunes a viernes) entre dos fechas, de la más reciente a la más antigua como la API."""
+    current = end_date
+    while current >= start_date:
+        if current.weekday() < 5:
+            yield current
+        current -= timedelta(days=1)
+
+def quote_for(day, currency):
+    """Cotización determinística para un día: crece suavemente con el tiempo y varía por moneda."""
+    days = (day - date(2002, 1, 1)).days
+    return round(1 + days * 0.15 + (sum(map(ord, currency)) % 7) * 0.01, 4)
+
+def build_evolution_page(currency, start_date, end_date, limit=MAX_LIMIT, offset=0):
+    """Respuesta del endpoint de evolución (metadata.resultset y results[].detalle[]) para una página."""
+    days = list(business_days(start_date, end_date))
+    return {
+        "status": 200,
+        "metadata": {"resultset": {"count": len(days), "offset": offset, "limit": limit}},
+        "results": [
+            {
+                "fecha": day.isoformat(),
+                "detalle": [{
+                    "codigoMoneda": currency,
+                    "descripcion": f"MONEDA {currency}",
+                    "tipoPase": 1.0,
+                    "tipoCotizacion": quote_for(day, currency),
+                }],
+            }
+            for day in days[offset:offset + limit]
+        ],
+    }
+
+class SimulatorSettings:
+    """Comportamiento configurable del simulador (latencia, topes y fallas inyectadas)."""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, max_rps=0.0, max_in_flight=0, error_429=0.0,
+                 error_5xx=0.0, drop_rate=0.0, max_limit=MAX_LIMIT, reject_oversized_limit=False,
+                 history_start=HISTORY_START_DATE, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.max_rps = max_rps
+        self.max_in_flight = max_in_flight
+        self.error_429 = error_429
+        self.error_5xx = error_5xx
+        self.drop_rate = drop_rate
+        self.max_limit = max_limit
+        self.reject_oversized_limit = reject_oversized_limit
+        self.history_start = history_start
+        self.seed = seed
+
+class SimulatorState:
+    """
+    Estado compartido por los hilos del servidor: el token bucket del tope de peticiones por
+    segundo, las peticiones en curso, el generador de fallas (con semilla, reproducible) y los
+    contadores de respuestas.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.random = random.Random(settings.seed)
+        self.capacity = max(1.0, settings.max_rps)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.in_flight = 0
+        self.counts = {"requests": 0, "ok": 0, "rate_limited": 0, "busy": 0, "injected_429": 0,
+                       "injected_5xx": 0, "dropped": 0, "bad_request": 0}
+        self._lock = threading.Lock()
+
+    def count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def count_request(self, server):
+        """Cuenta una petición recibida en counts y en server.request_count, bajo el mismo lock."""
+        with self._lock:
+            self.counts["requests"] += 1
+            server.request_count += 1
+
+    def take_token(self):
+        """Toma un token del tope por segundo; si no hay, retorna los segundos hasta el próximo."""
+        if self.settings.max_rps <= 0:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.settings.max_rps)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return None
+            return (1 - self.tokens) / self.settings.max_rps
+
+    def enter(self):
+        """Registra una petición en curso; retorna False si se superó --max-in-flight."""
+        with self._lock:
+            if self.settings.max_in_flight and self.in_flight >= self.settings.max_in_flight:
+                return False
+            self.in_flight += 1
+            return True
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def draw_fault(self):
+        """Falla inyectada para esta petición ('drop', 429, 5xx) o None."""
+        with self._lock:
+            draw = self.random.random()
+            status_5xx = self.random.choice((500, 502, 503, 504))
+            jitter = self.random.uniform(0, self.settings.jitter_ms)
+        settings = self.settings
+        if draw < settings.drop_rate:
+            return "drop", jitter
+        if draw < settings.drop_rate + settings.error_429:
+            return 429, jitter
+        if draw < settings.drop_rate + settings.error_429 + settings.error_5xx:
+            return status_5xx, jitter
+        return None, jitter
+
+class FakeBCRAHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 para que los clientes reutilicen la conexión keep-alive, como con la API real
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        state = self.server.state
+        state.count_request(self.server)
+        if not state.enter():
+            state.count("busy")
+            self.send_json(503, {"status": 503, "errorMessages": ["Servicio saturado"]})
+            return
+        try:
+            fault, jitter_ms = state.draw_fault()
+            time.sleep((state.settings.latency_ms + jitter_ms) / 1000)
+            retry_after = state.take_token()
+            if retry_after is not None:
+                state.count("rate_limited")
+                self.send_json(429, {"status": 429, "errorMessages": ["Demasiadas peticiones"]},
+                               {"Retry-After": f"{retry_after:.2f}"})
+            elif fault == "drop":
+                # Conexión cortada sin respuesta, como un reset de la red
+                state.count("dropped")
+                self.close_connection = True
+                self.connection.shutdown(socket.SHUT_RDWR)
+            elif fault is not None:
+                state.count("injected_429" if fault == 429 else "injected_5xx")
+                self.send_json(fault, {"status": fault, "errorMessages": ["Falla inyectada por el simulador"]})
+            else:
+                self.route(urlparse(self.path))
+        finally:
+            state.leave()
+
+    def route(self, url):
+        if url.path == ENDPOINT:
+            self.send_quotes_by_date(parse_qs(url.query))
+        elif url.path.startswith(ENDPOINT + "/"):
+            self.send_evolution(url.path.rsplit("/", 1)[-1], parse_qs(url.query))
+        else:
+            self.send_json(404, {"status": 404, "errorMessages": ["Recurso no encontrado"]})
+
+    def send_evolution(self, currency, params):
+        """Una página de la evolución de una moneda, recortada a la serie simulada."""
+        settings = self.server.state.settings
+        try:
+            start_date = date.fromisoformat(params["fechadesde"][0])
+            end_date = date.fromisoformat(params["fechahasta"][0])
+            limit = int(params.get("limit", [settings.max_limit])[0])
+            offset = int(params.get("offset", [0])[0])
+        except (KeyError, ValueError) as e:
+            self.send_bad_request(f"Parámetros inválidos: {e}")
+            return
+        if limit > settings.max_limit:
+            if settings.reject_oversized_limit:
+                self.send_bad_request(f"El parámetro limit no puede superar {settings.max_limit}")
+                return
+            limit = settings.max_limit
+
+        self.server.state.count("ok")
+        start_date = max(start_date, settings.history_start)
+        end_date = min(end_date, date.today())
+        self.send_json(200, build_evolution_page(currency, start_date, end_date, limit, offset))
+
+    def send_quotes_by_date(self, params):
+        """Todas las monedas de una fecha (o del día hábil anterior)."""
+        try:
+            day = date.fromisoformat(params["fecha"][0])
+        except (KeyError, ValueError) as e:
+            self.send_bad_request(f"Parámetros inválidos: {e}")
+            return
+        self.server.state.count("ok")
+        day = next(business_days(day - timedelta(days=6), day))
+        if day < self.server.state.settings.history_start:
+            self.send_json(200, {"status": 200, "results": []})
+            return
+        self.send_json(200, {
+            "status": 200,
+            "results": {
+                "fecha": day.isoformat(),
+                "detalle": [
+                    {
+                        "codigoMoneda": currency,
+                        "descripcion": f"MONEDA {currency}",
+                        "tipoPase": 1.0,
+                        "tipoCotizacion": quote_for(day, currency),
+                    }
+                    for currency in CURRENCIES
+                ],
+            },
+        })
+
+    def send_bad_request(self, message):
+        self.server.state.count("bad_request")
+        self.send_json(400, {"status": 400, "errorMessages": [message]})
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Sin log por petición: ensuciaría la salida del benchmark
+        pass
+
+def start_fake_bcra_server(host="127.0.0.1", port=0, settings=None):
+    """
+    Levanta el simulador en un hilo de fondo. settings: SimulatorSettings (por defecto sin
+    latencia, sin topes ni fallas). Retorna (servidor, url_base); server.state.counts tiene los
+    contadores de respuestas.
+    """
+    server = ThreadingHTTPServer((host, port), FakeBCRAHandler)
+    server.daemon_threads = True
+    server.request_count = 0
+    server.state = SimulatorState(settings or SimulatorSettings())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+def add_settings_arguments(parser):
+    """Argumentos de línea de comandos del simulador (compartidos con bcra_soak_test.py)."""
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Latencia fija por respuesta, en milisegundos.")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Latencia aleatoria adicional, de 0 a este valor.")
+    parser.add_argument("--max-rps", type=float, default=0.0, help="Tope de peticiones por segundo (0 = sin tope); las demás reciben 429.")
+    parser.add_argument("--max-in-flight", type=int, default=0, help="Tope de peticiones simultáneas (0 = sin tope); las demás reciben 503.")
+    parser.add_argument("--error-429", type=float, default=0.0, help="Fracción de peticiones que reciben un 429 inyectado.")
+    parser.add_argument("--error-5xx", type=float, default=0.0, help="Fracción de peticiones que reciben un 5xx inyectado.")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Fracción de peticiones cuya conexión se corta sin respuesta.")
+    parser.add_argument("--max-limit", type=int, default=MAX_LIMIT, help="Máximo 'limit' por página.")
+    parser.add_argument("--reject-oversized-limit", action="store_true", help="Rechazar con 400 un 'limit' mayor a --max-limit en lugar de recortarlo.")
+    parser.add_argument("--history-start", type=date.fromisoformat, default=HISTORY_START_DATE, help="Primer día de la serie simulada.")
+    parser.add_argument("--seed", type=int, default=None, help="Semilla de las fallas y el jitter, para repetir una corrida.")
+
+def settings_from_args(args):
+    return SimulatorSettings(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, max_rps=args.max_rps, max_in_flight=args.max_in_flight,
+        error_429=args.error_429, error_5xx=args.error_5xx, drop_rate=args.drop_rate, max_limit=args.max_limit,
+        reject_oversized_limit=args.reject_oversized_limit, history_start=args.history_start, seed=args.seed,
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulador local de la API de cotizaciones del BCRA.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    server, base_url = start_fake_bcra_server(args.host, args.port, settings_from_args(args))
+    print(f"Simulador de la API del BCRA escuchando en {base_url}. Para apuntar el pipeline:")
+    print(f"  BCRA_API_BASE_URL={base_url} BCRA_API_ENDPOINT_EVOLUCION_MONEDA={ENDPOINT}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    server.shutdown()
+    print(f"\nRespuestas: {server.state.counts}")
@@ -0,0 +1,260 @@
+"""
+Suite de benchmarks de punta a punta de los tres pipelines contra réplicas locales:
+
+- replication: replicate_data (carga completa, incremental sin cambios, incremental con cambios
+  y verificación por checksums) entre dos bases de un PostgreSQL local, con datos de
+  generate_synthetic_data.py.
+- bcra: run_bcra_pipeline contra un servidor HTTP local que imita la API del BCRA.
+- scraping: el parseo (parse_listing_page) y la carga (load_propiedades) del pipeline de
+  scraping sobre páginas de Zonaprop guardadas o sintéticas.
+
+Por etapa informa tiempo de pared, filas/segundo, pico de memoria y round-trips a la base,
+y escribe todo en un JSON. Con --baseline compara contra una corrida anterior y termina con
+código 1 si alguna etapa empeoró más que --threshold.
+
+Uso:
+    python benchmarks/run_benchmarks.py --scale-factor 0.1 --bcra-days 3650 --scraping-ads 2000
+"""
+import argparse
+import os
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+import psycopg2
+import psycopg2.errors
+
+from benchmark_utils import StageRecorder, add_pipeline_to_path, compare_with_baseline
+from fake_bcra_server import ENDPOINT, start_fake_bcra_server
+from zonaprop_fixtures import ADS_PER_PAGE, generate_listing_pages, load_saved_pages
+
+# PostgreSQL local para los benchmarks. Se usan dos bases: una de origen y otra como "nube".
+BENCH_DB_HOST = os.getenv("BENCH_DB_HOST", "localhost")
+BENCH_DB_PORT = os.getenv("BENCH_DB_PORT", "5432")
+BENCH_DB_USER = os.getenv("BENCH_DB_USER", "postgres")
+BENCH_DB_PASSWORD = os.getenv("BENCH_DB_PASSWORD", "postgres")
+BENCH_ORIGIN_DB = os.getenv("BENCH_ORIGIN_DB", "bench_origin")
+BENCH_CLOUD_DB = os.getenv("BENCH_CLOUD_DB", "bench_cloud")
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+REPLICATED_TABLES = ["dim_date", "dim_customer_segment", "dim_product", "fact_sales"]
+
+def point_pipelines_to_local_databases():
+    """
+    Redirige las credenciales de los pipelines a las bases locales. Debe llamarse antes de
+    importar cualquier pipeline: leen las variables de entorno al importarse y load_dotenv
+    no pisa las que ya están definidas.
+    """
+    for prefix, db_name in (("DB_ORIGIN", BENCH_ORIGIN_DB), ("DB_CLOUD", BENCH_CLOUD_DB)):
+        os.environ[f"{prefix}_HOST"] = BENCH_DB_HOST
+        os.environ[f"{prefix}_PORT"] = BENCH_DB_PORT
+        os.environ[f"{prefix}_USER"] = BENCH_DB_USER
+        os.environ[f"{prefix}_PASSWORD"] = BENCH_DB_PASSWORD
+        os.environ[f"{prefix}_NAME"] = db_name
+    # Los benchmarks comparan contra su propio baseline: no se registran las corridas en pipeline_runs
+    os.environ.setdefault("RUN_LEDGER_ENABLED", "false")
+    # Tampoco se usa la caché de respuestas del BCRA ni lo observado por el planificador de
+    # ventanas en corridas anteriores: cada corrida mide las peticiones reales con el mismo plan
+    os.environ.setdefault("BCRA_CACHE_ENABLED", "false")
+    os.environ.setdefault("BCRA_PLANNER_STATE_PATH", "")
+
+def connect(db_name):
+    """
+    Conexión psycopg2 directa para preparar y verificar los datos. No pasa por SQLAlchemy,
+    así que no suma a los round-trips medidos.
+    """
+    conn = psycopg2.connect(
+        host=BENCH_DB_HOST, port=BENCH_DB_PORT, user=BENCH_DB_USER, password=BENCH_DB_PASSWORD, database=db_name
+    )
+    conn.autocommit = True
+    return conn
+
+def run_sql(db_name, statement, params=None, fetch=False):
+    """Ejecuta una sentencia en una base local; con fetch=True retorna la primera columna de la primera fila."""
+    conn = connect(db_name)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(statement, params)
+            return cur.fetchone()[0] if fetch else cur.rowcount
+    finally:
+        conn.close()
+
+def ensure_database(db_name):
+    """Crea la base local si no existe."""
+    if not run_sql("postgres", "SELECT COUNT(*) FROM pg_database WHERE datname = %s", [db_name], fetch=True):
+        run_sql("postgres", f'CREATE DATABASE "{db_name}"')
+        print(f"Base de datos local '{db_name}' creada.")
+
+def count_table_rows(db_name, tables):
+    """Filas por tabla en una base local (-1 si la tabla no existe)."""
+    counts = {}
+    for table_name in tables:
+        try:
+            counts[table_name] = run_sql(db_name, f'SELECT COUNT(*) FROM "{table_name}"', fetch=True)
+        except psycopg2.errors.UndefinedTable:
+            counts[table_name] = -1
+    return counts
+
+def drop_tables(db_name, tables):
+    """Borra tablas de una base local (en el orden dado; CASCADE por las FKs)."""
+    for table_name in tables:
+        run_sql(db_name, f'DROP TABLE IF EXISTS "{table_name}" CASCADE')
+
+# --- Replicación ---
+def benchmark_replication(recorder, args):
+    add_pipeline_to_path('exercise1_replication')
+    from generate_synthetic_data import FACT_ROWS_PER_SCALE_FACTOR, generate_synthetic_data
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="bench_synthetic_")
+    fact_rows = max(1, round(args.scale_factor * FACT_ROWS_PER_SCALE_FACTOR))
+    if not args.data_dir:
+        with recorder.stage("replication", "generate_data") as metrics:
+            generate_synthetic_data(args.scale_factor, seed=args.seed, output_dir=data_dir)
+            metrics["rows"] = fact_rows
+
+    # load_origin_data lee ORIGIN_DATA_DIR al importarse
+    os.environ["ORIGIN_DATA_DIR"] = data_dir
+    import create_origin_db
+    import load_origin_data
+    import replication_pipeline
+    recorder.round_trips.wrap(replication_pipeline, "copy_dataframe_to_table")
+
+    drop_tables(BENCH_ORIGIN_DB, reversed(REPLICATED_TABLES))
+    drop_tables(BENCH_CLOUD_DB, list(reversed(REPLICATED_TABLES)) + ["replication_state"])
+    create_origin_db.create_tables()
+    with recorder.stage("replication", "load_origin"):
+        load_origin_data.load_data_to_origin_db()
+    origin_counts = count_table_rows(BENCH_ORIGIN_DB, REPLICATED_TABLES)
+    recorder.verify_last(sum(origin_counts.values()), ok=min(origin_counts.values()) > 0, table_rows=origin_counts)
+
+    replicate_kwargs = {"partitions": args.partitions, "shadow": args.shadow, "pushdown": args.pushdown}
+    with recorder.stage("replication", "full_reload"):
+        replication_pipeline.replicate_data(full_reload=True, **replicate_kwargs)
+    cloud_counts = count_table_rows(BENCH_CLOUD_DB, REPLICATED_TABLES)
+    recorder.verify_last(sum(cloud_counts.values()), ok=cloud_counts == origin_counts, table_rows=cloud_counts)
+
+    with recorder.stage("replication", "incremental_noop"):
+        replication_pipeline.replicate_data(**replicate_kwargs)
+
+    changed_rows = run_sql(
+        BENCH_ORIGIN_DB,
+        'UPDATE fact_sales SET "QuantitySold" = "QuantitySold" + 1, '
+        '"MontoTotal" = "Price_PerUnit" * ("QuantitySold" + 1) WHERE random() < %s',
+        [args.change_fraction]
+    )
+    with recorder.stage("replication", "incremental_changes"):
+        replication_pipeline.replicate_data(**replicate_kwargs)
+    changed_in_cloud = run_sql(
+        BENCH_CLOUD_DB, 'SELECT SUM("QuantitySold") FROM fact_sales', fetch=True
+    ) == run_sql(BENCH_ORIGIN_DB, 'SELECT SUM("QuantitySold") FROM fact_sales', fetch=True)
+    recorder.verify_last(changed_rows, ok=changed_in_cloud)
+
+    with recorder.stage("replication", "checksum_verify"):
+        replication_pipeline.replicate_data(checksum=True)
+    recorder.verify_last(sum(origin_counts.values()))
+
+# --- API del BCRA ---
+def benchmark_bcra(recorder, args):
+    server, base_url = start_fake_bcra_server()
+    # bcra_api_pipeline lee la URL de la API al importarse
+    os.environ["BCRA_API_BASE_URL"] = base_url
+    os.environ["BCRA_API_ENDPOINT_EVOLUCION_MONEDA"] = ENDPOINT
+    os.environ["BCRA_API_COD_MONEDA"] = "USD"
+    os.environ["BCRA_API_COD_MONEDAS"] = "USD"
+    # La serie arranca hace --bcra-days días, así el pipeline solo busca huecos en ese rango (si no, iría hasta 2002)
+    os.environ["BCRA_HISTORY_START_DATE"] = (date.today() - timedelta(days=args.bcra_days)).isoformat()
+    add_pipeline_to_path('exercise2_bcra_api')
+    import bcra_api_pipeline
+
+    try:
+        drop_tables(BENCH_CLOUD_DB, ["cotizaciones", "cotizaciones_sin_datos"])
+
+        for stage_name in ("history", "incremental_noop"):
+            rows_before = count_table_rows(BENCH_CLOUD_DB, ["cotizaciones"])["cotizaciones"]
+            requests_before = server.request_count
+            with recorder.stage("bcra", stage_name):
+                bcra_api_pipeline.run_bcra_pipeline()
+            rows_loaded = count_table_rows(BENCH_CLOUD_DB, ["cotizaciones"])["cotizaciones"] - rows_before
+            recorder.verify_last(rows_loaded, http_requests=server.request_count - requests_before)
+    finally:
+        server.shutdown()
+
+# --- Web scraping ---
+def benchmark_scraping(recorder, args):
+    add_pipeline_to_path('exercise3_web_scraping')
+    import web_scraping_pipeline
+
+    total_pages = -(-args.scraping_ads // ADS_PER_PAGE)
+    if args.scraping_html_dir:
+        pages = load_saved_pages(args.scraping_html_dir, total_pages)
+    else:
+        pages = generate_listing_pages(args.scraping_ads, seed=args.seed)
+
+    ads = []
+    with recorder.stage("scraping", "parse") as metrics:
+        for page_num, page_source in enumerate(pages, start=1):
+            ads.extend(web_scraping_pipeline.parse_listing_page(page_source, page_num) or [])
+        metrics["rows"] = len(ads)
+        metrics["pages"] = len(pages)
+
+    drop_tables(BENCH_CLOUD_DB, ["propiedades_posadas"])
+    cloud_engine = web_scraping_pipeline.get_cloud_db_engine()
+    try:
+        web_scraping_pipeline.create_propiedades_table(cloud_engine)
+        with recorder.stage("scraping", "load") as metrics:
+            metrics["rows"] = web_scraping_pipeline.load_propiedades(pd.DataFrame(ads), cloud_engine)
+    finally:
+        cloud_engine.dispose()
+
+BENCHMARKS = {
+    "replication": benchmark_replication,
+    "bcra": benchmark_bcra,
+    "scraping": benchmark_scraping,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks de punta a punta de los pipelines contra réplicas locales.")
+    parser.add_argument(
+        "--pipelines",
+        nargs="+",
+        choices=list(BENCHMARKS),
+        default=list(BENCHMARKS),
+        help="Pipelines a medir (por defecto todos)."
+    )
+    parser.add_argument("--scale-factor", type=float, default=0.01, help="Escala de los datos sintéticos de replicación (1 = 1.000.000 de ventas).")
+    parser.add_argument("--data-dir", default=None, help="Usar CSV ya generados en este directorio en lugar de generarlos.")
+    parser.add_argument("--seed", type=int, default=42, help="Semilla de los datos sintéticos.")
+    parser.add_argument("--partitions", type=int, default=1, help="Particiones de la copia de tablas grandes (los procesos hijos no cuentan round-trips).")
+    parser.add_argument("--shadow", action="store_true", help="Medir la carga completa en sombra.")
+    parser.add_argument("--pushdown", action="store_true", help="Medir la replicación con el transform resuelto en el origen (COPY a COPY).")
+    parser.add_argument("--change-fraction", type=float, default=0.01, help="Fracción de ventas modificadas antes de la corrida incremental.")
+    parser.add_argument("--bcra-days", type=int, default=3650, help="Días de historia a pedir a la API simulada del BCRA.")
+    parser.add_argument("--scraping-ads", type=int, default=2000, help="Anuncios a parsear y cargar.")
+    parser.add_argument("--scraping-html-dir", default=None, help="Directorio con páginas de Zonaprop guardadas (*.html).")
+    parser.add_argument("--no-tracemalloc", action="store_true", help="No medir el pico de memoria con tracemalloc (más rápido).")
+    parser.add_argument("--output", default=None, help="Archivo JSON de resultados (por defecto benchmarks/results/benchmark_<fecha>.json).")
+    parser.add_argument("--baseline", default=None, help="JSON de una corrida anterior contra el cual detectar regresiones.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Caída de rendimiento tolerada frente al baseline (0.2 = 20%%).")
+    args = parser.parse_args()
+
+    point_pipelines_to_local_databases()
+    ensure_database(BENCH_ORIGIN_DB)
+    ensure_database(BENCH_CLOUD_DB)
+
+    recorder = StageRecorder(trace_memory=not args.no_tracemalloc)
+    for pipeline_name in args.pipelines:
+        BENCHMARKS[pipeline_name](recorder, args)
+
+    output_path = args.output or os.path.join(RESULTS_DIR, f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json")
+    recorder.write_results(output_path, vars(args))
+
+    failed_stages = [f"{r['pipeline']}/{r['stage']}" for r in recorder.results if not r["ok"]]
+    if failed_stages:
+        print(f"Etapas con errores o resultados no verificados: {', '.join(failed_stages)}")
+
+    regressions = compare_with_baseline(recorder.results, args.baseline, args.threshold) if args.baseline else []
+    for regression in regressions:
+        print(f"REGRESIÓN: {regression}")
+
+    sys.exit(1 if failed_stages or regressions else 0)
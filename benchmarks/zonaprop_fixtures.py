@@ -0,0 +1,65 @@
+"""
+Páginas de listado de Zonaprop para el benchmark del parseo y la carga del scraping.
+
+Si se indica un directorio con páginas guardadas (*.html, por ejemplo con "Guardar como" del
+navegador) se usan esas; si no, se generan páginas sintéticas con la misma estructura de
+clases CSS que lee parse_ad_data.
+"""
+import glob
+import os
+import random
+
+ADS_PER_PAGE = 20
+
+AD_CARD_TEMPLATE = """
+<div class="postingCard-module__posting-container">
+  <div class="postingPrices-module__price">USD {price}</div>
+  <h3 class="postingCard-module__posting-description">
+    <a href="/propiedades/clasificado/veclapin-terreno-en-venta-posadas-id-{ad_id}.html">Terreno en venta en {neighborhood} - Excelente ubicación, ideal para vivienda. Superficie: {surface} m²</a>
+  </h3>
+  <div class="postingLocations-module__location-address">{street} {number}</div>
+  <h2 class="postingLocations-module__location-text">{neighborhood}, Posadas</h2>
+  <span class="postingMainFeatures-module__posting-main-features-span">{surface} m² tot.</span>
+  <span class="generalFeaturesProperty-module__description-text">Frente del terreno (mts) : {front}</span>
+  <span class="generalFeaturesProperty-module__description-text">Largo del terreno (mts) : {length}</span>
+</div>
+"""
+
+NEIGHBORHOODS = ["Villa Sarita", "Itaembé Miní", "Villa Cabello", "Centro", "Garupá", "Miguel Lanús"]
+STREETS = ["Av. Uruguay", "Av. López Torres", "Calle 147", "Av. Quaranta", "Félix de Azara"]
+
+def generate_listing_pages(total_ads, seed=42):
+    """Genera páginas HTML sintéticas con total_ads anuncios (ADS_PER_PAGE por página)."""
+    rng = random.Random(seed)
+    pages = []
+    for first_ad in range(0, total_ads, ADS_PER_PAGE):
+        cards = []
+        for ad_number in range(first_ad, min(first_ad + ADS_PER_PAGE, total_ads)):
+            front = rng.choice([10, 12, 15, 20])
+            length = rng.choice([25, 30, 40, 50])
+            cards.append(AD_CARD_TEMPLATE.format(
+                ad_id=50_000_000 + ad_number,
+                price=f"{rng.randrange(8, 200) * 1000:,}".replace(",", "."),
+                neighborhood=rng.choice(NEIGHBORHOODS),
+                street=rng.choice(STREETS),
+                number=rng.randrange(100, 9000),
+                surface=front * length,
+                front=front,
+                length=length,
+            ))
+        pages.append(f"<html><body><div class=\"postings-container\">{''.join(cards)}</div></body></html>")
+    return pages
+
+def load_saved_pages(html_dir, total_pages):
+    """
+    Lee las páginas guardadas de html_dir y las repite en orden hasta llegar a total_pages,
+    para poder medir volúmenes mayores que los guardados.
+    """
+    paths = sorted(glob.glob(os.path.join(html_dir, "*.html")))
+    if not paths:
+        raise FileNotFoundError(f"No hay archivos .html en '{html_dir}'")
+    saved_pages = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            saved_pages.append(f.read())
+    return [saved_pages[i % len(saved_pages)] for i in range(total_pages)]
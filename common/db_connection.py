@@ -0,0 +1,173 @@
+"""
+Capa de conexión a PostgreSQL compartida por los tres pipelines.
+
+Cada pipeline pide su motor con get_engine(nombre, ...): el motor se crea una sola vez por
+proceso y se reutiliza en todas las tablas y bloques de la corrida, de modo que el handshake
+TLS y la autenticación contra Supabase se pagan una vez por conexión del pool y no por bloque.
+
+- Pool con tamaño configurable, pre-ping y reciclado de conexiones viejas.
+- TCP keepalives y timeout de conexión, para no quedar colgados en conexiones muertas.
+- statement_timeout opcional, aplicado una vez por conexión física.
+- Prepared statements del lado del servidor opcionales (requieren psycopg 3).
+- Se mide cuánto espera cada checkout del pool y se informa al final de la corrida.
+"""
+import os
+import threading
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL
+from sqlalchemy.pool import QueuePool
+
+# --- Configuración del pool (variables de entorno) ---
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Segundos tras los cuales una conexión se descarta y se reabre (el pooler de Supabase corta las inactivas)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))
+DB_KEEPALIVES_IDLE = int(os.getenv("DB_KEEPALIVES_IDLE", "30"))
+DB_KEEPALIVES_INTERVAL = int(os.getenv("DB_KEEPALIVES_INTERVAL", "10"))
+DB_KEEPALIVES_COUNT = int(os.getenv("DB_KEEPALIVES_COUNT", "5"))
+# 0 = sin límite
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "60000"))
+# Los prepared statements no funcionan a través del Transaction Pooler de Supabase (pgbouncer en
+# modo transacción); activarlos solo con conexión directa o Session Pooler.
+DB_PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "false").lower() == "true"
+# Ejecuciones de una misma sentencia antes de prepararla en el servidor (psycopg 3)
+DB_PREPARE_THRESHOLD = int(os.getenv("DB_PREPARE_THRESHOLD", "5"))
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+class CheckoutStats:
+    """Tiempos de espera de los checkouts de un pool (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "avg_wait_ms": round(self.total_wait / self.checkouts * 1000, 2) if self.checkouts else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 2),
+                "total_wait_ms": round(self.total_wait * 1000, 2),
+            }
+
+class TimedQueuePool(QueuePool):
+    """QueuePool que mide cuánto tarda cada checkout (espera de una conexión libre o apertura de una nueva)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkout_stats = CheckoutStats()
+
+    def connect(self):
+        start_time = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            self.checkout_stats.record(time.perf_counter() - start_time)
+
+    def recreate(self):
+        # engine.dispose() recrea el pool: las estadísticas siguen acumulándose en el nuevo
+        new_pool = super().recreate()
+        new_pool.checkout_stats = self.checkout_stats
+        return new_pool
+
+def set_statement_timeout(engine, statement_timeout_ms):
+    """
+    Aplica statement_timeout al abrir cada conexión física (una sola vez por conexión del pool).
+    Se usa SET en lugar del parámetro de arranque 'options', que el pooler de Supabase no acepta.
+    """
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        autocommit = dbapi_connection.autocommit
+        dbapi_connection.autocommit = True
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"SET statement_timeout = {int(statement_timeout_ms)}")
+        cursor.close()
+        dbapi_connection.autocommit = autocommit
+
+def get_engine(name, host, port, database, user, password, pool_size=DB_POOL_SIZE,
+               statement_timeout_ms=DB_STATEMENT_TIMEOUT_MS, prepared_statements=DB_PREPARED_STATEMENTS):
+    """
+    Devuelve el motor de SQLAlchemy registrado con 'name', creándolo la primera vez.
+    Las llamadas siguientes con el mismo nombre reutilizan el mismo motor (y su pool).
+    prepared_statements=True usa el driver psycopg 3, que prepara en el servidor las sentencias
+    repetidas; si no está instalado se sigue con psycopg2 sin prepared statements.
+    """
+    with _engines_lock:
+        if name in _engines:
+            return _engines[name]
+
+        connect_args = {
+            "connect_timeout": DB_CONNECT_TIMEOUT,
+            "keepalives": 1,
+            "keepalives_idle": DB_KEEPALIVES_IDLE,
+            "keepalives_interval": DB_KEEPALIVES_INTERVAL,
+            "keepalives_count": DB_KEEPALIVES_COUNT,
+            "application_name": f"sudata_{name}",
+        }
+        driver = "psycopg2"
+        if prepared_statements:
+            try:
+                import psycopg  # noqa: F401
+                driver = "psycopg"
+                connect_args["prepare_threshold"] = DB_PREPARE_THRESHOLD
+            except ImportError:
+                print(f"AVISO: psycopg 3 no está instalado; '{name}' sigue con psycopg2 sin prepared statements.")
+
+        url = URL.create(
+            f"postgresql+{driver}",
+            username=user,
+            password=password,
+            host=host,
+            port=int(port) if port else None,
+            database=database,
+        )
+        engine = create_engine(
+            url,
+            poolclass=TimedQueuePool,
+            pool_size=pool_size,
+            max_overflow=DB_POOL_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+            connect_args=connect_args,
+        )
+        if statement_timeout_ms:
+            set_statement_timeout(engine, statement_timeout_ms)
+        _engines[name] = engine
+        return engine
+
+def get_pool_stats(engine):
+    """Estadísticas de espera de checkout del pool del motor (dict vacío si el pool no las mide)."""
+    stats = getattr(engine.pool, "checkout_stats", None)
+    return stats.as_dict() if stats else {}
+
+def report_pool_stats(engine, name=None):
+    """Imprime las esperas de checkout acumuladas por el pool del motor."""
+    stats = get_pool_stats(engine)
+    if stats:
+        print(
+            f"Pool '{name or engine.url.database}': {stats['checkouts']} checkouts, espera media "
+            f"{stats['avg_wait_ms']} ms, máxima {stats['max_wait_ms']} ms."
+        )
+
+def dispose_engines():
+    """Cierra las conexiones de todos los motores registrados y los olvida (por ejemplo, en un proceso hijo)."""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
@@ -0,0 +1,160 @@
+"""
+Índice en memoria de la tabla 'cotizaciones' (pipeline del BCRA) para convertir montos entre
+monedas a la cotización vigente en una fecha.
+
+La serie se lee una sola vez con load_exchange_rates() y queda en arrays de numpy ordenados por
+moneda y fecha. Cada búsqueda "as-of" (la última cotización publicada en la fecha o antes) es un
+np.searchsorted sobre columnas enteras, en lugar de una subconsulta correlacionada por fila:
+
+    rates = load_exchange_rates(engine)
+    precio_ars = rates.convert(df['precio_valor'], df['precio_moneda'], df['fecha_scrapeo'], 'ARS')
+
+Los fines de semana y feriados toman la cotización del último día hábil anterior. Una fecha
+anterior al inicio de la serie, o más de EXCHANGE_RATES_MAX_GAP_DAYS días posterior a la última
+cotización de su moneda (un hueco en la carga), no se convierte y queda como NaN.
+
+Las cotizaciones son pesos por unidad de moneda; el peso (ARS) vale 1. El índice se guarda en un
+.npz (EXCHANGE_RATES_CACHE_PATH) y se reutiliza mientras tenga menos de
+EXCHANGE_RATES_CACHE_TTL_SECONDS; si la base no responde, se usa el archivo aunque esté vencido.
+"""
+import os
+import time
+
+import numpy as np
+from sqlalchemy import text
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Vacío para no usar el archivo
+EXCHANGE_RATES_CACHE_PATH = os.getenv(
+    "EXCHANGE_RATES_CACHE_PATH", os.path.join(REPO_ROOT, ".cache", "exchange_rates.npz")
+)
+# La serie del BCRA se actualiza una vez por semana; 6 horas alcanzan para una corrida y sus reintentos
+EXCHANGE_RATES_CACHE_TTL_SECONDS = int(os.getenv("EXCHANGE_RATES_CACHE_TTL_SECONDS", "21600"))
+# Días corridos que se acepta arrastrar una cotización (un fin de semana largo con feriados son 4 o 5)
+EXCHANGE_RATES_MAX_GAP_DAYS = int(os.getenv("EXCHANGE_RATES_MAX_GAP_DAYS", "10"))
+
+BASE_CURRENCY = "ARS"
+# Formas en las que aparece una moneda en los anuncios y en la base
+CURRENCY_ALIASES = {"$": "ARS", "AR$": "ARS", "PESOS": "ARS", "U$S": "USD", "US$": "USD", "U$D": "USD", "DOLARES": "USD"}
+
+COTIZACIONES_QUERY = "SELECT moneda, fecha, tipo_cambio FROM cotizaciones ORDER BY moneda, fecha"
+
+def normalize_currency_codes(monedas):
+    """Códigos de moneda en mayúsculas y sin alias ('U$S' -> 'USD', '$' -> 'ARS')."""
+    # dtype object: un array de str de ancho fijo recortaría 'ARS' al reemplazar '$'
+    codes = np.char.upper(np.char.strip(np.asarray(monedas, dtype=object).astype(str))).astype(object)
+    for alias, code in CURRENCY_ALIASES.items():
+        codes[codes == alias] = code
+    return codes
+
+class ExchangeRateIndex:
+    """
+    Cotizaciones de todas las monedas en tres arrays alineados (moneda, fecha datetime64[D],
+    tipo_cambio float64), ordenados por moneda y fecha, con el tramo de cada moneda.
+    """
+
+    def __init__(self, moneda, fecha, tipo_cambio, max_gap_days=EXCHANGE_RATES_MAX_GAP_DAYS):
+        order = np.lexsort((fecha, moneda))
+        self.moneda = np.asarray(moneda, dtype=str)[order]
+        self.fecha = np.asarray(fecha, dtype='datetime64[D]')[order]
+        self.tipo_cambio = np.asarray(tipo_cambio, dtype=np.float64)[order]
+        self.max_gap_days = max_gap_days
+        codes, starts = np.unique(self.moneda, return_index=True)
+        ends = np.append(starts[1:], len(self.moneda))
+        self.slices = {code: slice(start, end) for code, start, end in zip(codes, starts, ends)}
+
+    def __len__(self):
+        return len(self.fecha)
+
+    @property
+    def monedas(self):
+        return sorted(str(code) for code in self.slices)
+
+    @classmethod
+    def from_connection(cls, connection):
+        """Lee toda la tabla 'cotizaciones' en una sola consulta."""
+        rows = connection.execute(text(COTIZACIONES_QUERY)).all()
+        if not rows:
+            return cls(np.empty(0, dtype=str), np.empty(0, dtype='datetime64[D]'), np.empty(0))
+        moneda, fecha, tipo_cambio = zip(*rows)
+        return cls(np.array(moneda, dtype=str), np.array(fecha, dtype='datetime64[D]'), np.array(tipo_cambio, dtype=np.float64))
+
+    @classmethod
+    def load(cls, path):
+        """Índice guardado con save()."""
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["moneda"], data["fecha"], data["tipo_cambio"])
+
+    def save(self, path):
+        """Guarda los arrays en un .npz; se escribe a un temporal y se reemplaza, para no dejarlo a medias."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temporary_path = f"{path}.tmp.npz"
+        np.savez(temporary_path, moneda=self.moneda, fecha=self.fecha, tipo_cambio=self.tipo_cambio)
+        os.replace(temporary_path, path)
+
+    def rates_as_of(self, monedas, fechas):
+        """
+        Cotización (pesos por unidad) de cada par (moneda, fecha): la última publicada en la fecha
+        o antes. ARS vale 1; las monedas sin serie, las fechas anteriores a la serie y las que
+        quedan a más de max_gap_days de la última cotización dan NaN.
+        """
+        codes = normalize_currency_codes(monedas)
+        dates = np.asarray(fechas, dtype='datetime64[D]')
+        rates = np.full(len(codes), np.nan)
+        rates[codes == BASE_CURRENCY] = 1.0
+        valid_dates = ~np.isnat(dates)
+
+        for code in np.unique(codes):
+            currency_slice = self.slices.get(code)
+            if currency_slice is None:
+                continue
+            rows = np.flatnonzero((codes == code) & valid_dates)
+            series_dates = self.fecha[currency_slice]
+            positions = np.searchsorted(series_dates, dates[rows], side='right') - 1
+            found = positions >= 0
+            rows, positions = rows[found], positions[found]
+            # Un fin de semana o feriado toma el día hábil anterior; un hueco más largo no se convierte
+            fresh = (dates[rows] - series_dates[positions]).astype(np.int64) <= self.max_gap_days
+            rates[rows[fresh]] = self.tipo_cambio[currency_slice][positions[fresh]]
+        return rates
+
+    def convert(self, valores, monedas, fechas, to_currency=BASE_CURRENCY):
+        """
+        Convierte cada monto de su moneda a 'to_currency' con las cotizaciones de su fecha.
+        Retorna un array float64; NaN donde falta el monto o alguna de las dos cotizaciones.
+        """
+        amounts = np.asarray(valores, dtype=np.float64)
+        amounts_ars = amounts * self.rates_as_of(monedas, fechas)
+        if normalize_currency_codes([to_currency])[0] == BASE_CURRENCY:
+            return amounts_ars
+        return amounts_ars / self.rates_as_of(np.full(len(amounts), to_currency), fechas)
+
+def load_exchange_rates(engine, cache_path=EXCHANGE_RATES_CACHE_PATH, ttl_seconds=EXCHANGE_RATES_CACHE_TTL_SECONDS):
+    """
+    Índice de cotizaciones: del archivo si tiene menos de ttl_seconds, si no de la base (y se
+    vuelve a guardar). Si la base falla y hay un archivo vencido, se usa ese con un aviso.
+    Retorna None si no hay ni base ni archivo.
+    """
+    cache_age = None
+    if cache_path and os.path.exists(cache_path):
+        cache_age = time.time() - os.path.getmtime(cache_path)
+        if cache_age < ttl_seconds:
+            rates = ExchangeRateIndex.load(cache_path)
+            print(f"Cotizaciones: {len(rates)} registros de {len(rates.monedas)} monedas desde '{cache_path}'.")
+            return rates
+
+    try:
+        with engine.connect() as connection:
+            rates = ExchangeRateIndex.from_connection(connection)
+    except Exception as e:
+        if cache_age is None:
+            print(f"AVISO: no se pudieron leer las cotizaciones ({e}); los precios no se normalizan.")
+            return None
+        print(f"AVISO: no se pudieron leer las cotizaciones ({e}); se usa '{cache_path}' de hace {cache_age / 3600:.1f} h.")
+        return ExchangeRateIndex.load(cache_path)
+
+    print(f"Cotizaciones: {len(rates)} registros de {len(rates.monedas)} monedas desde la tabla 'cotizaciones'.")
+    if cache_path:
+        rates.save(cache_path)
+    return rates
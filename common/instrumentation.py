@@ -0,0 +1,259 @@
+"""
+Instrumentación por etapa para los tres pipelines.
+
+Cada pipeline abre una corrida con start_run(nombre) y envuelve sus etapas (extracción,
+transformación, carga, espera HTTP, espera del navegador, parseo...) con stage():
+
+    run = start_run("replication")
+    with stage("extract", table="fact_sales") as metrics:
+        df = ...
+        metrics["rows"] = len(df)
+    run.finish(success=True)
+
+Por cada etapa se registra duración, filas, bytes y pico de memoria residente del proceso. Los
+eventos se escriben como JSON (una línea por etapa) en PIPELINE_METRICS_DIR/<pipeline>_<run_id>.jsonl
+y al terminar se exportan los totales por etapa en formato de texto de Prometheus
+(PIPELINE_METRICS_DIR/<pipeline>.prom, apto para el textfile collector de node_exporter).
+
+Con PIPELINE_PROFILE=true la corrida se perfila además con cProfile (<run>.prof, legible con
+pstats o snakeviz) y tracemalloc (<run>_tracemalloc.txt). cProfile solo ve el hilo que inició
+la corrida; el trabajo de los hilos y procesos auxiliares aparece en las etapas, no en el perfil.
+
+Si no hay una corrida abierta, stage() no registra nada: las funciones instrumentadas se pueden
+seguir llamando sueltas (por ejemplo desde los benchmarks).
+"""
+import cProfile
+import json
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# resource no existe en Windows: ahí no se informa memoria
+try:
+    import resource
+except ImportError:
+    resource = None
+
+PIPELINE_METRICS_DIR = os.getenv(
+    "PIPELINE_METRICS_DIR", os.path.join(os.path.dirname(__file__), '..', 'metrics')
+)
+PIPELINE_PROFILE = os.getenv("PIPELINE_PROFILE", "false").lower() == "true"
+# Cantidad de líneas del reporte de tracemalloc
+PIPELINE_PROFILE_TOP_ALLOCATIONS = int(os.getenv("PIPELINE_PROFILE_TOP_ALLOCATIONS", "25"))
+
+_current_run = None
+
+def get_peak_rss_bytes():
+    """Pico de memoria residente del proceso hasta ahora (ru_maxrss está en KB en Linux y en bytes en macOS)."""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if os.uname().sysname == "Darwin" else max_rss * 1024
+
+def format_labels(labels):
+    """Etiquetas de Prometheus: {pipeline="x",stage="y"} con comillas y barras escapadas."""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+class PipelineRun:
+    """Métricas de una corrida de un pipeline; thread-safe (las etapas pueden correr en paralelo)."""
+
+    def __init__(self, pipeline, metrics_dir=PIPELINE_METRICS_DIR, profile=PIPELINE_PROFILE):
+        self.pipeline = pipeline
+        self.run_id = f"{datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:6]}"
+        self.metrics_dir = metrics_dir
+        self.started_at = datetime.now(timezone.utc)
+        self.start_time = time.perf_counter()
+        self.stages = {}
+        self.success = None
+        self._lock = threading.Lock()
+
+        os.makedirs(metrics_dir, exist_ok=True)
+        self.log_path = os.path.join(metrics_dir, f"{pipeline}_{self.run_id}.jsonl")
+        self._log_file = open(self.log_path, 'a', encoding='utf-8')
+
+        self.profiler = None
+        if profile:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+            tracemalloc.start()
+
+    def log_event(self, event):
+        """Escribe un evento como una línea JSON en el log de la corrida."""
+        event = {"timestamp": datetime.now(timezone.utc).isoformat(), "pipeline": self.pipeline, "run_id": self.run_id, **event}
+        with self._lock:
+            self._log_file.write(json.dumps(event, default=str) + "\n")
+            self._log_file.flush()
+
+    def record_stage(self, name, labels, duration, rows, bytes_count, peak_rss, error):
+        """Acumula una ejecución de etapa en los totales de la corrida y la registra en el log."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            totals = self.stages.setdefault(key, {
+                "calls": 0, "errors": 0, "duration": 0.0, "max_duration": 0.0, "rows": 0, "bytes": 0, "peak_rss": 0
+            })
+            totals["calls"] += 1
+            totals["errors"] += 1 if error else 0
+            totals["duration"] += duration
+            totals["max_duration"] = max(totals["max_duration"], duration)
+            totals["rows"] += rows
+            totals["bytes"] += bytes_count
+            totals["peak_rss"] = max(totals["peak_rss"], peak_rss or 0)
+        self.log_event({
+            "event": "stage",
+            "stage": name,
+            **labels,
+            "duration_s": round(duration, 6),
+            "rows": rows,
+            "bytes": bytes_count,
+            "peak_rss_bytes": peak_rss,
+            "error": error,
+        })
+
+    @contextmanager
+    def stage(self, name, **labels):
+        """
+        Mide el bloque como una ejecución de la etapa 'name'. El bloque recibe un dict donde
+        informar 'rows' y 'bytes'. Las excepciones se registran y se vuelven a lanzar.
+        """
+        metrics = {"rows": 0, "bytes": 0}
+        start_time = time.perf_counter()
+        error = None
+        try:
+            yield metrics
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.record_stage(
+                name, labels, time.perf_counter() - start_time, int(metrics["rows"] or 0),
+                int(metrics["bytes"] or 0), get_peak_rss_bytes(), error
+            )
+
+    def get_stage_totals(self, stage_names, label="table"):
+        """
+        Suma filas y bytes de las etapas indicadas. Retorna (filas por valor de la etiqueta 'label',
+        bytes totales); las etapas sin esa etiqueta se agrupan bajo None.
+        """
+        rows_by_label = {}
+        total_bytes = 0
+        with self._lock:
+            for (stage_name, labels), totals in self.stages.items():
+                if stage_name not in stage_names:
+                    continue
+                key = dict(labels).get(label)
+                rows_by_label[key] = rows_by_label.get(key, 0) + totals["rows"]
+                total_bytes += totals["bytes"]
+        return rows_by_label, total_bytes
+
+    def write_prometheus(self):
+        """Exporta los totales por etapa en formato de texto de Prometheus (escritura atómica)."""
+        run_labels = [("pipeline", self.pipeline)]
+        lines = []
+        stage_metrics = [
+            ("pipeline_stage_calls_total", "counter", "Ejecuciones de la etapa en la última corrida.", "calls"),
+            ("pipeline_stage_errors_total", "counter", "Ejecuciones de la etapa que fallaron en la última corrida.", "errors"),
+            ("pipeline_stage_duration_seconds_total", "counter", "Tiempo total de la etapa en la última corrida.", "duration"),
+            ("pipeline_stage_duration_seconds_max", "gauge", "Ejecución más lenta de la etapa en la última corrida.", "max_duration"),
+            ("pipeline_stage_rows_total", "counter", "Filas procesadas por la etapa en la última corrida.", "rows"),
+            ("pipeline_stage_bytes_total", "counter", "Bytes procesados por la etapa en la última corrida.", "bytes"),
+            ("pipeline_stage_peak_rss_bytes", "gauge", "Pico de memoria residente del proceso al terminar la etapa.", "peak_rss"),
+        ]
+        with self._lock:
+            stages = sorted(self.stages.items())
+        for metric_name, metric_type, help_text, field in stage_metrics:
+            lines.append(f"# HELP {metric_name} {help_text}")
+            lines.append(f"# TYPE {metric_name} {metric_type}")
+            for (stage_name, labels), totals in stages:
+                metric_labels = format_labels(run_labels + [("stage", stage_name)] + list(labels))
+                lines.append(f"{metric_name}{metric_labels} {totals[field]:.6g}" if field in ("duration", "max_duration")
+                             else f"{metric_name}{metric_labels} {totals[field]}")
+
+        run_metrics = [
+            ("pipeline_run_duration_seconds", "Duración de la última corrida.", f"{time.perf_counter() - self.start_time:.3f}"),
+            ("pipeline_run_success", "1 si la última corrida terminó bien, 0 si falló.", "1" if self.success else "0"),
+            ("pipeline_run_timestamp_seconds", "Inicio de la última corrida (epoch).", f"{self.started_at.timestamp():.0f}"),
+        ]
+        for metric_name, help_text, value in run_metrics:
+            lines.append(f"# HELP {metric_name} {help_text}")
+            lines.append(f"# TYPE {metric_name} gauge")
+            lines.append(f"{metric_name}{format_labels(run_labels)} {value}")
+
+        prom_path = os.path.join(self.metrics_dir, f"{self.pipeline}.prom")
+        tmp_path = f"{prom_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, prom_path)
+        return prom_path
+
+    def write_profile(self):
+        """Guarda el perfil de cProfile y las mayores asignaciones de memoria según tracemalloc."""
+        self.profiler.disable()
+        profile_path = os.path.join(self.metrics_dir, f"{self.pipeline}_{self.run_id}.prof")
+        self.profiler.dump_stats(profile_path)
+
+        memory_path = os.path.join(self.metrics_dir, f"{self.pipeline}_{self.run_id}_tracemalloc.txt")
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        with open(memory_path, 'w', encoding='utf-8') as f:
+            f.write(f"Memoria trazada: actual {current / 1024 / 1024:.1f} MB, pico {peak / 1024 / 1024:.1f} MB\n\n")
+            for statistic in snapshot.statistics("lineno")[:PIPELINE_PROFILE_TOP_ALLOCATIONS]:
+                f.write(f"{statistic}\n")
+        print(f"Perfil de la corrida guardado en '{profile_path}' y '{memory_path}'.")
+
+    def print_summary(self):
+        """Imprime los totales por etapa, de la que más tiempo tomó a la que menos."""
+        with self._lock:
+            stages = sorted(self.stages.items(), key=lambda item: item[1]["duration"], reverse=True)
+        print(f"\nTiempo por etapa ({self.pipeline}, corrida {self.run_id}):")
+        for (stage_name, labels), totals in stages:
+            label_text = ", ".join(f"{key}={value}" for key, value in labels)
+            print(
+                f"  {stage_name}{f' [{label_text}]' if label_text else ''}: {totals['duration']:.2f}s en "
+                f"{totals['calls']} ejecuciones, {totals['rows']} filas, {totals['bytes'] / 1024 / 1024:.1f} MB"
+            )
+
+    def finish(self, success):
+        """Cierra la corrida: resumen por consola, archivo de Prometheus, perfil (si se pidió) y log."""
+        global _current_run
+        self.success = success
+        duration = time.perf_counter() - self.start_time
+        self.log_event({"event": "run_end", "success": success, "duration_s": round(duration, 3), "peak_rss_bytes": get_peak_rss_bytes()})
+        self.print_summary()
+        prom_path = self.write_prometheus()
+        if self.profiler:
+            self.write_profile()
+        with self._lock:
+            self._log_file.close()
+        print(f"Métricas de la corrida en '{self.log_path}' y '{prom_path}'.")
+        if _current_run is self:
+            _current_run = None
+
+def start_run(pipeline, **kwargs):
+    """Abre una corrida instrumentada y la deja como corrida actual del proceso."""
+    global _current_run
+    _current_run = PipelineRun(pipeline, **kwargs)
+    _current_run.log_event({"event": "run_start"})
+    return _current_run
+
+def get_current_run():
+    """Corrida instrumentada actual del proceso, o None."""
+    return _current_run
+
+@contextmanager
+def stage(name, **labels):
+    """Mide una etapa en la corrida actual; sin corrida abierta solo entrega el dict de métricas."""
+    run = _current_run
+    if run is None:
+        yield {"rows": 0, "bytes": 0}
+        return
+    with run.stage(name, **labels) as metrics:
+        yield metrics
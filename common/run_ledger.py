@@ -0,0 +1,167 @@
+"""
+Registro de corridas de los pipelines en la base de la nube (tabla 'pipeline_runs') y detección
+de regresiones de rendimiento.
+
+Al terminar, cada corrida guarda inicio y fin, filas por tabla, filas/segundo, bytes movidos y
+resultado, y compara su rendimiento contra la mediana de las últimas corridas exitosas del mismo
+pipeline y modo (la línea de base). Como en los benchmarks, se compara filas/segundo cuando la
+corrida movió al menos RUN_LEDGER_MIN_ROWS filas y, si no, la duración (una corrida incremental
+sin cambios no tiene un rendimiento en filas/segundo significativo).
+
+Una corrida más lenta que la línea de base en más de RUN_LEDGER_REGRESSION_THRESHOLD (0.5 = 50%)
+queda marcada en la tabla y en el log, y el script termina con RUN_LEDGER_REGRESSION_EXIT_CODE
+para que el job programado falle a la vista.
+"""
+import json
+import os
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+RUN_LEDGER_ENABLED = os.getenv("RUN_LEDGER_ENABLED", "true").lower() == "true"
+# Corridas exitosas anteriores que forman la línea de base y mínimo necesario para comparar
+RUN_LEDGER_BASELINE_RUNS = int(os.getenv("RUN_LEDGER_BASELINE_RUNS", "10"))
+RUN_LEDGER_MIN_BASELINE_RUNS = int(os.getenv("RUN_LEDGER_MIN_BASELINE_RUNS", "3"))
+RUN_LEDGER_REGRESSION_THRESHOLD = float(os.getenv("RUN_LEDGER_REGRESSION_THRESHOLD", "0.5"))
+# Debajo de esta cantidad de filas se compara la duración en lugar de filas/segundo
+RUN_LEDGER_MIN_ROWS = int(os.getenv("RUN_LEDGER_MIN_ROWS", "1000"))
+RUN_LEDGER_REGRESSION_EXIT_CODE = int(os.getenv("RUN_LEDGER_REGRESSION_EXIT_CODE", "3"))
+# Código de salida de una corrida fallida
+FAILURE_EXIT_CODE = 1
+
+PIPELINE_RUNS_DDL = """
+CREATE TABLE IF NOT EXISTS pipeline_runs (
+    id BIGSERIAL PRIMARY KEY,
+    pipeline TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    run_id TEXT,
+    started_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    finished_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    duration_s NUMERIC(12, 3) NOT NULL,
+    rows_by_table JSONB NOT NULL DEFAULT '{}',
+    total_rows BIGINT NOT NULL,
+    rows_per_second NUMERIC(14, 2),
+    bytes_moved BIGINT NOT NULL DEFAULT 0,
+    outcome TEXT NOT NULL,
+    error TEXT,
+    baseline_value NUMERIC(14, 3),
+    regression BOOLEAN NOT NULL DEFAULT FALSE
+);
+CREATE INDEX IF NOT EXISTS pipeline_runs_pipeline_mode_idx ON pipeline_runs (pipeline, mode, started_at DESC);
+"""
+
+def create_pipeline_runs_table(connection):
+    """Crea la tabla 'pipeline_runs' si no existe."""
+    connection.execute(text(PIPELINE_RUNS_DDL))
+
+def get_baseline(connection, pipeline, mode, metric):
+    """
+    Mediana de 'metric' ('rows_per_second' o 'duration_s') en las últimas corridas exitosas del
+    pipeline y modo que usaron esa misma métrica. Retorna (mediana, cantidad de corridas).
+    """
+    rows_condition = "total_rows >= :min_rows" if metric == "rows_per_second" else "total_rows < :min_rows"
+    result = connection.execute(
+        text(
+            f"SELECT percentile_cont(0.5) WITHIN GROUP (ORDER BY {metric}), count(*) FROM ("
+            f"  SELECT {metric} FROM pipeline_runs"
+            f"  WHERE pipeline = :pipeline AND mode = :mode AND outcome = 'success' AND {rows_condition}"
+            f"  ORDER BY started_at DESC LIMIT :runs"
+            f") recent"
+        ),
+        {"pipeline": pipeline, "mode": mode, "min_rows": RUN_LEDGER_MIN_ROWS, "runs": RUN_LEDGER_BASELINE_RUNS}
+    ).one()
+    return (float(result[0]) if result[0] is not None else None), result[1]
+
+def check_regression(connection, pipeline, mode, total_rows, rows_per_second, duration):
+    """
+    Compara la corrida con su línea de base. Retorna (valor de la línea de base o None, mensaje de
+    regresión o None).
+    """
+    if total_rows >= RUN_LEDGER_MIN_ROWS:
+        metric, current_value = "rows_per_second", rows_per_second
+    else:
+        metric, current_value = "duration_s", duration
+
+    baseline, baseline_runs = get_baseline(connection, pipeline, mode, metric)
+    if baseline is None or baseline_runs < RUN_LEDGER_MIN_BASELINE_RUNS or not baseline:
+        print(f"Sin línea de base suficiente para '{pipeline}' ({mode}): {baseline_runs} corridas comparables.")
+        return None, None
+
+    if metric == "rows_per_second":
+        regressed = current_value < baseline * (1 - RUN_LEDGER_REGRESSION_THRESHOLD)
+        comparison = f"{current_value:,.0f} filas/s vs mediana de {baseline:,.0f} filas/s"
+    else:
+        regressed = current_value > baseline * (1 + RUN_LEDGER_REGRESSION_THRESHOLD)
+        comparison = f"{current_value:.1f}s vs mediana de {baseline:.1f}s"
+    comparison += f" en las últimas {baseline_runs} corridas exitosas"
+
+    if not regressed:
+        print(f"Rendimiento de '{pipeline}' ({mode}) dentro de lo esperado: {comparison}.")
+        return baseline, None
+    return baseline, (
+        f"REGRESIÓN DE RENDIMIENTO en '{pipeline}' ({mode}): {comparison} "
+        f"(tolerancia {RUN_LEDGER_REGRESSION_THRESHOLD:.0%})."
+    )
+
+def record_run(engine, run, mode, succeeded, rows_by_table, bytes_moved, error=None):
+    """
+    Guarda la corrida en 'pipeline_runs' y la compara contra su línea de base (solo si terminó bien).
+    run: corrida de common.instrumentation (aporta run_id, inicio y duración).
+    Retorna el código de salida del script: 0, FAILURE_EXIT_CODE o RUN_LEDGER_REGRESSION_EXIT_CODE.
+    Un error al escribir el registro se informa pero no cambia el resultado de la corrida.
+    """
+    exit_code = 0 if succeeded else FAILURE_EXIT_CODE
+    if not RUN_LEDGER_ENABLED or engine is None:
+        return exit_code
+
+    finished_at = datetime.now(timezone.utc)
+    duration = (finished_at - run.started_at).total_seconds()
+    rows_by_table = {table: rows for table, rows in rows_by_table.items() if table is not None}
+    total_rows = sum(rows_by_table.values())
+    rows_per_second = total_rows / duration if duration > 0 else None
+
+    try:
+        with engine.begin() as connection:
+            create_pipeline_runs_table(connection)
+            baseline, regression = None, None
+            if succeeded:
+                baseline, regression = check_regression(
+                    connection, run.pipeline, mode, total_rows, rows_per_second or 0.0, duration
+                )
+            connection.execute(
+                text(
+                    "INSERT INTO pipeline_runs (pipeline, mode, run_id, started_at, finished_at, duration_s, "
+                    "rows_by_table, total_rows, rows_per_second, bytes_moved, outcome, error, baseline_value, regression) "
+                    "VALUES (:pipeline, :mode, :run_id, :started_at, :finished_at, :duration, CAST(:rows_by_table AS JSONB), "
+                    ":total_rows, :rows_per_second, :bytes_moved, :outcome, :error, :baseline, :regression)"
+                ),
+                {
+                    "pipeline": run.pipeline,
+                    "mode": mode,
+                    "run_id": run.run_id,
+                    "started_at": run.started_at,
+                    "finished_at": finished_at,
+                    "duration": round(duration, 3),
+                    "rows_by_table": json.dumps(rows_by_table),
+                    "total_rows": total_rows,
+                    "rows_per_second": round(rows_per_second, 2) if rows_per_second is not None else None,
+                    "bytes_moved": int(bytes_moved),
+                    "outcome": "success" if succeeded else "failed",
+                    "error": error,
+                    "baseline": baseline,
+                    "regression": regression is not None,
+                }
+            )
+    except Exception as e:
+        print(f"AVISO: no se pudo registrar la corrida en 'pipeline_runs': {e}")
+        return exit_code
+
+    print(
+        f"Corrida registrada en 'pipeline_runs': {total_rows} filas en {duration:.1f}s "
+        f"({rows_per_second or 0:,.0f} filas/s), {bytes_moved / 1024 / 1024:.1f} MB movidos."
+    )
+    if regression:
+        print(regression)
+        run.log_event({"event": "regression", "mode": mode, "baseline": baseline, "message": regression})
+        return RUN_LEDGER_REGRESSION_EXIT_CODE
+    return exit_code
@@ -0,0 +1,138 @@
+"""
+Tablas de resumen para BI mantenidas por el pipeline de replicación en la base de la nube.
+
+Ventas por día, mes y trimestre × tipo de producto × ciudad, con SUM("MontoTotal"),
+SUM("QuantitySold") y cantidad de ventas. Se reconstruyen completas tras una recarga completa
+(o si cambió alguna dimensión) y, en el modo incremental, se actualizan solo con las filas de
+fact_sales fusionadas en la corrida: dentro de la misma transacción del merge se suma lo nuevo
+(la tabla temporal del merge) y se resta lo que esas filas valían antes (fact_sales), así que
+un merge repetido no altera los totales.
+"""
+import time
+
+from sqlalchemy import text
+
+from common.instrumentation import stage
+
+# Dimensiones de las que toman atributos los resúmenes: si cambian, se reconstruyen
+DIMENSION_TABLES = ["dim_date", "dim_product", "dim_customer_segment"]
+
+# Columnas de agrupación disponibles (atributos de las dimensiones) y su tipo
+GRAIN_COLUMNS = {
+    "date": "DATE",
+    "Year": "INT",
+    "Quarter": "INT",
+    "Month": "INT",
+    "Producttype": "VARCHAR(255)",
+    "City": "VARCHAR(100)",
+}
+
+# Tablas de resumen y su grano
+AGGREGATE_TABLES = [
+    {"name": "agg_sales_daily", "grain": ["date", "Producttype", "City"]},
+    {"name": "agg_sales_monthly", "grain": ["Year", "Month", "Producttype", "City"]},
+    {"name": "agg_sales_quarterly", "grain": ["Year", "Quarter", "Producttype", "City"]},
+]
+
+MEASURES_SQL = (
+    'SUM("MontoTotal") AS "MontoTotal", SUM("QuantitySold") AS "QuantitySold", SUM("SalesCount") AS "SalesCount"'
+)
+
+def build_create_aggregate_sql(aggregate):
+    """CREATE TABLE de una tabla de resumen: el grano es la PK."""
+    grain_definitions = [f'"{column}" {GRAIN_COLUMNS[column]} NOT NULL' for column in aggregate["grain"]]
+    grain_key = ", ".join(f'"{column}"' for column in aggregate["grain"])
+    columns_sql = ",\n    ".join(grain_definitions + [
+        '"MontoTotal" NUMERIC(18, 2) NOT NULL',
+        '"QuantitySold" BIGINT NOT NULL',
+        '"SalesCount" BIGINT NOT NULL',
+        f"PRIMARY KEY ({grain_key})",
+    ])
+    return f'CREATE TABLE IF NOT EXISTS "public"."{aggregate["name"]}" (\n    {columns_sql}\n);'
+
+def build_attributed_facts_sql(fact_source, schema='public'):
+    """
+    Filas de ventas con los atributos de sus dimensiones. fact_source debe exponer "Dateid",
+    "Productid", "Segmentid", "MontoTotal", "QuantitySold" y "SalesCount" (1 por venta, o -1
+    para restar una venta).
+    """
+    grain_select = ", ".join(
+        f'{alias}."{column}"' for column, alias in
+        (("date", "d"), ("Year", "d"), ("Quarter", "d"), ("Month", "d"), ("Producttype", "p"), ("City", "c"))
+    )
+    return (
+        f'SELECT {grain_select}, f."MontoTotal", f."QuantitySold", f."SalesCount" '
+        f'FROM {fact_source} f '
+        f'JOIN "{schema}"."dim_date" d ON d."dateid" = f."Dateid" '
+        f'JOIN "{schema}"."dim_product" p ON p."Productid" = f."Productid" '
+        f'JOIN "{schema}"."dim_customer_segment" c ON c."Segmentid" = f."Segmentid"'
+    )
+
+def aggregates_exist(engine):
+    """Indica si todas las tablas de resumen existen en la nube."""
+    with engine.connect() as connection:
+        return all(
+            connection.execute(text("SELECT to_regclass(:table_name)"), {"table_name": f'public."{aggregate["name"]}"'}).scalar()
+            for aggregate in AGGREGATE_TABLES
+        )
+
+def rebuild_aggregates(engine):
+    """
+    Reconstruye las tablas de resumen desde fact_sales en una sola transacción (los dashboards
+    ven los totales anteriores hasta el commit).
+    """
+    print("\nReconstruyendo las tablas de resumen para BI...")
+    start_time = time.perf_counter()
+    facts_sql = build_attributed_facts_sql(
+        '(SELECT "Dateid", "Productid", "Segmentid", "MontoTotal", "QuantitySold", 1 AS "SalesCount" '
+        'FROM "public"."fact_sales")'
+    )
+    with engine.begin() as connection, stage("bi_aggregates_rebuild"):
+        for aggregate in AGGREGATE_TABLES:
+            grain = ", ".join(f'"{column}"' for column in aggregate["grain"])
+            connection.execute(text(build_create_aggregate_sql(aggregate)))
+            connection.execute(text(f'TRUNCATE "public"."{aggregate["name"]}"'))
+            connection.execute(text(
+                f'INSERT INTO "public"."{aggregate["name"]}" ({grain}, "MontoTotal", "QuantitySold", "SalesCount") '
+                f'SELECT {grain}, {MEASURES_SQL} FROM ({facts_sql}) facts GROUP BY {grain}'
+            ))
+    print(f"Tablas de resumen reconstruidas en {time.perf_counter() - start_time:.2f}s.")
+
+def apply_fact_sales_delta(connection, staging_table, schema='public'):
+    """
+    Aplica a las tablas de resumen el efecto de fusionar pg_temp.<staging_table> en fact_sales.
+    Debe ejecutarse en la transacción del merge y ANTES del INSERT ... ON CONFLICT, mientras
+    fact_sales todavía tiene los valores anteriores de las filas actualizadas: se suman las
+    filas nuevas y se restan las versiones viejas. Los grupos que quedan sin ventas se borran.
+    """
+    delta_source = (
+        f'(SELECT "Dateid", "Productid", "Segmentid", "MontoTotal", "QuantitySold", 1 AS "SalesCount" '
+        f'FROM pg_temp."{staging_table}" '
+        f'UNION ALL '
+        f'SELECT f."Dateid", f."Productid", f."Segmentid", -f."MontoTotal", -f."QuantitySold", -1 '
+        f'FROM "{schema}"."fact_sales" f JOIN pg_temp."{staging_table}" s ON s."Salesid" = f."Salesid")'
+    )
+    finest_grain = ", ".join(f'"{column}"' for column in GRAIN_COLUMNS)
+    with stage("bi_aggregates_delta"):
+        connection.execute(text(
+            f'CREATE TEMP TABLE "stage_bi_delta" ON COMMIT DROP AS '
+            f'SELECT {finest_grain}, {MEASURES_SQL} FROM ({build_attributed_facts_sql(delta_source, schema)}) facts '
+            f'GROUP BY {finest_grain}'
+        ))
+
+        for aggregate in AGGREGATE_TABLES:
+            grain = ", ".join(f'"{column}"' for column in aggregate["grain"])
+            join_condition = " AND ".join(f'a."{column}" = d."{column}"' for column in aggregate["grain"])
+            connection.execute(text(
+                f'INSERT INTO "public"."{aggregate["name"]}" AS a ({grain}, "MontoTotal", "QuantitySold", "SalesCount") '
+                f'SELECT {grain}, {MEASURES_SQL} FROM pg_temp."stage_bi_delta" GROUP BY {grain} '
+                f'ON CONFLICT ({grain}) DO UPDATE SET '
+                f'"MontoTotal" = a."MontoTotal" + EXCLUDED."MontoTotal", '
+                f'"QuantitySold" = a."QuantitySold" + EXCLUDED."QuantitySold", '
+                f'"SalesCount" = a."SalesCount" + EXCLUDED."SalesCount"'
+            ))
+            connection.execute(text(
+                f'DELETE FROM "public"."{aggregate["name"]}" a USING pg_temp."stage_bi_delta" d '
+                f'WHERE {join_condition} AND a."SalesCount" = 0'
+            ))
+        connection.execute(text('DROP TABLE pg_temp."stage_bi_delta"'))
@@ -3,6 +3,8 @@ from psycopg2 import sql
 import os
 from dotenv import load_dotenv
 
+from table_schemas import TABLE_SCHEMAS, build_create_table_sql
+
 load_dotenv()
 
 DB_HOST = os.getenv("DB_ORIGIN_HOST")
@@ -53,57 +55,10 @@ def create_tables():
         conn.autocommit = True
         cur = conn.cursor()
 
-        # Definiciones de esquema de tablas (SQL DDL)
-        tables_sql = [
-            """
-            CREATE TABLE IF NOT EXISTS dim_date (
-                "dateid" INT PRIMARY KEY,
-                "date" DATE NOT NULL UNIQUE,
-                "Year" INT,
-                "Quarter" INT,
-                "QuarterName" VARCHAR(20),
-                "Month" INT,
-                "Monthname" VARCHAR(20),
-                "Day" INT,
-                "Weekday" INT,
-                "WeekdayName" VARCHAR(15)
-            );
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS dim_customer_segment (
-                "Segmentid" INT PRIMARY KEY,
-                "City" VARCHAR(100) NOT NULL
-                -- No hay columna 'descripcion' en el CSV, por lo tanto, no se incluye aquí.
-                -- Si se necesita para BI, podría ser una columna NULLable en el destino.
-            );
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS dim_product (
-                "Productid" INT PRIMARY KEY,
-                "Producttype" VARCHAR(255) NOT NULL
-                -- No hay 'nombre_producto', 'categoria', 'precio' directos en CSV.
-                -- 'Producttype' será el nombre del producto.
-            );
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS fact_sales (
-                "Salesid" VARCHAR(50) PRIMARY KEY, -- Salesid es String (ej. S1001)
-                "Dateid" INT NOT NULL,
-                "Productid" INT NOT NULL,
-                "Segmentid" INT NOT NULL,
-                "Price_PerUnit" NUMERIC(10, 2) NOT NULL,
-                "QuantitySold" INT NOT NULL,
-                "MontoTotal" NUMERIC(10, 2), -- Esta columna la calcularemos en Python
-                FOREIGN KEY ("Productid") REFERENCES dim_product ("Productid"),
-                FOREIGN KEY ("Segmentid") REFERENCES dim_customer_segment ("Segmentid"),
-                FOREIGN KEY ("Dateid") REFERENCES dim_date ("dateid")
-            );
-            """
-        ]
-
-        for table_sql in tables_sql:
-            cur.execute(table_sql)
-            print(f"Tabla creada/verificada: {table_sql.splitlines()[1].strip()}")
+        # Definiciones de esquema de tablas (SQL DDL), generadas desde el registro de table_schemas
+        for table in TABLE_SCHEMAS:
+            cur.execute(build_create_table_sql(table["name"]))
+            print(f"Tabla creada/verificada: {table['name']}")
         
         print("Todas las tablas han sido creadas o ya existían.")
 
@@ -0,0 +1,169 @@
+"""
+Generador de datos sintéticos para el modelo estrella de ventas.
+
+Escribe DimDate.csv, DimCustomerSegment.csv, DimProduct.csv y FactSales.csv con el mismo
+formato que los CSV de data/, a una escala configurable (scale factor 1 = 1.000.000 de filas
+de hechos), para medir load_origin_data.py y replication_pipeline.py con volúmenes reales.
+
+- Las FKs de fact_sales siempre apuntan a filas existentes de las dimensiones.
+- Los tipos de columna siguen el registro de table_schemas.
+- fact_sales se escribe a disco en bloques, así que la memoria no depende de la escala.
+- Para una misma semilla y escala la salida es idéntica byte a byte.
+
+Uso:
+    python src/generate_synthetic_data.py --scale-factor 0.01 --seed 42
+"""
+import argparse
+import math
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from table_schemas import get_column_names, get_table_schema
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+# Filas de hechos por unidad de scale factor
+FACT_ROWS_PER_SCALE_FACTOR = 1_000_000
+
+# Filas de hechos por bloque. Cada bloque usa su propio generador aleatorio derivado de la semilla,
+# así que la salida no depende de cuántos bloques haya en memoria a la vez.
+FACT_BLOCK_ROWS = 100_000
+
+FIRST_DATE = "2019-03-09"
+PRODUCT_TYPES = [
+    "Electronics", "Clothing", "Furniture", "Groceries", "Appliances", "Beauty", "Books", "Shoes",
+    "Gardening", "Sports", "Toys", "Jewelry", "Tools", "Kitchenware", "Pet Supplies", "Art Supplies"
+]
+CITIES = [
+    "Sao Paulo", "Rio de Janeiro", "Brasilia", "Salvador", "Fortaleza", "Belo Horizonte",
+    "Manaus", "Curitiba", "Recife", "Porto Alegre"
+]
+
+def get_dimension_sizes(fact_rows):
+    """
+    Tamaños de las dimensiones para una cantidad de hechos. Las fechas crecen linealmente (con
+    un mínimo de ~1 año y un máximo de 100 años); productos y segmentos crecen con la raíz cuadrada.
+    """
+    n_dates = min(max(fact_rows // 1000, 350), 36_525)
+    n_products = max(25, round(25 * math.sqrt(fact_rows / 1000)))
+    n_segments = max(19, round(19 * math.sqrt(fact_rows / 1000)))
+    return n_dates, n_products, n_segments
+
+def generate_dim_date(n_dates):
+    """Genera dim_date con n_dates días consecutivos desde FIRST_DATE (Weekday 1 = lunes)."""
+    dates = pd.date_range(FIRST_DATE, periods=n_dates, freq="D")
+    return pd.DataFrame({
+        "dateid": np.arange(1, n_dates + 1),
+        "date": dates.strftime("%Y-%m-%d"),
+        "Year": dates.year,
+        "Quarter": dates.quarter,
+        "QuarterName": "Q" + dates.quarter.astype(str),
+        "Month": dates.month,
+        "Monthname": dates.month_name(),
+        "Day": dates.day,
+        "Weekday": dates.dayofweek + 1,
+        "WeekdayName": dates.day_name(),
+    })
+
+def generate_dim_customer_segment(n_segments, rng):
+    """Genera dim_customer_segment con ids consecutivos y una ciudad al azar por segmento."""
+    return pd.DataFrame({
+        "Segmentid": np.arange(1, n_segments + 1),
+        "City": np.array(CITIES)[rng.integers(0, len(CITIES), n_segments)],
+    })
+
+def generate_dim_product(n_products):
+    """Genera dim_product con ids desde 1001 y los tipos de producto en rotación, como el CSV original."""
+    return pd.DataFrame({
+        "Productid": np.arange(1001, 1001 + n_products),
+        "Producttype": np.array(PRODUCT_TYPES)[np.arange(n_products) % len(PRODUCT_TYPES)],
+    })
+
+def generate_product_prices(n_products, rng):
+    """Precio unitario fijo por producto (entre 1 y 1500, con 2 decimales)."""
+    return np.round(rng.lognormal(mean=3.5, sigma=1.2, size=n_products).clip(1, 1500), 2)
+
+def generate_fact_sales_block(block_number, block_rows, first_row, n_dates, product_ids, product_prices,
+                              segment_ids, seed):
+    """
+    Genera un bloque de fact_sales. Cada bloque usa un generador derivado de (seed, block_number),
+    por lo que el contenido es determinístico e independiente del resto de los bloques.
+    """
+    rng = np.random.default_rng([seed, block_number])
+    product_index = rng.integers(0, len(product_ids), block_rows)
+    row_numbers = np.arange(first_row, first_row + block_rows) + 1001
+    return pd.DataFrame({
+        "Salesid": np.char.add("S", row_numbers.astype(str)),
+        "Dateid": rng.integers(1, n_dates + 1, block_rows),
+        "Productid": product_ids[product_index],
+        "Segmentid": segment_ids[rng.integers(0, len(segment_ids), block_rows)],
+        "Price_PerUnit": product_prices[product_index],
+        "QuantitySold": rng.integers(1, 41, block_rows),
+    })
+
+def write_table(df, output_dir, table_name):
+    """Escribe una dimensión completa en su CSV (nombre y columnas según table_schemas)."""
+    file_path = os.path.join(output_dir, get_table_schema(table_name)["file_name"])
+    df[get_column_names(table_name, include_derived=False)].to_csv(file_path, index=False)
+    print(f"  {os.path.basename(file_path)}: {len(df)} filas.")
+
+def generate_synthetic_data(scale_factor, seed=42, output_dir=None):
+    """
+    Genera los cuatro CSV del modelo estrella a la escala indicada en output_dir.
+    Retorna el directorio de salida.
+    """
+    fact_rows = max(1, round(scale_factor * FACT_ROWS_PER_SCALE_FACTOR))
+    n_dates, n_products, n_segments = get_dimension_sizes(fact_rows)
+    output_dir = output_dir or os.path.join(DATA_DIR, "synthetic", f"sf{scale_factor:g}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    print(f"Generando datos sintéticos (scale factor {scale_factor:g}, semilla {seed}) en '{output_dir}'...")
+    print(f"  {fact_rows} ventas, {n_dates} fechas, {n_products} productos, {n_segments} segmentos.")
+    start_time = time.perf_counter()
+
+    rng = np.random.default_rng(seed)
+    dim_date = generate_dim_date(n_dates)
+    dim_customer_segment = generate_dim_customer_segment(n_segments, rng)
+    dim_product = generate_dim_product(n_products)
+    product_prices = generate_product_prices(n_products, rng)
+
+    write_table(dim_date, output_dir, "dim_date")
+    write_table(dim_customer_segment, output_dir, "dim_customer_segment")
+    write_table(dim_product, output_dir, "dim_product")
+
+    fact_path = os.path.join(output_dir, get_table_schema("fact_sales")["file_name"])
+    product_ids = dim_product["Productid"].to_numpy()
+    segment_ids = dim_customer_segment["Segmentid"].to_numpy()
+    n_blocks = math.ceil(fact_rows / FACT_BLOCK_ROWS)
+    for block_number in range(n_blocks):
+        first_row = block_number * FACT_BLOCK_ROWS
+        block_rows = min(FACT_BLOCK_ROWS, fact_rows - first_row)
+        df_block = generate_fact_sales_block(
+            block_number, block_rows, first_row, n_dates, product_ids, product_prices, segment_ids, seed
+        )
+        df_block.to_csv(fact_path, mode='w' if block_number == 0 else 'a', header=block_number == 0, index=False)
+        if (block_number + 1) % 10 == 0 or block_number + 1 == n_blocks:
+            print(f"  {os.path.basename(fact_path)}: {first_row + block_rows}/{fact_rows} filas escritas.")
+
+    print(f"Datos sintéticos generados en {time.perf_counter() - start_time:.1f}s.")
+    return output_dir
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera CSV sintéticos del modelo estrella de ventas a escala.")
+    parser.add_argument(
+        "--scale-factor",
+        type=float,
+        default=0.01,
+        help=f"Escala de los datos: 1 = {FACT_ROWS_PER_SCALE_FACTOR:,} filas de fact_sales (por defecto 0.01)."
+    )
+    parser.add_argument("--seed", type=int, default=42, help="Semilla del generador aleatorio (por defecto 42).")
+    parser.add_argument(
+        "--output-dir",
+        default=None,
+        help="Directorio de salida (por defecto data/synthetic/sf<escala>)."
+    )
+    args = parser.parse_args()
+    generate_synthetic_data(args.scale_factor, seed=args.seed, output_dir=args.output_dir)
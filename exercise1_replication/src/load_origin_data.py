@@ -3,6 +3,8 @@ from sqlalchemy import create_engine
 import os
 from dotenv import load_dotenv
 
+from table_schemas import TABLE_SCHEMAS, add_derived_columns, cast_dataframe, get_csv_dtypes
+
 load_dotenv()
 
 DB_HOST = os.getenv("DB_ORIGIN_HOST")
@@ -11,16 +13,14 @@ DB_USER = os.getenv("DB_ORIGIN_USER")
 DB_PASSWORD = os.getenv("DB_ORIGIN_PASSWORD")
 DB_NAME = os.getenv("DB_ORIGIN_NAME")
 
-DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+# ORIGIN_DATA_DIR permite cargar otro juego de CSV (por ejemplo los de generate_synthetic_data.py)
+DATA_DIR = os.getenv("ORIGIN_DATA_DIR", os.path.join(os.path.dirname(__file__), '..', 'data'))
+# Filas por bloque al leer cada CSV, para que la memoria no dependa del tamaño del archivo
+LOAD_CHUNK_SIZE = int(os.getenv("ORIGIN_LOAD_CHUNK_SIZE", "100000"))
 
-# Nombres de los archivos CSV y sus correspondientes tablas
+# Nombres de los archivos CSV y sus correspondientes tablas (definidos en table_schemas)
 # NOTA: EL ORDEN ES IMPORTANTE PARA LAS CLAVES FORÁNEAS
-csv_tables_mapping = [
-    ("DimDate.csv", "dim_date"),
-    ("DimCustomerSegment.csv", "dim_customer_segment"),
-    ("DimProduct.csv", "dim_product"),
-    ("FactSales.csv", "fact_sales") # Esta se procesará con una transformación extra
-]
+csv_tables_mapping = [(table["file_name"], table["name"]) for table in TABLE_SCHEMAS]
 
 def load_data_to_origin_db():
     print(f"Conectando a la base de datos '{DB_NAME}' para cargar datos...")
@@ -33,38 +33,22 @@ def load_data_to_origin_db():
             file_path = os.path.join(DATA_DIR, csv_file)
             print(f"Cargando {csv_file} en la tabla {table_name}...")
             
-            df = pd.read_csv(file_path)
-
-            # --- Transformaciones específicas para cada tabla si es necesario ---
-            if table_name == "fact_sales":
-                # Calcular "MontoTotal" a partir de "Price_PerUnit" y "QuantitySold"
-                df["MontoTotal"] = df["Price_PerUnit"] * df["QuantitySold"]
-                print(f"Columna 'MontoTotal' calculada para {table_name}.")
-
-                df['Dateid'] = pd.to_numeric(df['Dateid'], errors='coerce').astype(int)
-                df['Productid'] = pd.to_numeric(df['Productid'], errors='coerce').astype(int)
-                df['Segmentid'] = pd.to_numeric(df['Segmentid'], errors='coerce').astype(int)
-            
-            elif table_name == "dim_date":
-
-                df['date'] = pd.to_datetime(df['date'], errors='coerce').dt.date
-
-                for col in ['dateid', 'Year', 'Quarter', 'Month', 'Day', 'Weekday']:
-                    df[col] = pd.to_numeric(df[col], errors='coerce').astype(int)
-
-            elif table_name == "dim_customer_segment":
-                df['Segmentid'] = pd.to_numeric(df['Segmentid'], errors='coerce').astype(int)
-            
-            elif table_name == "dim_product":
-                df['Productid'] = pd.to_numeric(df['Productid'], errors='coerce').astype(int)
-
-
-            # Cargar el DataFrame en la tabla de PostgreSQL
-            # Usamos 'append' para añadir datos, o 'replace' si queremos borrar y recrear en cada corrida.
-            # Para la carga inicial, 'append' está bien si no hay IDs duplicados en el CSV.
-            # Para reintentos, si ya tienes datos cargados, deberías limpiar la tabla antes o usar 'replace'.
-            df.to_sql(table_name, engine, if_exists='append', index=False)
-            print(f"Datos de {csv_file} cargados exitosamente en {table_name}.")
+            # Los dtypes de lectura y el casteo salen del registro de esquemas: una sola pasada
+            # por bloque, sin conversiones columna por columna.
+            rows_loaded = 0
+            for df in pd.read_csv(file_path, dtype=get_csv_dtypes(table_name), chunksize=LOAD_CHUNK_SIZE):
+                df = cast_dataframe(df, table_name)
+
+                # --- Columnas calculadas (por ejemplo "MontoTotal" = "Price_PerUnit" * "QuantitySold") ---
+                df = add_derived_columns(df, table_name)
+
+                # Cargar el DataFrame en la tabla de PostgreSQL
+                # Usamos 'append' para añadir datos, o 'replace' si queremos borrar y recrear en cada corrida.
+                # Para la carga inicial, 'append' está bien si no hay IDs duplicados en el CSV.
+                # Para reintentos, si ya tienes datos cargados, deberías limpiar la tabla antes o usar 'replace'.
+                df.to_sql(table_name, engine, if_exists='append', index=False)
+                rows_loaded += len(df)
+            print(f"Datos de {csv_file} cargados exitosamente en {table_name} ({rows_loaded} filas).")
 
         print("Todos los datos han sido cargados a la base de datos de origen.")
 
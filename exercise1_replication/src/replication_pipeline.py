@@ -1,8 +1,32 @@
 import pandas as pd
-from sqlalchemy import create_engine
+import argparse
+import io
+import multiprocessing
 import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+
+# Raíz del repositorio en el path para importar la capa de conexión compartida (common/)
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from common.db_connection import DB_POOL_SIZE, dispose_engines, get_engine, report_pool_stats
+from common.instrumentation import stage, start_run
+from common.run_ledger import record_run
+
+from bi_aggregates import DIMENSION_TABLES, aggregates_exist, apply_fact_sales_delta, rebuild_aggregates
+from table_schemas import (
+    TABLE_SCHEMAS,
+    add_derived_columns,
+    build_add_constraints_sql,
+    build_create_table_sql,
+    build_select_sql,
+    cast_dataframe,
+    get_column_names,
+    get_dependency_graph,
+)
 
 # Cargar variables de entorno del archivo .env
 load_dotenv()
@@ -21,19 +45,96 @@ DB_CLOUD_NAME = os.getenv("DB_CLOUD_NAME")
 DB_CLOUD_USER = os.getenv("DB_CLOUD_USER")
 DB_CLOUD_PASSWORD = os.getenv("DB_CLOUD_PASSWORD")
 
+# Opciones de replicación por tabla. El esquema de cada tabla (columnas, PK, FKs y columnas
+# calculadas) se define una sola vez en table_schemas.py.
+# "partition_key": columna por la que una tabla grande puede dividirse en rangos copiados en paralelo.
+replication_options = {
+    "fact_sales": {"partition_key": "Salesid"}
+}
+
 # Definición de las tablas a replicar y su orden (IMPORTANTE para FKs)
-# Usamos los nombres de tabla y columna exactos (case-sensitive) como están en la DB
 tables_to_replicate = [
-    {"name": "dim_date", "pk": "dateid", "file_name": "DimDate.csv"},
-    {"name": "dim_customer_segment", "pk": "Segmentid", "file_name": "DimCustomerSegment.csv"},
-    {"name": "dim_product", "pk": "Productid", "file_name": "DimProduct.csv"},
-    {"name": "fact_sales", "pk": "Salesid", "file_name": "FactSales.csv"}
+    {
+        "name": table["name"],
+        "pk": table["primary_key"],
+        "file_name": table["file_name"],
+        **replication_options.get(table["name"], {})
+    }
+    for table in TABLE_SCHEMAS
 ]
 
-def get_db_engine(db_type="origin"):
+# --- Configuración de la carga en la nube ---
+# 'copy': carga masiva con COPY ... FROM STDIN (por defecto).
+# 'to_sql': INSERTs generados por pandas (más lento, se usa también como alternativa si COPY falla).
+REPLICATION_LOAD_METHOD = os.getenv("REPLICATION_LOAD_METHOD", "copy").lower()
+
+# Filas por bloque en la extracción: el origen se lee con un cursor del lado del servidor y cada
+# bloque se transforma y carga antes de pedir el siguiente, por lo que la memoria máxima del
+# proceso depende de este valor y no del tamaño de la tabla.
+REPLICATION_CHUNK_SIZE = int(os.getenv("REPLICATION_CHUNK_SIZE", "50000"))
+
+# Cantidad de tablas que se replican en paralelo. Las tablas sin dependencias entre sí (las
+# dimensiones) se procesan a la vez, cada una con sus propias conexiones al origen y a la nube.
+REPLICATION_MAX_WORKERS = int(os.getenv("REPLICATION_MAX_WORKERS", "3"))
+
+# Copia particionada (solo en recarga completa): una tabla con "partition_key" y al menos
+# REPLICATION_PARTITION_MIN_ROWS filas se divide en REPLICATION_PARTITIONS rangos de clave, y cada
+# rango se extrae y carga en un proceso propio con su propio par de conexiones.
+REPLICATION_PARTITIONS = int(os.getenv("REPLICATION_PARTITIONS", "4"))
+REPLICATION_PARTITION_MIN_ROWS = int(os.getenv("REPLICATION_PARTITION_MIN_ROWS", "1000000"))
+
+# Sincronización por checksums (--checksum): origen y nube se comparan por hashes de rangos de la PK
+# calculados en SQL de cada lado, y solo se copian los rangos que difieren. Un rango distinto se
+# subdivide en REPLICATION_CHECKSUM_FANOUT partes hasta tener a lo sumo REPLICATION_CHECKSUM_LEAF_ROWS
+# filas, donde se comparan los hashes fila por fila.
+REPLICATION_CHECKSUM_BLOCK_ROWS = int(os.getenv("REPLICATION_CHECKSUM_BLOCK_ROWS", "10000"))
+REPLICATION_CHECKSUM_FANOUT = int(os.getenv("REPLICATION_CHECKSUM_FANOUT", "16"))
+REPLICATION_CHECKSUM_LEAF_ROWS = int(os.getenv("REPLICATION_CHECKSUM_LEAF_ROWS", "100"))
+# Tipos de clave que se ordenan y comparan con COLLATE "C" (por bytes) en los rangos de checksums
+TEXT_KEY_TYPES = {"text", "character varying", "varchar", "character", "char", "bpchar"}
+
+# Carga "en sombra" (shadow load): la recarga completa se arma en este esquema, sin índices ni
+# restricciones, y al final se intercambia con las tablas de 'public' en una transacción corta.
+REPLICATION_STAGING_SCHEMA = os.getenv("REPLICATION_STAGING_SCHEMA", "replication_staging")
+REPLICATION_SHADOW_LOAD = os.getenv("REPLICATION_SHADOW_LOAD", "false").lower() == "true"
+
+# Pushdown: el transform (casteos y "MontoTotal") se resuelve en el SELECT del origen y las filas
+# tipadas viajan de un COPY al otro sin pasar por pandas. También con --pushdown.
+REPLICATION_PUSHDOWN = os.getenv("REPLICATION_PUSHDOWN", "false").lower() == "true"
+
+# Tablas de resumen para BI (bi_aggregates.py): se mantienen en cada corrida salvo que se desactiven
+REPLICATION_BI_AGGREGATES = os.getenv("REPLICATION_BI_AGGREGATES", "true").lower() == "true"
+
+# Funciones que se ejecutan en la transacción del merge de una tabla, antes de fusionarla: ven los
+# valores anteriores en la tabla destino y los nuevos en la tabla temporal del merge.
+before_merge_hooks = {
+    "fact_sales": apply_fact_sales_delta,
+}
+
+# statement_timeout de las conexiones de replicación en milisegundos (0 = sin límite). Por defecto
+# sin límite: un COPY o un ALTER TABLE de una tabla grande dura legítimamente varios minutos.
+REPLICATION_STATEMENT_TIMEOUT_MS = int(os.getenv("REPLICATION_STATEMENT_TIMEOUT_MS", "0"))
+
+# --- Esquemas de las tablas en la nube (mismo esquema que el origen, generado desde table_schemas) ---
+tables_ddl = [build_create_table_sql(table["name"]) for table in TABLE_SCHEMAS]
+
+# --- Estado de la replicación incremental ---
+# Por cada tabla se guarda la marca de agua (high-water mark): el mayor xmin (id de la transacción
+# que insertó o actualizó la fila) ya replicado desde el origen. En la siguiente corrida solo se
+# extraen las filas con un xmin mayor, es decir, las insertadas o modificadas desde entonces.
+REPLICATION_STATE_DDL = """
+CREATE TABLE IF NOT EXISTS "replication_state" (
+    "table_name" TEXT PRIMARY KEY,
+    "high_water_mark" BIGINT NOT NULL,
+    "updated_at" TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+def get_db_engine(db_type="origin", pool_size=None):
     """
-    Crea y devuelve un motor de SQLAlchemy para la base de datos especificada.
+    Devuelve el motor de SQLAlchemy (compartido y con pool) para la base de datos especificada.
     db_type: 'origin' para la DB local, 'cloud' para la DB en la nube.
+    pool_size: conexiones que se mantienen abiertas; por defecto una por tabla en paralelo más una.
     """
     if db_type == "origin":
         host = DB_ORIGIN_HOST
@@ -50,146 +151,990 @@ def get_db_engine(db_type="origin"):
     else:
         raise ValueError("db_type debe ser 'origin' o 'cloud'")
 
-    db_connection_str = f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{name}"
-    return create_engine(db_connection_str)
+    # Sin prepared statements: la carga masiva usa copy_expert, que es propio de psycopg2.
+    return get_engine(
+        f"replication_{db_type}", host, port, name, user, password,
+        pool_size=max(DB_POOL_SIZE, pool_size or REPLICATION_MAX_WORKERS + 1),
+        statement_timeout_ms=REPLICATION_STATEMENT_TIMEOUT_MS,
+        prepared_statements=False,
+    )
+
+def copy_dataframe_to_table(df, table_name, connection, schema='public'):
+    """
+    Carga un DataFrame en una tabla de PostgreSQL con COPY ... FROM STDIN (formato CSV).
+    Todas las filas viajan en un único flujo hacia el servidor en lugar de un INSERT por fila.
+    connection: conexión de SQLAlchemy; el commit queda a cargo de quien llama.
+    Retorna la cantidad de bytes enviados.
+    """
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    bytes_sent = buffer.tell()
+    buffer.seek(0)
+
+    columns = ", ".join(f'"{col}"' for col in df.columns)
+    copy_sql = f'COPY "{schema}"."{table_name}" ({columns}) FROM STDIN WITH (FORMAT csv)'
+
+    with connection.connection.cursor() as cursor:
+        cursor.copy_expert(copy_sql, buffer)
+    return bytes_sent
+
+def report_throughput(table_name, rows, elapsed, method):
+    """Imprime las filas cargadas y el rendimiento (filas/segundo) de una carga."""
+    rows_per_second = rows / elapsed if elapsed > 0 else float("inf")
+    print(f"'{table_name}': {rows} filas cargadas vía {method} en {elapsed:.2f}s ({rows_per_second:,.0f} filas/s).")
+
+def load_dataframe(df, table_name, engine, schema='public'):
+    """
+    Carga un DataFrame en la tabla destino según REPLICATION_LOAD_METHOD.
+    Con 'copy' usa COPY y, si falla, recurre a df.to_sql como alternativa.
+    Informa el rendimiento de la carga en filas por segundo.
+    """
+    if REPLICATION_LOAD_METHOD not in ("copy", "to_sql"):
+        raise ValueError("REPLICATION_LOAD_METHOD debe ser 'copy' o 'to_sql'")
+
+    method = REPLICATION_LOAD_METHOD
+    start_time = time.perf_counter()
+
+    with stage("load", table=table_name) as metrics:
+        if method == "copy":
+            try:
+                with engine.begin() as connection:
+                    metrics["bytes"] = copy_dataframe_to_table(df, table_name, connection, schema=schema)
+            except Exception as e:
+                print(f"COPY falló para '{table_name}' ({e}). Reintentando con to_sql...")
+                method = "to_sql"
+
+        if method == "to_sql":
+            df.to_sql(table_name, engine, if_exists='append', index=False, schema=schema)
+            metrics["bytes"] = df.memory_usage(index=False).sum()
+        metrics["rows"] = len(df)
+
+    report_throughput(table_name, len(df), time.perf_counter() - start_time, method)
+
+def create_merge_staging_table(connection, table_name, schema='public'):
+    """Crea la tabla temporal (se borra al hacer commit) donde se copian las filas a fusionar."""
+    staging_table = f"stage_{table_name}"
+    connection.execute(text(
+        f'CREATE TEMP TABLE "{staging_table}" (LIKE "{schema}"."{table_name}" INCLUDING DEFAULTS) ON COMMIT DROP'
+    ))
+    return staging_table
+
+def merge_staging_table(connection, table_name, pk, columns, schema='public', before_merge=None):
+    """
+    Fusiona la tabla temporal en la tabla destino con una sola sentencia INSERT ... ON CONFLICT:
+    las claves nuevas se insertan y las existentes se actualizan solo si cambiaron.
+    before_merge: función (connection, tabla temporal, schema) que se ejecuta justo antes del merge.
+    """
+    if before_merge:
+        before_merge(connection, f"stage_{table_name}", schema)
+
+    quoted_columns = [f'"{col}"' for col in columns]
+    non_key_columns = [col for col in columns if col != pk]
+    if non_key_columns:
+        assignments = ", ".join(f'"{col}" = EXCLUDED."{col}"' for col in non_key_columns)
+        current_values = ", ".join(f't."{col}"' for col in non_key_columns)
+        new_values = ", ".join(f'EXCLUDED."{col}"' for col in non_key_columns)
+        conflict_action = (
+            f"DO UPDATE SET {assignments} "
+            f"WHERE ({current_values}) IS DISTINCT FROM ({new_values})"
+        )
+    else:
+        conflict_action = "DO NOTHING"
+
+    connection.execute(text(
+        f'INSERT INTO "{schema}"."{table_name}" AS t ({", ".join(quoted_columns)}) '
+        f'SELECT {", ".join(quoted_columns)} FROM pg_temp."stage_{table_name}" '
+        f'ON CONFLICT ("{pk}") {conflict_action}'
+    ))
+
+def merge_dataframe(df, table_name, pk, connection, schema='public', before_merge=None):
+    """
+    Aplica un DataFrame sobre la tabla destino con INSERT ... ON CONFLICT (upsert).
+    Las filas se copian primero con COPY a una tabla temporal y luego se fusionan en una sola
+    sentencia: las claves nuevas se insertan y las existentes se actualizan solo si cambiaron.
+    connection: conexión de SQLAlchemy dentro de una transacción abierta por quien llama.
+    """
+    start_time = time.perf_counter()
+    with stage("merge", table=table_name) as metrics:
+        staging_table = create_merge_staging_table(connection, table_name, schema)
+        metrics["bytes"] = copy_dataframe_to_table(df, staging_table, connection, schema='pg_temp')
+        merge_staging_table(connection, table_name, pk, list(df.columns), schema, before_merge)
+        metrics["rows"] = len(df)
+    report_throughput(table_name, len(df), time.perf_counter() - start_time, "merge")
+
+def create_state_table(cloud_engine):
+    """Crea la tabla de estado de la replicación incremental si no existe."""
+    with cloud_engine.begin() as connection:
+        connection.execute(text(REPLICATION_STATE_DDL))
+
+def get_high_water_marks(cloud_engine):
+    """Devuelve un diccionario {tabla: high-water mark} con el estado guardado en la nube."""
+    with cloud_engine.connect() as connection:
+        rows = connection.execute(text('SELECT "table_name", "high_water_mark" FROM "replication_state"'))
+        return {table_name: high_water_mark for table_name, high_water_mark in rows}
+
+def save_high_water_mark(connection, table_name, high_water_mark):
+    """Guarda (upsert) la high-water mark de una tabla dentro de la transacción recibida."""
+    connection.execute(
+        text(
+            'INSERT INTO "replication_state" ("table_name", "high_water_mark", "updated_at") '
+            'VALUES (:table_name, :high_water_mark, CURRENT_TIMESTAMP) '
+            'ON CONFLICT ("table_name") DO UPDATE SET '
+            '"high_water_mark" = EXCLUDED."high_water_mark", "updated_at" = EXCLUDED."updated_at"'
+        ),
+        {"table_name": table_name, "high_water_mark": int(high_water_mark)}
+    )
 
-def replicate_data():
+def get_origin_current_xid(origin_engine):
+    """
+    Devuelve el próximo id de transacción (32 bits) del origen, comparable con xmin.
+    Si es menor que una high-water mark guardada, el contador dio la vuelta (wraparound)
+    y las marcas de agua dejan de ser válidas.
+    """
+    with origin_engine.connect() as connection:
+        return connection.execute(
+            text("SELECT txid_snapshot_xmax(txid_current_snapshot()) % 4294967296")
+        ).scalar()
+
+def build_extract_query(select_sql, since_xmin=None, key_range=None):
+    """
+    Agrega al SELECT de extracción los filtros de la corrida: filas con xmin posterior a since_xmin
+    y/o dentro del rango [desde, hasta) de key_range = (columna, desde, hasta).
+    Retorna (consulta con parámetros :nombre, parámetros).
+    """
+    query = select_sql
+    conditions = []
+    params = {}
+    if since_xmin is not None:
+        conditions.append('xmin::text::bigint > :since_xmin')
+        params["since_xmin"] = int(since_xmin)
+    if key_range is not None:
+        key_column, lower, upper = key_range
+        if lower is not None:
+            conditions.append(f'"{key_column}" >= :range_lower')
+            params["range_lower"] = lower
+        if upper is not None:
+            conditions.append(f'"{key_column}" < :range_upper')
+            params["range_upper"] = upper
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    return query, params
+
+def extract_table_chunks(table_name, origin_engine, since_xmin=None, chunk_size=REPLICATION_CHUNK_SIZE, key_range=None):
+    """
+    Extrae una tabla del origen en bloques de chunk_size filas, junto con el xmin de cada fila
+    (columna '_xmin'). Usa un cursor con nombre (del lado del servidor), así que solo un bloque
+    vive en memoria a la vez.
+    since_xmin: si se indica, solo se extraen las filas insertadas o modificadas después de esa marca.
+    key_range: tupla (columna, desde, hasta) para extraer solo el rango [desde, hasta) de la clave;
+    un extremo None deja el rango abierto de ese lado.
+    Nota: una transacción del origen que siga abierta durante la extracción y confirme después
+    con un xmin menor al registrado no será vista por la corrida incremental; '--full' la recupera.
+    """
+    query, params = build_extract_query(
+        f'SELECT *, xmin::text::bigint AS "_xmin" FROM "public"."{table_name}"', since_xmin, key_range
+    )
+
+    with origin_engine.connect() as connection:
+        connection = connection.execution_options(stream_results=True, max_row_buffer=chunk_size)
+        chunks = pd.read_sql_query(text(query), connection, params=params, chunksize=chunk_size)
+        while True:
+            # Se mide solo la lectura de cada bloque, no el tiempo que quien llama tarda en procesarlo
+            with stage("extract", table=table_name) as metrics:
+                df_chunk = next(chunks, None)
+                if df_chunk is not None:
+                    metrics["rows"] = len(df_chunk)
+                    metrics["bytes"] = df_chunk.memory_usage(index=False).sum()
+            if df_chunk is None:
+                return
+            yield df_chunk
+
+def transform_dataframe(df, table_name):
+    """
+    Castea en una sola pasada todas las columnas a los dtypes definidos en table_schemas
+    y calcula las columnas derivadas (por ejemplo 'MontoTotal').
+    """
+    with stage("transform", table=table_name) as metrics:
+        df = add_derived_columns(cast_dataframe(df, table_name), table_name)
+        metrics["rows"] = len(df)
+    return df
+
+def recreate_cloud_tables(cloud_engine):
+    """
+    Borra las tablas de la nube en orden inverso de dependencia y las vuelve a crear.
+    En la misma transacción se borran las high-water marks: si la recarga falla a medias, las
+    tablas que quedaron vacías no conservan la marca de la corrida anterior y la próxima corrida
+    incremental hace una recarga completa en lugar de saltearse sus filas.
+    """
+    print("\nBorrando tablas existentes en la base de datos de destino (en orden inverso de dependencia)...")
+    with cloud_engine.begin() as connection:
+        for table_info in reversed(tables_to_replicate):
+            print(f"Borrando tabla: {table_info['name']} (si existe)...")
+            # Usamos CASCADE para asegurar que las FKs se manejen si hay dependencias no esperadas
+            connection.execute(text(f'DROP TABLE IF EXISTS "{table_info["name"]}" CASCADE;'))
+        connection.execute(text(REPLICATION_STATE_DDL))
+        connection.execute(text('DELETE FROM "replication_state"'))
+    print("Tablas borradas/verificadas en el destino.")
+
+    create_cloud_tables(cloud_engine)
+
+def prepare_staging_schema(cloud_engine, staging_schema):
+    """
+    Crea de cero el esquema de staging con las tablas sin índices ni restricciones, para que la
+    carga masiva no pague el chequeo de PK, UNIQUE y FK fila por fila.
+    """
+    print(f"\nPreparando el esquema de staging '{staging_schema}' (tablas sin restricciones)...")
+    with cloud_engine.begin() as connection:
+        connection.execute(text(f'DROP SCHEMA IF EXISTS "{staging_schema}" CASCADE'))
+        connection.execute(text(f'CREATE SCHEMA "{staging_schema}"'))
+        for table_info in tables_to_replicate:
+            connection.execute(text(build_create_table_sql(table_info["name"], staging_schema, include_constraints=False)))
+    print("Esquema de staging preparado.")
+
+def add_staging_constraints(cloud_engine, staging_schema):
+    """
+    Crea las PK, UNIQUE y FK de las tablas de staging una vez cargadas, con un único ALTER TABLE
+    por tabla (construcción de índices en bloque), y actualiza sus estadísticas.
+    """
+    print(f"\nCreando restricciones e índices en '{staging_schema}'...")
+    for table_info in tables_to_replicate:
+        start_time = time.perf_counter()
+        with cloud_engine.begin() as connection, stage("add_constraints", table=table_info["name"]):
+            connection.execute(text(build_add_constraints_sql(table_info["name"], staging_schema)))
+            connection.execute(text(f'ANALYZE "{staging_schema}"."{table_info["name"]}"'))
+        print(f"Restricciones de '{table_info['name']}' creadas en {time.perf_counter() - start_time:.2f}s.")
+
+def swap_staging_tables(cloud_engine, staging_schema, high_water_marks):
+    """
+    Reemplaza las tablas de 'public' por las de staging en una única transacción corta:
+    borra las tablas actuales, mueve las nuevas a 'public' y guarda las high-water marks.
+    Los lectores solo quedan bloqueados durante este intercambio, nunca ven tablas vacías.
+    """
+    print("\nIntercambiando las tablas de staging con las de 'public'...")
+    start_time = time.perf_counter()
+    with cloud_engine.begin() as connection:
+        connection.execute(text("SET LOCAL lock_timeout = '30s'"))
+        for table_info in reversed(tables_to_replicate):
+            connection.execute(text(f'DROP TABLE IF EXISTS "public"."{table_info["name"]}" CASCADE'))
+        for table_info in tables_to_replicate:
+            connection.execute(text(f'ALTER TABLE "{staging_schema}"."{table_info["name"]}" SET SCHEMA "public"'))
+        connection.execute(text(f'DROP SCHEMA "{staging_schema}"'))
+        for table_name, high_water_mark in high_water_marks.items():
+            save_high_water_mark(connection, table_name, high_water_mark)
+    print(f"Intercambio completado en {(time.perf_counter() - start_time) * 1000:.0f} ms.")
+
+def create_cloud_tables(cloud_engine):
+    """Crea las tablas de la nube si no existen."""
+    print("\nCreando/verificando esquemas en la nube...")
+    with cloud_engine.begin() as connection:
+        for table_sql in tables_ddl:
+            print(f"Creando/verificando tabla en la nube: {table_sql.splitlines()[0].strip(' (')}")
+            connection.execute(text(table_sql))
+    print("Esquemas en la nube creados/verificados.")
+
+def replicate_table(table_info, origin_engine, cloud_engine, full_reload, since_xmin, chunk_size, partitions=1,
+                    schema='public', pushdown=False, before_merge=None):
+    """
+    Extrae, transforma y carga una tabla bloque por bloque: cada bloque se carga antes de
+    extraer el siguiente.
+    En recarga completa, las tablas grandes con "partition_key" se copian por rangos en paralelo.
+    schema: esquema de destino en la nube ('public' o el de staging en la carga en sombra).
+    pushdown: si es True, el transform se hace en el SELECT del origen y se copia COPY a COPY.
+    before_merge: función que se ejecuta en la transacción de cada merge incremental, antes de fusionar.
+    Retorna (filas replicadas, nueva high-water mark); guardar la marca queda a cargo de quien llama.
+    """
+    table_name = table_info["name"]
+
+    print(f"\nProcesando tabla: {table_name}")
+    if full_reload and should_partition(table_info, origin_engine, partitions):
+        return replicate_table_partitioned(
+            table_info, origin_engine, cloud_engine, partitions, chunk_size, schema, pushdown
+        )
+
+    if pushdown:
+        print(f"Copiando '{table_name}' con el transform resuelto en el origen (pushdown)...")
+        return replicate_table_pushdown(
+            table_info, origin_engine, cloud_engine, full_reload, since_xmin, schema, before_merge=before_merge
+        )
+
+    if since_xmin is None:
+        print(f"Extrayendo todas las filas de '{table_name}' (origen) en bloques de {chunk_size} filas...")
+    else:
+        print(f"Extrayendo filas de '{table_name}' modificadas después de xmin={since_xmin} (origen) en bloques de {chunk_size} filas...")
+
+    total_rows = 0
+    new_high_water_mark = since_xmin or 0
+    for chunk_number, df in enumerate(extract_table_chunks(table_name, origin_engine, since_xmin, chunk_size), start=1):
+        if df.empty:
+            continue
+        new_high_water_mark = max(new_high_water_mark, int(df.pop("_xmin").max()))
+        df = transform_dataframe(df, table_name)
+
+        if full_reload:
+            load_dataframe(df, table_name, cloud_engine, schema=schema)
+        else:
+            # Un merge repetido es idempotente: si la corrida se interrumpe, la marca de
+            # agua no avanzó y los bloques ya aplicados se vuelven a fusionar sin duplicar.
+            with cloud_engine.begin() as connection:
+                merge_dataframe(df, table_name, table_info["pk"], connection, schema=schema, before_merge=before_merge)
+        total_rows += len(df)
+        print(f"'{table_name}' bloque {chunk_number}: {len(df)} filas procesadas (acumulado {total_rows}).")
+
+    if total_rows:
+        print(f"Datos de '{table_name}' cargados exitosamente en la nube ({total_rows} filas).")
+    else:
+        print(f"Sin cambios para '{table_name}'.")
+    return total_rows, new_high_water_mark
+
+class CountingWriter:
+    """Envuelve un archivo binario y cuenta los bytes escritos."""
+
+    def __init__(self, file):
+        self.file = file
+        self.bytes_written = 0
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        return self.file.write(data)
+
+    def close(self):
+        self.file.close()
+
+def render_query_literals(engine, query, params):
+    """Inserta los parámetros en la consulta como literales SQL (COPY (...) TO STDOUT no admite parámetros)."""
+    statement = text(query).bindparams(**params) if params else text(query)
+    return str(statement.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+
+def pipe_origin_to_cloud(origin_connection, cloud_connection, copy_to_sql, copy_from_sql):
+    """
+    Conecta un COPY ... TO STDOUT del origen con un COPY ... FROM STDIN de la nube a través de un
+    pipe del sistema operativo: un hilo escribe en el pipe lo que devuelve el origen y el hilo
+    actual lo envía a la nube. En memoria solo vive el buffer del pipe.
+    Si falla el origen, la excepción se propaga para que la transacción de la nube se revierta
+    (la nube habría recibido un flujo truncado); si falla la nube, cerrar el pipe corta al origen.
+    Retorna (filas copiadas, bytes transferidos).
+    """
+    read_fd, write_fd = os.pipe()
+    reader = os.fdopen(read_fd, 'rb')
+    writer = CountingWriter(os.fdopen(write_fd, 'wb'))
+    producer_errors = []
+
+    def produce():
+        try:
+            with origin_connection.connection.cursor() as cursor:
+                cursor.copy_expert(copy_to_sql, writer)
+        except Exception as e:
+            producer_errors.append(e)
+        finally:
+            try:
+                writer.close()
+            except OSError:
+                # La nube ya cerró el pipe (falló la carga): su error es el que se propaga
+                pass
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        with cloud_connection.connection.cursor() as cursor:
+            cursor.copy_expert(copy_from_sql, reader)
+            rows = cursor.rowcount
+    finally:
+        reader.close()
+        producer.join()
+    if producer_errors:
+        raise producer_errors[0]
+    return rows, writer.bytes_written
+
+def replicate_table_pushdown(table_info, origin_engine, cloud_engine, full_reload, since_xmin, schema='public',
+                             key_range=None, before_merge=None):
+    """
+    Copia una tabla con el transform resuelto en el origen: el SELECT generado desde table_schemas
+    castea cada columna y calcula "MontoTotal", y las filas tipadas pasan del COPY del origen al
+    COPY de la nube en formato binario, sin pandas de por medio.
+    En recarga completa se copia directo a la tabla destino; en incremental, a la tabla temporal
+    del merge, que luego se fusiona con INSERT ... ON CONFLICT.
+    La high-water mark se toma en la misma transacción REPEATABLE READ que el COPY, así que
+    corresponde exactamente a las filas copiadas.
+    Retorna (filas replicadas, nueva high-water mark).
+    """
+    table_name = table_info["name"]
+    columns = get_column_names(table_name)
+    query, params = build_extract_query(build_select_sql(table_name), since_xmin, key_range)
+    copy_to_sql = f"COPY ({render_query_literals(origin_engine, query, params)}) TO STDOUT WITH (FORMAT binary)"
+    xmin_query, _ = build_extract_query(
+        f'SELECT max(xmin::text::bigint) FROM "public"."{table_name}"', since_xmin, key_range
+    )
+    quoted_columns = ", ".join(f'"{col}"' for col in columns)
+
+    start_time = time.perf_counter()
+    with origin_engine.connect() as origin_connection:
+        origin_connection.execution_options(isolation_level="REPEATABLE READ")
+        with origin_connection.begin():
+            max_xmin = origin_connection.execute(text(xmin_query), params).scalar()
+            if max_xmin is None:
+                print(f"Sin cambios para '{table_name}'.")
+                return 0, since_xmin or 0
+
+            with cloud_engine.begin() as cloud_connection, stage("pushdown_copy", table=table_name) as metrics:
+                if full_reload:
+                    target = f'"{schema}"."{table_name}"'
+                else:
+                    target = f'pg_temp."{create_merge_staging_table(cloud_connection, table_name, schema)}"'
+                rows, bytes_sent = pipe_origin_to_cloud(
+                    origin_connection, cloud_connection, copy_to_sql,
+                    f"COPY {target} ({quoted_columns}) FROM STDIN WITH (FORMAT binary)"
+                )
+                metrics["rows"], metrics["bytes"] = rows, bytes_sent
+                if not full_reload:
+                    merge_staging_table(cloud_connection, table_name, table_info["pk"], columns, schema, before_merge)
+
+    report_throughput(table_name, rows, time.perf_counter() - start_time, f"pushdown COPY ({bytes_sent / 1024 / 1024:.1f} MB)")
+    return rows, max(since_xmin or 0, max_xmin)
+
+def count_rows(engine, table_name, estimate=False, schema='public'):
+    """
+    Cuenta las filas de una tabla. Con estimate=True usa la estadística del planificador
+    (pg_class.reltuples), que es inmediata, y solo cuenta de verdad si la tabla nunca fue analizada.
+    """
+    with engine.connect() as connection:
+        if estimate:
+            estimated_rows = connection.execute(
+                text("SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table_name AS regclass)"),
+                {"table_name": f'"{schema}"."{table_name}"'}
+            ).scalar()
+            if estimated_rows is not None and estimated_rows >= 0:
+                return estimated_rows
+        return connection.execute(text(f'SELECT COUNT(*) FROM "{schema}"."{table_name}"')).scalar()
+
+def should_partition(table_info, origin_engine, partitions):
+    """Indica si la tabla debe copiarse por rangos de clave en lugar de por el camino simple."""
+    if partitions <= 1 or not table_info.get("partition_key"):
+        return False
+    return count_rows(origin_engine, table_info["name"], estimate=True) >= REPLICATION_PARTITION_MIN_ROWS
+
+def get_partition_ranges(origin_engine, table_name, key_column, partitions):
+    """
+    Divide la tabla en hasta `partitions` rangos [desde, hasta) de key_column con cantidades de
+    filas similares, usando los percentiles de la clave calculados en el origen.
+    Retorna una lista de tuplas (desde, hasta); el primer y el último rango quedan abiertos (None).
+    """
+    fractions = [i / partitions for i in range(1, partitions)]
+    with origin_engine.connect() as connection:
+        boundaries = connection.execute(
+            text(
+                f'SELECT percentile_disc(CAST(:fractions AS float8[])) WITHIN GROUP (ORDER BY "{key_column}") '
+                f'FROM "public"."{table_name}"'
+            ),
+            {"fractions": fractions}
+        ).scalar() or []
+
+    # Con claves muy repetidas dos percentiles pueden coincidir: se descartan los límites duplicados
+    boundaries = sorted(set(boundary for boundary in boundaries if boundary is not None))
+    lowers = [None] + boundaries
+    uppers = boundaries + [None]
+    return list(zip(lowers, uppers))
+
+def replicate_partition(table_name, key_column, lower, upper, partition_number, partition_count, chunk_size,
+                        schema='public', pushdown=False):
+    """
+    Extrae, transforma y carga un rango [lower, upper) de la tabla. Se ejecuta en un proceso
+    del pool de particiones, por lo que abre (y cierra) sus propios motores.
+    Retorna (filas cargadas, mayor xmin visto).
+    """
+    origin_engine = get_db_engine("origin")
+    cloud_engine = get_db_engine("cloud")
+    try:
+        if pushdown:
+            return replicate_table_pushdown(
+                {"name": table_name}, origin_engine, cloud_engine, True, None, schema, key_range=(key_column, lower, upper)
+            )
+        rows = 0
+        max_xmin = 0
+        for df in extract_table_chunks(table_name, origin_engine, chunk_size=chunk_size, key_range=(key_column, lower, upper)):
+            if df.empty:
+                continue
+            max_xmin = max(max_xmin, int(df.pop("_xmin").max()))
+            df = transform_dataframe(df, table_name)
+            load_dataframe(df, table_name, cloud_engine, schema=schema)
+            rows += len(df)
+            print(f"'{table_name}' partición {partition_number}/{partition_count}: {rows} filas cargadas hasta ahora.")
+        return rows, max_xmin
+    finally:
+        dispose_engines()
+
+def replicate_table_partitioned(table_info, origin_engine, cloud_engine, partitions, chunk_size, schema='public',
+                                pushdown=False):
+    """
+    Copia una tabla grande dividiéndola en rangos de su "partition_key", cada uno extraído y
+    cargado en paralelo en un pool de procesos. Al terminar compara la cantidad de filas de la
+    nube contra la del origen para confirmar que la copia está completa.
+    Retorna (filas replicadas, nueva high-water mark).
+    """
+    table_name = table_info["name"]
+    key_column = table_info["partition_key"]
+    ranges = get_partition_ranges(origin_engine, table_name, key_column, partitions)
+    print(f"Copiando '{table_name}' en {len(ranges)} particiones por rango de '{key_column}'...")
+
+    start_time = time.perf_counter()
+    total_rows = 0
+    new_high_water_mark = 0
+    # Los procesos de las particiones no tienen corrida instrumentada: la copia se mide acá en conjunto.
+    # 'spawn' evita heredar por fork los hilos y conexiones abiertas del proceso principal
+    with stage("partitioned_copy", table=table_name) as metrics, \
+            ProcessPoolExecutor(max_workers=len(ranges), mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = {
+            executor.submit(
+                replicate_partition, table_name, key_column, lower, upper, number, len(ranges), chunk_size, schema,
+                pushdown
+            ): number
+            for number, (lower, upper) in enumerate(ranges, start=1)
+        }
+        for future in as_completed(futures):
+            rows, max_xmin = future.result()
+            total_rows += rows
+            new_high_water_mark = max(new_high_water_mark, max_xmin)
+            print(f"'{table_name}' partición {futures[future]}/{len(ranges)} completada ({rows} filas).")
+        metrics["rows"] = total_rows
+    report_throughput(table_name, total_rows, time.perf_counter() - start_time, f"{len(ranges)} particiones")
+
+    origin_rows = count_rows(origin_engine, table_name)
+    cloud_rows = count_rows(cloud_engine, table_name, schema=schema)
+    if origin_rows != cloud_rows:
+        raise RuntimeError(
+            f"La copia particionada de '{table_name}' está incompleta: {cloud_rows} filas en la nube "
+            f"vs {origin_rows} en el origen."
+        )
+    print(f"Verificación de '{table_name}': {cloud_rows} filas en la nube, igual que en el origen.")
+    return total_rows, new_high_water_mark
+
+def get_key_type(engine, table_name, key_column):
+    """Devuelve el tipo SQL de una columna (por ejemplo 'integer' o 'character varying(50)')."""
+    with engine.connect() as connection:
+        return connection.execute(
+            text(
+                "SELECT format_type(atttypid, atttypmod) FROM pg_attribute "
+                "WHERE attrelid = CAST(:table_name AS regclass) AND attname = :column_name"
+            ),
+            {"table_name": f'public."{table_name}"', "column_name": key_column}
+        ).scalar()
+
+def build_key_sql(key_column, key_type, alias="t"):
+    """
+    Expresión SQL de la clave con la que se ordenan y filtran los rangos. Una clave de texto lleva
+    COLLATE "C": el orden por bytes es el mismo en el origen y en la nube, aunque sus collations
+    difieran, así los límites calculados de un lado parten igual las filas del otro. Si la columna
+    se declaró con collation "C" (table_schemas), la condición del rango usa el índice de la PK.
+    """
+    key_sql = f'{alias}."{key_column}"'
+    if key_type and key_type.split("(")[0].strip().lower() in TEXT_KEY_TYPES:
+        key_sql += ' COLLATE "C"'
+    return key_sql
+
+def build_range_condition(key_sql, lower, upper):
+    """Arma la condición SQL (y sus parámetros) del rango [lower, upper) de la clave; None = abierto."""
+    conditions = ["TRUE"]
+    params = {}
+    if lower is not None:
+        conditions.append(f'{key_sql} >= :range_lower')
+        params["range_lower"] = lower
+    if upper is not None:
+        conditions.append(f'{key_sql} < :range_upper')
+        params["range_upper"] = upper
+    return " AND ".join(conditions), params
+
+def build_row_hash_sql(columns, alias="t"):
+    """Expresión SQL con el md5 de una fila, calculado sobre las columnas indicadas."""
+    column_list = ", ".join(f'{alias}."{col}"' for col in columns)
+    return f"md5(ROW({column_list})::text)"
+
+def get_range_lower_bounds(engine, table_name, key_column, key_type, block_rows, lower=None, upper=None):
+    """
+    Parte el rango [lower, upper) de la tabla en bloques de block_rows filas consecutivas según
+    la clave y devuelve la clave inicial de cada bloque. El primer límite se reemplaza por lower
+    para que los rangos cubran todo el intervalo pedido.
+    """
+    key_sql = build_key_sql(key_column, key_type)
+    condition, params = build_range_condition(key_sql, lower, upper)
+    with engine.connect() as connection:
+        bounds = connection.execute(
+            text(
+                f'SELECT "{key_column}" FROM ('
+                f'  SELECT t."{key_column}", row_number() OVER (ORDER BY {key_sql}) - 1 AS position'
+                f'  FROM "public"."{table_name}" t WHERE {condition}'
+                f') numbered WHERE position % :block_rows = 0 ORDER BY position'
+            ),
+            {**params, "block_rows": block_rows}
+        ).scalars().all()
+    return [lower] + list(bounds[1:])
+
+def compute_range_hashes(engine, table_name, key_column, key_type, columns, lower_bounds, upper=None):
+    """
+    Calcula en SQL, para cada rango [lower_bounds[i], lower_bounds[i+1]) (el último hasta upper),
+    la cantidad de filas y un md5 de los hashes de sus filas ordenadas por la clave.
+    Una sola lectura del intervalo [lower_bounds[0], upper) (por índice si la clave tiene la
+    collation "C"): width_bucket asigna cada fila a su rango y se agrupa por rango, sin un join
+    entre rangos y filas. Solo viajan por la red los límites y un hash por rango, no los datos.
+    Retorna una lista de tuplas (filas, hash) en el orden de lower_bounds; un rango sin filas da
+    (0, None).
+    """
+    key_sql = build_key_sql(key_column, key_type)
+    condition, params = build_range_condition(key_sql, lower_bounds[0], upper)
+    with engine.connect() as connection:
+        rows = connection.execute(
+            text(
+                f'SELECT width_bucket({key_sql}, CAST(:thresholds AS {key_type}[])) AS bucket, count(*) AS row_count,'
+                f'       md5(string_agg({build_row_hash_sql(columns)}, \'\' ORDER BY {key_sql})) AS range_hash '
+                f'FROM "public"."{table_name}" t WHERE {condition} '
+                f'GROUP BY bucket'
+            ),
+            {**params, "thresholds": list(lower_bounds[1:])}
+        ).all()
+    hashes = [(0, None)] * len(lower_bounds)
+    for bucket, row_count, range_hash in rows:
+        hashes[bucket] = (row_count, range_hash)
+    return hashes
+
+def get_row_hashes(engine, table_name, key_column, key_type, columns, lower, upper):
+    """Devuelve {clave: md5 de la fila} para las filas del rango [lower, upper)."""
+    condition, params = build_range_condition(build_key_sql(key_column, key_type), lower, upper)
+    with engine.connect() as connection:
+        rows = connection.execute(
+            text(
+                f'SELECT t."{key_column}", {build_row_hash_sql(columns)} '
+                f'FROM "public"."{table_name}" t WHERE {condition}'
+            ),
+            params
+        ).all()
+    return dict(rows)
+
+def find_changed_keys(origin_engine, cloud_engine, table_name, key_column, key_type, columns, lower, upper,
+                      origin_rows, cloud_rows):
+    """
+    Busca recursivamente las claves distintas dentro de un rango cuyo hash no coincide.
+    Si el rango es chico se comparan los hashes fila por fila; si no, se subdivide en
+    REPLICATION_CHECKSUM_FANOUT rangos y solo se sigue bajando por los que difieren.
+    Retorna (claves a insertar/actualizar en la nube, claves a borrar de la nube).
+    """
+    if max(origin_rows, cloud_rows) <= REPLICATION_CHECKSUM_LEAF_ROWS:
+        origin_hashes = get_row_hashes(origin_engine, table_name, key_column, key_type, columns, lower, upper)
+        cloud_hashes = get_row_hashes(cloud_engine, table_name, key_column, key_type, columns, lower, upper)
+        keys_to_upsert = [key for key, row_hash in origin_hashes.items() if cloud_hashes.get(key) != row_hash]
+        keys_to_delete = [key for key in cloud_hashes if key not in origin_hashes]
+        return keys_to_upsert, keys_to_delete
+
+    # Los sub-rangos se arman sobre el lado con más filas, para que cada uno quede acotado
+    split_engine = origin_engine if origin_rows >= cloud_rows else cloud_engine
+    sub_block_rows = -(-max(origin_rows, cloud_rows) // max(2, REPLICATION_CHECKSUM_FANOUT))
+    lower_bounds = get_range_lower_bounds(split_engine, table_name, key_column, key_type, sub_block_rows, lower, upper)
+    upper_bounds = lower_bounds[1:] + [upper]
+
+    origin_hashes = compute_range_hashes(origin_engine, table_name, key_column, key_type, columns, lower_bounds, upper)
+    cloud_hashes = compute_range_hashes(cloud_engine, table_name, key_column, key_type, columns, lower_bounds, upper)
+
+    keys_to_upsert, keys_to_delete = [], []
+    for sub_lower, sub_upper, (sub_origin_rows, origin_hash), (sub_cloud_rows, cloud_hash) in zip(
+        lower_bounds, upper_bounds, origin_hashes, cloud_hashes
+    ):
+        if origin_hash == cloud_hash:
+            continue
+        sub_upsert, sub_delete = find_changed_keys(
+            origin_engine, cloud_engine, table_name, key_column, key_type, columns, sub_lower, sub_upper,
+            sub_origin_rows, sub_cloud_rows
+        )
+        keys_to_upsert += sub_upsert
+        keys_to_delete += sub_delete
+    return keys_to_upsert, keys_to_delete
+
+def sync_table_by_checksum(table_info, origin_engine, cloud_engine, chunk_size):
+    """
+    Sincroniza una tabla sin mover los datos que no cambiaron: compara hashes por rangos de la PK
+    entre origen y nube, baja recursivamente por los rangos distintos hasta encontrar las filas
+    exactas y aplica con merge solo esas filas.
+    Los borrados no se aplican acá (podrían violar FKs de tablas que todavía no se sincronizaron):
+    se devuelven para aplicarlos al final, en orden inverso de dependencia.
+    Retorna la lista de claves a borrar de la nube.
+    """
+    table_name = table_info["name"]
+    key_column = table_info["pk"]
+    columns = get_column_names(table_name, include_derived=False)
+    key_type = get_key_type(origin_engine, table_name, key_column)
+
+    print(f"\nComparando checksums de '{table_name}' por rangos de '{key_column}'...")
+    start_time = time.perf_counter()
+    with stage("checksum_compare", table=table_name) as metrics:
+        lower_bounds = get_range_lower_bounds(origin_engine, table_name, key_column, key_type, REPLICATION_CHECKSUM_BLOCK_ROWS)
+        upper_bounds = lower_bounds[1:] + [None]
+        origin_hashes = compute_range_hashes(origin_engine, table_name, key_column, key_type, columns, lower_bounds)
+        cloud_hashes = compute_range_hashes(cloud_engine, table_name, key_column, key_type, columns, lower_bounds)
+
+        keys_to_upsert, keys_to_delete = [], []
+        mismatched_ranges = 0
+        for lower, upper, (origin_rows, origin_hash), (cloud_rows, cloud_hash) in zip(
+            lower_bounds, upper_bounds, origin_hashes, cloud_hashes
+        ):
+            if origin_hash == cloud_hash:
+                continue
+            mismatched_ranges += 1
+            range_upsert, range_delete = find_changed_keys(
+                origin_engine, cloud_engine, table_name, key_column, key_type, columns, lower, upper, origin_rows, cloud_rows
+            )
+            keys_to_upsert += range_upsert
+            keys_to_delete += range_delete
+        metrics["rows"] = sum(rows for rows, _ in origin_hashes)
+
+    print(
+        f"'{table_name}': {mismatched_ranges}/{len(lower_bounds)} rangos distintos, "
+        f"{len(keys_to_upsert)} filas a insertar/actualizar y {len(keys_to_delete)} a borrar "
+        f"(comparación en {time.perf_counter() - start_time:.2f}s)."
+    )
+
+    for start in range(0, len(keys_to_upsert), chunk_size):
+        keys = keys_to_upsert[start:start + chunk_size]
+        with origin_engine.connect() as connection, stage("extract", table=table_name) as metrics:
+            df = pd.read_sql_query(
+                text(f'SELECT * FROM "public"."{table_name}" WHERE "{key_column}" = ANY(CAST(:keys AS {key_type}[]))'),
+                connection,
+                params={"keys": keys}
+            )
+            metrics["rows"] = len(df)
+            metrics["bytes"] = df.memory_usage(index=False).sum()
+        df = transform_dataframe(df, table_name)
+        with cloud_engine.begin() as connection:
+            merge_dataframe(df, table_name, key_column, connection, schema='public')
+
+    return keys_to_delete
+
+def apply_pending_deletes(cloud_engine, pending_deletes):
+    """Borra de la nube las claves que ya no existen en el origen, en orden inverso de dependencia."""
+    for table_info in reversed(tables_to_replicate):
+        keys = pending_deletes.get(table_info["name"]) or []
+        if not keys:
+            continue
+        key_type = get_key_type(cloud_engine, table_info["name"], table_info["pk"])
+        with cloud_engine.begin() as connection:
+            connection.execute(
+                text(
+                    f'DELETE FROM "public"."{table_info["name"]}" '
+                    f'WHERE "{table_info["pk"]}" = ANY(CAST(:keys AS {key_type}[]))'
+                ),
+                {"keys": keys}
+            )
+        print(f"'{table_info['name']}': {len(keys)} filas borradas en la nube (ya no existen en el origen).")
+
+def run_in_dependency_order(graph, task, max_workers):
+    """
+    Ejecuta task(tabla) para cada tabla del grafo en un pool de max_workers hilos.
+    Una tabla se lanza recién cuando terminaron todas sus dependencias; las tablas
+    independientes entre sí corren en paralelo. Si una tarea falla, no se lanzan más
+    tareas y la excepción se propaga al terminar las que estaban en curso.
+    Retorna un diccionario {tabla: resultado de task}.
+    """
+    pending = {table_name: set(dependencies) for table_name, dependencies in graph.items()}
+    results = {}
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            ready = [table_name for table_name, dependencies in pending.items() if dependencies <= results.keys()]
+            for table_name in ready:
+                del pending[table_name]
+                running[executor.submit(task, table_name)] = table_name
+
+            if not running:
+                raise ValueError(f"Dependencias circulares o tablas inexistentes en el grafo: {sorted(pending)}")
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                table_name = running.pop(future)
+                results[table_name] = future.result()
+    return results
+
+def replicate_data(full_reload=False, chunk_size=REPLICATION_CHUNK_SIZE, max_workers=REPLICATION_MAX_WORKERS,
+                   partitions=REPLICATION_PARTITIONS, shadow=REPLICATION_SHADOW_LOAD, checksum=False,
+                   pushdown=REPLICATION_PUSHDOWN, bi_aggregates=REPLICATION_BI_AGGREGATES):
     """
     Función principal para extraer datos de la DB origen, transformar y cargar en la DB destino.
+    full_reload=False (por defecto): modo incremental, solo se extraen las filas nuevas o modificadas
+    desde la última corrida y se fusionan en la nube con INSERT ... ON CONFLICT sobre la PK.
+    full_reload=True: se borran y recrean las tablas en la nube y se recargan completas.
+    chunk_size: filas por bloque de extracción/carga (acota la memoria usada).
+    max_workers: cantidad de tablas independientes que se replican en paralelo.
+    partitions: rangos de clave en que se copia en paralelo una tabla grande en recarga completa.
+    shadow: si es True, las recargas completas se arman en el esquema de staging sin restricciones,
+    que luego se crean en bloque, y se intercambian con 'public' en una transacción corta.
+    checksum: si es True, se comparan origen y nube por hashes de rangos de la PK y solo se copian
+    (y borran) las filas que difieren, sin depender de marcas de agua.
+    pushdown: si es True, los casteos y las columnas calculadas se resuelven en el SELECT del origen
+    y las filas se copian de COPY a COPY sin pasar por pandas (no aplica al modo checksum).
+    bi_aggregates: si es True, se mantienen las tablas de resumen para BI: se reconstruyen tras una
+    recarga completa, un checksum o un cambio en las dimensiones, y si no se actualizan solo con
+    las ventas fusionadas en la corrida.
+    Retorna el código de salida: 0, 1 si falló o RUN_LEDGER_REGRESSION_EXIT_CODE si la corrida fue
+    más lenta que las anteriores (ver common/run_ledger.py).
     """
     origin_engine = None
     cloud_engine = None
+    succeeded = False
+    error = None
+    mode = "checksum" if checksum else ("full" if full_reload else "incremental")
+    run = start_run("replication")
     try:
         print("Iniciando pipeline de replicación...")
 
-        origin_engine = get_db_engine("origin")
-        cloud_engine = get_db_engine("cloud")
-
-        # PASO 1: BORRAR TABLAS EXISTENTES EN LA NUBE EN ORDEN DE DEPENDENCIA INVERSA
-        print("\nBorrando tablas existentes en la base de datos de destino (en orden inverso de dependencia)...")
-        tables_to_drop_order = [
-            "fact_sales",
-            "dim_product",
-            "dim_customer_segment",
-            "dim_date"
-        ]
-        
-        with cloud_engine.connect() as connection:
-            with connection.begin():
-                for table_name in tables_to_drop_order:
-                    print(f"Borrando tabla: {table_name} (si existe)...")
-                    # Usamos CASCADE para asegurar que las FKs se manejen si hay dependencias no esperadas
-                    connection.execute(text(f'DROP TABLE IF EXISTS "{table_name}" CASCADE;'))
-        print("Tablas borradas/verificadas en el destino.")
-
-
-        # PASO 2: CREAR ESQUEMAS EN LA NUBE (Despues de borrar, recreamos limpiamente)
-        print("\nCreando/recreando esquemas en la nube...")
-        tables_ddl = [
-            """
-            CREATE TABLE IF NOT EXISTS "dim_date" (
-                "dateid" INT PRIMARY KEY,
-                "date" DATE NOT NULL UNIQUE,
-                "Year" INT,
-                "Quarter" INT,
-                "QuarterName" VARCHAR(20),
-                "Month" INT,
-                "Monthname" VARCHAR(20),
-                "Day" INT,
-                "Weekday" INT,
-                "WeekdayName" VARCHAR(15)
-            );
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS "dim_customer_segment" (
-                "Segmentid" INT PRIMARY KEY,
-                "City" VARCHAR(100) NOT NULL
-            );
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS "dim_product" (
-                "Productid" INT PRIMARY KEY,
-                "Producttype" VARCHAR(255) NOT NULL
-            );
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS "fact_sales" (
-                "Salesid" VARCHAR(50) PRIMARY KEY,
-                "Dateid" INT NOT NULL,
-                "Productid" INT NOT NULL,
-                "Segmentid" INT NOT NULL,
-                "Price_PerUnit" NUMERIC(10, 2) NOT NULL,
-                "QuantitySold" INT NOT NULL,
-                "MontoTotal" NUMERIC(10, 2),
-                FOREIGN KEY ("Productid") REFERENCES dim_product ("Productid"),
-                FOREIGN KEY ("Segmentid") REFERENCES dim_customer_segment ("Segmentid"),
-                FOREIGN KEY ("Dateid") REFERENCES dim_date ("dateid")
-            );
-            """
-        ]
-        
-        with cloud_engine.connect() as connection:
-            with connection.begin():
-                for table_sql in tables_ddl:
-                    print(f"Creando/verificando tabla en la nube: {table_sql.splitlines()[1].strip()}")
-                    connection.execute(text(table_sql))
-        print("Esquemas en la nube creados/verificados.")
-
-
-        # PASO 3: EXTRAER, TRANSFORMAR Y CARGAR (ETL) - CAMBIAR if_exists a 'append'
-        for table_info in tables_to_replicate:
-            table_name_origin = table_info["name"]
-            table_name_cloud = table_info["name"]
-
-            print(f"\nProcesando tabla: {table_name_origin}")
-
-            print(f"Extrayendo datos de '{table_name_origin}' (origen)...")
-            df = pd.read_sql_table(table_name_origin, origin_engine, schema='public')
-            print(f"Extraídas {len(df)} filas de '{table_name_origin}'.")
-
-            # --- Transformaciones (sin cambios) ---
-            if table_name_origin == "fact_sales":
-                df["MontoTotal"] = df["Price_PerUnit"] * df["QuantitySold"]
-                print(f"Columna 'MontoTotal' calculada para {table_name_cloud}.")
-            
-            # Ajustes de tipo de datos (sin cambios)
-            if table_name_origin == "dim_date":
-                df['date'] = pd.to_datetime(df['date'], errors='coerce').dt.date
-                for col in ['dateid', 'Year', 'Quarter', 'Month', 'Day', 'Weekday']:
-                    if col in df.columns:
-                        df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int64')
-            elif table_name_origin == "dim_customer_segment":
-                if 'Segmentid' in df.columns:
-                    df['Segmentid'] = pd.to_numeric(df['Segmentid'], errors='coerce').astype('Int64')
-            elif table_name_origin == "dim_product":
-                if 'Productid' in df.columns:
-                    df['Productid'] = pd.to_numeric(df['Productid'], errors='coerce').astype('Int64')
-            elif table_name_origin == "fact_sales":
-                if 'Dateid' in df.columns:
-                    df['Dateid'] = pd.to_numeric(df['Dateid'], errors='coerce').astype('Int64')
-                if 'Productid' in df.columns:
-                    df['Productid'] = pd.to_numeric(df['Productid'], errors='coerce').astype('Int64')
-                if 'Segmentid' in df.columns:
-                    df['Segmentid'] = pd.to_numeric(df['Segmentid'], errors='coerce').astype('Int64')
-
-
-            # Cargar datos en la base de datos destino (Nube)
-            print(f"Cargando {len(df)} filas en '{table_name_cloud}' (destino en la nube)...")
-
-            df.to_sql(table_name_cloud, cloud_engine, if_exists='append', index=False, schema='public')
-            print(f"Datos de '{table_name_cloud}' cargados exitosamente en la nube.")
+        # Un motor por base para toda la corrida: las tablas y bloques reutilizan las conexiones del pool
+        origin_engine = get_db_engine("origin", pool_size=max_workers + 1)
+        cloud_engine = get_db_engine("cloud", pool_size=max_workers + 1)
+
+        tables_by_name = {table_info["name"]: table_info for table_info in tables_to_replicate}
+        dependency_graph = get_dependency_graph()
+
+        if checksum:
+            print("Modo de replicación: DIFERENCIAL POR CHECKSUMS (solo se copian los rangos distintos).")
+            create_cloud_tables(cloud_engine)
+            pending_deletes = run_in_dependency_order(
+                dependency_graph,
+                lambda table_name: sync_table_by_checksum(tables_by_name[table_name], origin_engine, cloud_engine, chunk_size),
+                max_workers
+            )
+            apply_pending_deletes(cloud_engine, pending_deletes)
+            if bi_aggregates:
+                rebuild_aggregates(cloud_engine)
+        else:
+            create_state_table(cloud_engine)
+            high_water_marks = {} if full_reload else get_high_water_marks(cloud_engine)
+
+            if not full_reload:
+                if not high_water_marks:
+                    print("No hay estado de replicación previo en la nube. Se realizará una recarga completa.")
+                    full_reload = True
+                elif get_origin_current_xid(origin_engine) < max(high_water_marks.values()):
+                    print("El contador de transacciones del origen dio la vuelta (wraparound). Se realizará una recarga completa.")
+                    full_reload = True
+
+            shadow = shadow and full_reload
+            mode = "shadow" if shadow else ("full" if full_reload else "incremental")
+            # Sin tablas de resumen previas no hay sobre qué aplicar deltas: se construyen al final
+            incremental_aggregates = bi_aggregates and not full_reload and aggregates_exist(cloud_engine)
+            target_schema = REPLICATION_STAGING_SCHEMA if shadow else 'public'
+
+            if shadow:
+                print("Modo de replicación: COMPLETO EN SOMBRA (carga en staging + intercambio atómico).")
+                prepare_staging_schema(cloud_engine, target_schema)
+            elif full_reload:
+                print("Modo de replicación: COMPLETO (DROP + CREATE + carga total).")
+                recreate_cloud_tables(cloud_engine)
+            else:
+                print("Modo de replicación: INCREMENTAL (solo filas nuevas o modificadas).")
+                create_cloud_tables(cloud_engine)
+
+            # EXTRAER, TRANSFORMAR Y CARGAR (ETL) siguiendo el grafo de dependencias de las FKs:
+            # cada tabla arranca cuando terminaron todas las tablas a las que referencia.
+
+            rows_by_table = {}
+
+            def replicate_one(table_name):
+                since_xmin = None if full_reload else high_water_marks.get(table_name)
+                before_merge = before_merge_hooks.get(table_name) if incremental_aggregates else None
+                rows, new_high_water_mark = replicate_table(
+                    tables_by_name[table_name], origin_engine, cloud_engine, full_reload, since_xmin, chunk_size,
+                    partitions, target_schema, pushdown, before_merge
+                )
+                rows_by_table[table_name] = rows
+                # En la carga en sombra las marcas se guardan recién en el intercambio final
+                if not shadow:
+                    with cloud_engine.begin() as connection:
+                        save_high_water_mark(connection, table_name, new_high_water_mark)
+                return new_high_water_mark
+
+            new_high_water_marks = run_in_dependency_order(dependency_graph, replicate_one, max_workers)
+
+            if shadow:
+                add_staging_constraints(cloud_engine, target_schema)
+                swap_staging_tables(cloud_engine, target_schema, new_high_water_marks)
+
+            if bi_aggregates:
+                if not incremental_aggregates:
+                    rebuild_aggregates(cloud_engine)
+                elif any(rows_by_table.get(table_name) for table_name in DIMENSION_TABLES):
+                    # Un cambio en una dimensión puede mover ventas ya resumidas a otro grupo
+                    print("Hubo cambios en las dimensiones: se reconstruyen las tablas de resumen.")
+                    rebuild_aggregates(cloud_engine)
+                else:
+                    print("Tablas de resumen para BI actualizadas con las ventas de esta corrida.")
 
+        succeeded = True
         print("\n¡Pipeline de replicación completado exitosamente!")
 
     except Exception as e:
+        error = str(e)
         print(f"\nERROR en el pipeline de replicación: {e}")
         # Considerar un logging más robusto aquí en un entorno real.
     finally:
+        # Filas y bytes efectivamente escritos en la nube, por tabla
+        rows_by_table, bytes_moved = run.get_stage_totals(("load", "merge", "pushdown_copy", "partitioned_copy"))
+        exit_code = record_run(
+            cloud_engine, run, f"{mode}+pushdown" if pushdown and not checksum else mode, succeeded,
+            rows_by_table, bytes_moved, error
+        )
         if origin_engine:
+            report_pool_stats(origin_engine, "origen")
             origin_engine.dispose()
         if cloud_engine:
+            report_pool_stats(cloud_engine, "nube")
             cloud_engine.dispose()
         print("Conexiones a bases de datos cerradas.")
+        run.finish(succeeded)
+    return exit_code
 
 if __name__ == "__main__":
-    replicate_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Replica las tablas de la DB origen en la DB en la nube.")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Fuerza una recarga completa (DROP + CREATE + carga total) en lugar del modo incremental."
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=REPLICATION_CHUNK_SIZE,
+        help=f"Filas por bloque de extracción y carga (por defecto {REPLICATION_CHUNK_SIZE})."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=REPLICATION_MAX_WORKERS,
+        help=f"Tablas independientes replicadas en paralelo (por defecto {REPLICATION_MAX_WORKERS})."
+    )
+    parser.add_argument(
+        "--partitions",
+        type=int,
+        default=REPLICATION_PARTITIONS,
+        help=f"Rangos de clave para copiar en paralelo las tablas grandes en recarga completa (por defecto {REPLICATION_PARTITIONS}; 1 lo desactiva)."
+    )
+    parser.add_argument(
+        "--shadow",
+        action="store_true",
+        help="Recarga completa en un esquema de staging sin restricciones, intercambiado con 'public' al final (implica --full)."
+    )
+    parser.add_argument(
+        "--checksum",
+        action="store_true",
+        help="Compara origen y nube por hashes de rangos de la PK y copia solo las filas distintas."
+    )
+    parser.add_argument(
+        "--pushdown",
+        action="store_true",
+        help="Resuelve casteos y columnas calculadas en el SELECT del origen y copia de COPY a COPY, sin pandas."
+    )
+    args = parser.parse_args()
+    if args.checksum and (args.full or args.shadow):
+        parser.error("--checksum no se puede combinar con --full ni --shadow")
+    sys.exit(replicate_data(
+        full_reload=args.full or args.shadow,
+        chunk_size=args.chunk_size,
+        max_workers=args.workers,
+        partitions=args.partitions,
+        shadow=args.shadow or REPLICATION_SHADOW_LOAD,
+        checksum=args.checksum,
+        pushdown=args.pushdown or REPLICATION_PUSHDOWN
+    ))
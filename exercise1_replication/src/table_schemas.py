@@ -0,0 +1,366 @@
+"""
+Registro declarativo de las tablas del modelo estrella de ventas.
+
+Cada tabla se define una sola vez (columnas con su tipo SQL, PK, UNIQUE, FKs y columnas
+calculadas) y de esa definición se generan el DDL de origen y destino, los dtypes para leer
+los CSV y el casteo vectorizado de los DataFrames. Lo usan create_origin_db.py,
+load_origin_data.py y replication_pipeline.py.
+"""
+import operator
+import re
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+import pandas as pd
+
+# pyarrow es opcional: si está instalado los DataFrames usan dtypes respaldados por Arrow
+# (más compactos y sin objetos de Python por celda); si no, los dtypes nullable de pandas.
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    ARROW_AVAILABLE = True
+except ImportError:
+    ARROW_AVAILABLE = False
+
+# Tipo base SQL -> dtype de pandas (con y sin pyarrow). NUMERIC no está: es un decimal con la
+# precisión y escala declaradas (ver pandas_dtype), nunca un float binario, para que los montos
+# no cambien de valor al pasar por el DataFrame.
+ARROW_DTYPES = {
+    "INT": "int32[pyarrow]",
+    "VARCHAR": "string[pyarrow]",
+    "DATE": "date32[pyarrow]",
+}
+PANDAS_DTYPES = {
+    "INT": "Int32",
+    "VARCHAR": "string",
+    "DATE": "datetime64[ns]",
+}
+# NUMERIC sin precisión declarada: el máximo de decimal128
+DEFAULT_NUMERIC_PRECISION_SCALE = (38, 10)
+# Decimal intermedio para leer y redondear sin perder dígitos antes de ajustar a NUMERIC(p, s)
+WIDE_DECIMAL_PRECISION_SCALE = (76, 38)
+# Decimal en el que se leen las columnas object con valores Decimal (los que devuelve psycopg2)
+OBJECT_DECIMAL_PRECISION_SCALE = (38, 18)
+# Texto que se acepta como número decimal (con signo y exponente opcionales) y como entero
+DECIMAL_TEXT_PATTERN = r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$"
+INTEGER_TEXT_PATTERN = r"^[+-]?\d+$"
+
+# Operadores de las columnas calculadas: su SQL y la función que aplica el mismo cálculo a Series
+DERIVED_OPERATORS = {"+": operator.add, "-": operator.sub, "*": operator.mul}
+
+# Definición de las tablas, en orden de dependencia (IMPORTANTE para FKs).
+# Nombres de tabla y columna exactos (case-sensitive) como están en los CSV y en la DB.
+# "derived": columna calculada por el pipeline, (operador, columnas): el operador de
+# DERIVED_OPERATORS aplicado en orden a otras columnas de la fila. No viene en el CSV y no se
+# compara contra el origen.
+TABLE_SCHEMAS = [
+    {
+        "name": "dim_date",
+        "file_name": "DimDate.csv",
+        "columns": [
+            {"name": "dateid", "type": "INT", "nullable": False},
+            {"name": "date", "type": "DATE", "nullable": False},
+            {"name": "Year", "type": "INT"},
+            {"name": "Quarter", "type": "INT"},
+            {"name": "QuarterName", "type": "VARCHAR(20)"},
+            {"name": "Month", "type": "INT"},
+            {"name": "Monthname", "type": "VARCHAR(20)"},
+            {"name": "Day", "type": "INT"},
+            {"name": "Weekday", "type": "INT"},
+            {"name": "WeekdayName", "type": "VARCHAR(15)"},
+        ],
+        "primary_key": "dateid",
+        "unique": ["date"],
+        "foreign_keys": [],
+    },
+    {
+        "name": "dim_customer_segment",
+        "file_name": "DimCustomerSegment.csv",
+        "columns": [
+            {"name": "Segmentid", "type": "INT", "nullable": False},
+            {"name": "City", "type": "VARCHAR(100)", "nullable": False},
+        ],
+        "primary_key": "Segmentid",
+        "unique": [],
+        "foreign_keys": [],
+    },
+    {
+        "name": "dim_product",
+        "file_name": "DimProduct.csv",
+        "columns": [
+            {"name": "Productid", "type": "INT", "nullable": False},
+            {"name": "Producttype", "type": "VARCHAR(255)", "nullable": False},
+        ],
+        "primary_key": "Productid",
+        "unique": [],
+        "foreign_keys": [],
+    },
+    {
+        "name": "fact_sales",
+        "file_name": "FactSales.csv",
+        "columns": [
+            # Salesid es String (ej. S1001). Collation "C" (orden por bytes): los rangos de la
+            # sincronización por checksums se comparan en ese orden y así pueden usar la PK
+            {"name": "Salesid", "type": "VARCHAR(50)", "nullable": False, "collation": "C"},
+            {"name": "Dateid", "type": "INT", "nullable": False},
+            {"name": "Productid", "type": "INT", "nullable": False},
+            {"name": "Segmentid", "type": "INT", "nullable": False},
+            {"name": "Price_PerUnit", "type": "NUMERIC(10, 2)", "nullable": False},
+            {"name": "QuantitySold", "type": "INT", "nullable": False},
+            {"name": "MontoTotal", "type": "NUMERIC(10, 2)", "derived": ("*", ("Price_PerUnit", "QuantitySold"))},
+        ],
+        "primary_key": "Salesid",
+        "unique": [],
+        "foreign_keys": [
+            {"column": "Productid", "references": "dim_product", "referenced_column": "Productid"},
+            {"column": "Segmentid", "references": "dim_customer_segment", "referenced_column": "Segmentid"},
+            {"column": "Dateid", "references": "dim_date", "referenced_column": "dateid"},
+        ],
+    },
+]
+
+SCHEMAS_BY_NAME = {table["name"]: table for table in TABLE_SCHEMAS}
+
+def get_table_schema(table_name):
+    """Devuelve la definición registrada de una tabla."""
+    try:
+        return SCHEMAS_BY_NAME[table_name]
+    except KeyError:
+        raise ValueError(f"La tabla '{table_name}' no está definida en TABLE_SCHEMAS")
+
+def get_column_names(table_name, include_derived=True):
+    """Devuelve los nombres de columna de una tabla, opcionalmente sin las columnas calculadas."""
+    return [
+        column["name"] for column in get_table_schema(table_name)["columns"]
+        if include_derived or "derived" not in column
+    ]
+
+def get_derived_columns(table_name):
+    """Devuelve las columnas calculadas de una tabla (las que tienen 'derived')."""
+    return [column for column in get_table_schema(table_name)["columns"] if "derived" in column]
+
+def build_derived_sql(column):
+    """Expresión SQL de una columna calculada: ('*', ('a', 'b')) -> '"a" * "b"'."""
+    operator_sql, operands = column["derived"]
+    return f" {operator_sql} ".join(f'"{operand}"' for operand in operands)
+
+def get_dependency_graph():
+    """Devuelve {tabla: conjunto de tablas a las que referencia por FK}, en el orden del registro."""
+    return {
+        table["name"]: {fk["references"] for fk in table["foreign_keys"]} - {table["name"]}
+        for table in TABLE_SCHEMAS
+    }
+
+def base_sql_type(sql_type):
+    """Tipo SQL sin precisión ni longitud: 'NUMERIC(10, 2)' -> 'NUMERIC'."""
+    return re.match(r"\w+", sql_type).group(0).upper()
+
+def numeric_precision_scale(sql_type):
+    """Precisión y escala de un NUMERIC: 'NUMERIC(10, 2)' -> (10, 2)."""
+    match = re.search(r"\(\s*(\d+)\s*(?:,\s*(\d+)\s*)?\)", sql_type)
+    if not match:
+        return DEFAULT_NUMERIC_PRECISION_SCALE
+    return int(match.group(1)), int(match.group(2) or 0)
+
+def pandas_dtype(sql_type):
+    """
+    dtype de pandas para un tipo SQL del registro (Arrow si pyarrow está disponible). NUMERIC(p, s)
+    es decimal128(p, s) con pyarrow y, sin pyarrow, object con valores Decimal.
+    """
+    if base_sql_type(sql_type) == "NUMERIC":
+        return pd.ArrowDtype(pa.decimal128(*numeric_precision_scale(sql_type))) if ARROW_AVAILABLE else "object"
+    dtypes = ARROW_DTYPES if ARROW_AVAILABLE else PANDAS_DTYPES
+    return dtypes[base_sql_type(sql_type)]
+
+def build_column_definitions(table_name):
+    """Definiciones de columna del DDL (nombre, tipo, collation y NOT NULL), sin restricciones de tabla."""
+    definitions = []
+    for column in get_table_schema(table_name)["columns"]:
+        definition = f'"{column["name"]}" {column["type"]}'
+        if column.get("collation"):
+            definition += f' COLLATE "{column["collation"]}"'
+        if not column.get("nullable", True):
+            definition += " NOT NULL"
+        definitions.append(definition)
+    return definitions
+
+def build_constraint_definitions(table_name, schema='public'):
+    """Restricciones de la tabla (PK, UNIQUE y FKs); las FKs apuntan a tablas del mismo esquema."""
+    table = get_table_schema(table_name)
+    constraints = [f'PRIMARY KEY ("{table["primary_key"]}")']
+    constraints += [f'UNIQUE ("{column}")' for column in table["unique"]]
+    constraints += [
+        f'FOREIGN KEY ("{fk["column"]}") REFERENCES "{schema}"."{fk["references"]}" ("{fk["referenced_column"]}")'
+        for fk in table["foreign_keys"]
+    ]
+    return constraints
+
+def build_create_table_sql(table_name, schema='public', include_constraints=True):
+    """Genera el CREATE TABLE de una tabla, con o sin sus restricciones (PK, UNIQUE, FK)."""
+    definitions = build_column_definitions(table_name)
+    if include_constraints:
+        definitions += build_constraint_definitions(table_name, schema)
+    columns_sql = ",\n    ".join(definitions)
+    return f'CREATE TABLE IF NOT EXISTS "{schema}"."{table_name}" (\n    {columns_sql}\n);'
+
+def build_add_constraints_sql(table_name, schema):
+    """Genera un único ALTER TABLE que agrega todas las restricciones de la tabla en una pasada."""
+    additions = ", ".join(f"ADD {constraint}" for constraint in build_constraint_definitions(table_name, schema))
+    return f'ALTER TABLE "{schema}"."{table_name}" {additions};'
+
+def build_select_sql(table_name, schema='public'):
+    """
+    Genera el SELECT de extracción con el transform resuelto en SQL: cada columna casteada a su
+    tipo del registro y las columnas calculadas con su expresión 'derived'. Las filas salen con los mismos
+    tipos y el mismo orden de columnas que la tabla destino.
+    """
+    select_list = []
+    for column in get_table_schema(table_name)["columns"]:
+        source = build_derived_sql(column) if "derived" in column else f'"{column["name"]}"'
+        select_list.append(f'CAST({source} AS {column["type"]}) AS "{column["name"]}"')
+    return f'SELECT {", ".join(select_list)} FROM "{schema}"."{table_name}"'
+
+def get_csv_dtypes(table_name):
+    """
+    dtypes para pd.read_csv de las columnas que vienen en el CSV. Solo las VARCHAR se leen con su
+    dtype; números y fechas se leen como texto y cast_dataframe los convierte (un valor inválido
+    queda nulo en lugar de cortar la carga, y los NUMERIC no pasan por float).
+    """
+    return {
+        column["name"]: pandas_dtype("VARCHAR")
+        for column in get_table_schema(table_name)["columns"]
+        if "derived" not in column
+    }
+
+def raise_numeric_overflow(name, sql_type, count, example):
+    """Un monto que no entra en su NUMERIC no se carga como nulo: PostgreSQL lo rechazaría."""
+    raise ValueError(f"{count} valores de '{name}' no entran en {sql_type} (por ejemplo {example})")
+
+def to_decimal(value, precision, scale):
+    """
+    Decimal redondeado a 'scale' decimales (como NUMERIC de PostgreSQL), o None si el valor es
+    nulo o no es un número. No controla la precisión: eso lo hace quien llama.
+    """
+    if value is None or value is pd.NA or value != value:
+        return None
+    try:
+        number = Decimal(str(value).strip()).quantize(Decimal(1).scaleb(-scale), rounding=ROUND_HALF_UP)
+    except (InvalidOperation, ValueError):
+        return None
+    return number if number.is_finite() else None
+
+def decimal_values_to_arrow(series):
+    """
+    Array de Arrow (decimal, entero o texto) con los valores de una columna, sin pasar por float:
+    los float se leen por su representación decimal más corta ('1.005', no 1.00499...).
+    """
+    if isinstance(series.dtype, pd.ArrowDtype):
+        return pa.array(series.array)
+    if pd.api.types.is_integer_dtype(series.dtype):
+        return pa.array(series, from_pandas=True)
+    if series.dtype == object:
+        try:
+            # Los Decimal que devuelve psycopg2 se convierten en C, sin un str() por valor. Con el
+            # tipo explícito Arrow no infiere valor por valor; texto o más decimales caen al str()
+            return pa.array(series.to_numpy(), type=pa.decimal128(*OBJECT_DECIMAL_PRECISION_SCALE), from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            pass
+    return pa.array(series.astype("string[pyarrow]").array)
+
+def valid_text_or_null(values, pattern):
+    """Texto sin espacios en los bordes; el que no cumple 'pattern' queda nulo (como errors='coerce')."""
+    values = pc.utf8_trim_whitespace(values)
+    return pc.if_else(pc.match_substring_regex(values, pattern), values, pa.scalar(None, values.type))
+
+def cast_integer_arrow(series, dtype):
+    """INT vectorizado con Arrow; el texto que no es un entero queda nulo."""
+    if not pd.api.types.is_string_dtype(series.dtype):
+        return pd.to_numeric(series, errors='coerce').astype(dtype)
+    values = valid_text_or_null(pa.array(series.astype("string[pyarrow]").array), INTEGER_TEXT_PATTERN)
+    return pd.Series(pd.arrays.ArrowExtensionArray(values.cast(pa.int32())), index=series.index, name=series.name)
+
+def cast_numeric_arrow(series, sql_type):
+    """
+    NUMERIC(p, s) vectorizado con Arrow: el texto que no es un número queda nulo (como
+    errors='coerce'), se redondea a s decimales alejándose del cero (como PostgreSQL) y un valor
+    que no entra en p dígitos lanza ValueError.
+    """
+    precision, scale = numeric_precision_scale(sql_type)
+    values = decimal_values_to_arrow(series)
+    if pa.types.is_string(values.type) or pa.types.is_large_string(values.type):
+        values = valid_text_or_null(values, DECIMAL_TEXT_PATTERN)
+    try:
+        wide = values.cast(pa.decimal256(*WIDE_DECIMAL_PRECISION_SCALE))
+    except pa.ArrowInvalid as e:
+        raise ValueError(f"'{series.name}' tiene valores que no entran en {sql_type}: {e}")
+    rounded = pc.round(wide, ndigits=scale, round_mode="half_towards_infinity")
+    overflow = pc.greater_equal(pc.abs(rounded), pa.scalar(Decimal(10) ** (precision - scale), rounded.type))
+    overflow_count = pc.sum(overflow).as_py() or 0
+    if overflow_count:
+        example = rounded.filter(overflow)[0].as_py().quantize(Decimal(1).scaleb(-scale))
+        raise_numeric_overflow(series.name, sql_type, overflow_count, example)
+    return pd.Series(
+        pd.arrays.ArrowExtensionArray(rounded.cast(pa.decimal128(precision, scale))), index=series.index, name=series.name
+    )
+
+def cast_numeric_python(series, sql_type):
+    """NUMERIC(p, s) sin pyarrow: columna object con Decimal, valor por valor."""
+    precision, scale = numeric_precision_scale(sql_type)
+    values = [to_decimal(value, precision, scale) for value in series.tolist()]
+    overflow = [value for value in values if value is not None and value.adjusted() >= precision - scale]
+    if overflow:
+        raise_numeric_overflow(series.name, sql_type, len(overflow), overflow[0])
+    return pd.Series(values, index=series.index, dtype="object", name=series.name)
+
+def cast_series(series, sql_type):
+    """
+    Convierte una columna al dtype de su tipo SQL. Como los errors='coerce' del casteo original,
+    los valores que no se pueden convertir quedan nulos; un monto que no entra en su NUMERIC
+    lanza ValueError.
+    """
+    dtype = pandas_dtype(sql_type)
+    base_type = base_sql_type(sql_type)
+    if base_type == "NUMERIC":
+        return cast_numeric_arrow(series, sql_type) if ARROW_AVAILABLE else cast_numeric_python(series, sql_type)
+    if base_type == "INT":
+        if ARROW_AVAILABLE:
+            return cast_integer_arrow(series, dtype)
+        return pd.to_numeric(series, errors='coerce').astype(dtype)
+    if base_type == "DATE":
+        return pd.to_datetime(series, errors='coerce').astype(dtype)
+    return series.astype(dtype)
+
+def compute_derived(df, column):
+    """
+    Calcula una columna 'derived' con los operadores de pandas sobre las columnas del DataFrame
+    (df.eval no sirve: rechaza operandos decimal128).
+    """
+    operator_sql, operands = column["derived"]
+    result = df[operands[0]]
+    for operand in operands[1:]:
+        result = DERIVED_OPERATORS[operator_sql](result, df[operand])
+    return result
+
+def add_derived_columns(df, table_name):
+    """
+    Calcula las columnas con 'derived' (por ejemplo MontoTotal) sobre el DataFrame,
+    ya con el dtype de la columna. Conviene llamarla después de cast_dataframe.
+    """
+    for column in get_derived_columns(table_name):
+        df[column["name"]] = cast_series(compute_derived(df, column), column["type"])
+    return df
+
+def cast_dataframe(df, table_name):
+    """
+    Castea en una sola pasada las columnas del DataFrame a los dtypes del registro. Solo se
+    convierten las columnas cuyo dtype difiere (las NUMERIC sin pyarrow, de dtype object, se
+    convierten siempre); el resto no se copia.
+    """
+    converted = {}
+    for column in get_table_schema(table_name)["columns"]:
+        name = column["name"]
+        if name not in df.columns:
+            continue
+        dtype = pd.api.types.pandas_dtype(pandas_dtype(column["type"]))
+        if df[name].dtype != dtype or dtype == object:
+            converted[name] = cast_series(df[name], column["type"])
+    return df.assign(**converted) if converted else df
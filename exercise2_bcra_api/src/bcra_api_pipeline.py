@@ -1,8 +1,9 @@
+import io
 import requests
-import pandas as pd
-from datetime import datetime, timedelta
-from sqlalchemy import create_engine, text
+from datetime import date, datetime
+from sqlalchemy import text
 import os
+import sys
 from dotenv import load_dotenv
 
 # Cargar variables de entorno del archivo .env
@@ -10,6 +11,25 @@ current_dir = os.path.dirname(__file__)
 project_root = os.path.join(current_dir, '..', '..') # Dos niveles arriba para llegar a la raíz del repo
 load_dotenv(os.path.join(project_root, '.env'))
 
+# Capa de conexión compartida por los pipelines (common/ en la raíz del repo)
+sys.path.append(project_root)
+from common.db_connection import get_engine, report_pool_stats
+from common.instrumentation import stage, start_run
+from common.run_ledger import record_run
+
+from bcra_async_fetch import async_fetch_available, fetch_blocks_concurrently
+from bcra_cache import open_response_cache
+from bcra_columns import CotizacionesColumns
+from bcra_client import BCRAClient
+from bcra_planner import (
+    WindowPlanner,
+    create_no_data_table,
+    find_missing_ranges,
+    get_missing_days,
+    get_window_ranges,
+    mark_days_without_data,
+)
+
 # --- Credenciales y Configuraciones de la API del BCRA ---
 # NOTA: La API de Estadísticas Cambiarias NO REQUIERE TOKEN de autenticación según la documentación.
 # Sin embargo, lo mantendremos para consistencia con el .env si se necesita para otras APIs.
@@ -17,6 +37,21 @@ BCRA_API_TOKEN = os.getenv("BCRA_API_TOKEN") # Puede ser None o vacío, la API n
 BCRA_API_BASE_URL = os.getenv("BCRA_API_BASE_URL")
 BCRA_API_ENDPOINT_EVOLUCION_MONEDA = os.getenv("BCRA_API_ENDPOINT_EVOLUCION_MONEDA") # Endpoint para historial por moneda
 BCRA_API_COD_MONEDA = os.getenv("BCRA_API_COD_MONEDA") # Código ISO de la moneda (ej. 'USD')
+# Monedas a ingerir en la misma corrida (ej. 'USD,EUR,BRL'); por defecto solo BCRA_API_COD_MONEDA
+BCRA_API_COD_MONEDAS = [
+    moneda.strip() for moneda in os.getenv("BCRA_API_COD_MONEDAS", BCRA_API_COD_MONEDA or "").split(",") if moneda.strip()
+]
+# 'auto' elige la estrategia con menos peticiones; 'evolucion' (un rango por moneda) o 'fecha' (todas las monedas por día) la fuerzan
+BCRA_FETCH_STRATEGY = os.getenv("BCRA_FETCH_STRATEGY", "auto").lower()
+# Fecha más antigua para la mayoría de series del BCRA (inicio de la serie en la que se buscan huecos)
+BCRA_HISTORY_START_DATE = date.fromisoformat(os.getenv("BCRA_HISTORY_START_DATE", "2002-01-01"))
+BCRA_API_PAGE_LIMIT = int(os.getenv("BCRA_API_PAGE_LIMIT", "1000")) # Máximo 'limit' por página según la documentación
+BCRA_API_HEADERS = {
+    # Esta API no requiere token, pero podemos enviar un User-Agent básico
+    "User-Agent": "Mozilla/5.0 (compatible; BCRA_Data_Engineer_Challenge/1.0)",
+}
+# Descarga concurrente de las ventanas (requiere aiohttp; si no, se descarga en secuencia)
+BCRA_ASYNC_FETCH = os.getenv("BCRA_ASYNC_FETCH", "true").lower() == "true"
 
 # --- Credenciales para la Base de Datos de Destino (Supabase) ---
 DB_CLOUD_HOST = os.getenv("DB_CLOUD_HOST")
@@ -27,61 +62,219 @@ DB_CLOUD_PASSWORD = os.getenv("DB_CLOUD_PASSWORD")
 
 # --- Configuración de la Base de Datos ---
 def get_cloud_db_engine():
-    """Crea y devuelve un motor de SQLAlchemy para la base de datos en la nube."""
-    db_connection_str = f"postgresql+psycopg2://{DB_CLOUD_USER}:{DB_CLOUD_PASSWORD}@{DB_CLOUD_HOST}:{DB_CLOUD_PORT}/{DB_CLOUD_NAME}"
-    return create_engine(db_connection_str)
+    """Devuelve el motor de SQLAlchemy (compartido y con pool) para la base de datos en la nube."""
+    return get_engine("bcra_cloud", DB_CLOUD_HOST, DB_CLOUD_PORT, DB_CLOUD_NAME, DB_CLOUD_USER, DB_CLOUD_PASSWORD)
 
 # --- Definición DDL de la tabla 'cotizaciones' ---
 COTIZACIONES_TABLE_DDL = """
 CREATE TABLE IF NOT EXISTS cotizaciones (
-    fecha DATE PRIMARY KEY,
+    fecha DATE NOT NULL,
     moneda TEXT NOT NULL,
     tipo_cambio NUMERIC(10, 4) NOT NULL,
     fuente TEXT NOT NULL DEFAULT 'BCRA',
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (fecha, moneda)
 );
 """
 
-def create_cotizaciones_table(engine):
+# Columnas de la clave primaria actual de 'cotizaciones'
+COTIZACIONES_PRIMARY_KEY_QUERY = """
+SELECT c.conname, array_agg(a.attname::text ORDER BY a.attname)
+FROM pg_constraint c
+JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = ANY(c.conkey)
+WHERE c.conrelid = 'cotizaciones'::regclass AND c.contype = 'p'
+GROUP BY c.conname
+"""
+
+def create_cotizaciones_table(connection):
     """Crea la tabla 'cotizaciones' en la base de datos de destino si no existe."""
     print("Creando/Verificando la tabla 'cotizaciones' en la base de datos en la nube...")
-    with engine.connect() as connection:
-        with connection.begin():
-            connection.execute(text(COTIZACIONES_TABLE_DDL))
+    connection.execute(text(COTIZACIONES_TABLE_DDL))
+    migrate_cotizaciones_primary_key(connection)
+    create_no_data_table(connection)
+    connection.commit()
     print("Tabla 'cotizaciones' creada/verificada exitosamente.")
 
-def get_last_loaded_date(engine):
+# Tabla temporal de la sesión donde se copia cada bloque antes de fusionarlo (se vacía en cada commit)
+COTIZACIONES_STAGING_DDL = """
+CREATE TEMP TABLE IF NOT EXISTS stage_cotizaciones (
+    fecha DATE NOT NULL,
+    moneda TEXT NOT NULL,
+    tipo_cambio NUMERIC(10, 4) NOT NULL,
+    fuente TEXT NOT NULL
+) ON COMMIT DELETE ROWS
+"""
+
+# Upsert del bloque: inserta las cotizaciones nuevas y actualiza las existentes solo si cambió el
+# valor. xmax = 0 distingue las filas insertadas de las actualizadas; las que no cambiaron no vuelven.
+COTIZACIONES_MERGE_SQL = """
+WITH merged AS (
+    INSERT INTO cotizaciones AS t (fecha, moneda, tipo_cambio, fuente)
+    SELECT fecha, moneda, tipo_cambio, fuente FROM pg_temp.stage_cotizaciones
+    ON CONFLICT (fecha, moneda) DO UPDATE
+    SET tipo_cambio = EXCLUDED.tipo_cambio, fuente = EXCLUDED.fuente, updated_at = CURRENT_TIMESTAMP
+    WHERE (t.tipo_cambio, t.fuente) IS DISTINCT FROM (EXCLUDED.tipo_cambio, EXCLUDED.fuente)
+    RETURNING (xmax = 0) AS inserted
+)
+SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged
+"""
+
+def migrate_cotizaciones_primary_key(connection):
+    """
+    Las tablas creadas antes del modo multimoneda tienen 'fecha' sola como clave primaria, que
+    impide guardar dos monedas en el mismo día: se reemplaza por (fecha, moneda).
+    """
+    primary_key = connection.execute(text(COTIZACIONES_PRIMARY_KEY_QUERY)).first()
+    if primary_key is not None and list(primary_key[1]) == ['fecha']:
+        print("Migrando la clave primaria de 'cotizaciones' de (fecha) a (fecha, moneda)...")
+        connection.execute(text(
+            f'ALTER TABLE cotizaciones DROP CONSTRAINT "{primary_key[0]}", ADD PRIMARY KEY (fecha, moneda)'
+        ))
+
+def copy_to_staging_table(df, connection):
     """
-    Obtiene la última fecha registrada en la tabla 'cotizaciones'.
-    Retorna la fecha más reciente o None si la tabla está vacía.
+    Copia el DataFrame a la tabla temporal con COPY ... FROM STDIN (formato CSV), en un solo
+    flujo hacia el servidor. Retorna la cantidad de bytes enviados.
     """
-    query = text("SELECT MAX(fecha) FROM cotizaciones")
-    with engine.connect() as connection:
-        result = connection.execute(query).scalar()
-        return result
+    buffer = io.StringIO()
+    df[['fecha', 'moneda', 'tipo_cambio', 'fuente']].to_csv(buffer, index=False, header=False)
+    copy_sql = "COPY pg_temp.stage_cotizaciones (fecha, moneda, tipo_cambio, fuente) FROM STDIN WITH (FORMAT csv)"
+
+    cursor = connection.connection.cursor()
+    try:
+        if hasattr(cursor, "copy_expert"): # psycopg2
+            buffer.seek(0)
+            cursor.copy_expert(copy_sql, buffer)
+        else: # psycopg 3 (DB_PREPARED_STATEMENTS=true)
+            with cursor.copy(copy_sql) as copy:
+                copy.write(buffer.getvalue())
+    finally:
+        cursor.close()
+    return buffer.tell()
+
+def merge_cotizaciones_block(df, connection):
+    """
+    Carga un bloque de forma idempotente: COPY a la tabla temporal y un único
+    INSERT ... ON CONFLICT (fecha, moneda) DO UPDATE sobre 'cotizaciones', en una transacción.
+    Un bloque que se solapa con fechas ya cargadas (reintentos, cargas manuales, corridas que
+    fallaron a medias) no falla: se actualiza solo lo que cambió y se mantiene 'updated_at'.
+    Retorna (insertadas, actualizadas, sin cambios, bytes enviados).
+    """
+    connection.execute(text(COTIZACIONES_STAGING_DDL))
+    bytes_sent = copy_to_staging_table(df, connection)
+    inserted, updated = connection.execute(text(COTIZACIONES_MERGE_SQL)).one()
+    connection.commit()
+    return inserted, updated, len(df) - inserted - updated, bytes_sent
+
+def get_evolution_url(moneda=None):
+    """URL del endpoint de evolución de la moneda: api.bcra.gob.ar/estadisticascambiarias/v1.0/Cotizaciones/{moneda}"""
+    return f"{BCRA_API_BASE_URL}{BCRA_API_ENDPOINT_EVOLUCION_MONEDA}/{moneda or BCRA_API_COD_MONEDA}"
+
+def get_date_url():
+    """URL del endpoint de cotizaciones de todas las monedas en una fecha: .../Cotizaciones?fecha=YYYY-MM-DD"""
+    return f"{BCRA_API_BASE_URL}{BCRA_API_ENDPOINT_EVOLUCION_MONEDA}"
+
+# --- Estrategia de descarga ---
+def choose_fetch_strategy(evolution_requests, date_requests, currency_count):
+    """
+    Elige cómo pedir los huecos: 'evolucion' hace una consulta por moneda y ventana; 'fecha' hace
+    una consulta por día faltante que trae todas las monedas juntas. Se elige la que necesita
+    menos peticiones (BCRA_FETCH_STRATEGY la puede forzar): para cargas históricas gana
+    'evolucion', para pocos días y varias monedas gana 'fecha'.
+    """
+    if BCRA_FETCH_STRATEGY in ("evolucion", "fecha"):
+        return BCRA_FETCH_STRATEGY
+
+    strategy = "fecha" if date_requests < evolution_requests else "evolucion"
+    print(
+        f"Estrategia de descarga: '{strategy}' ({evolution_requests} peticiones por moneda "
+        f"vs {date_requests} por fecha para {currency_count} monedas)."
+    )
+    return strategy
+
+def get_block_requests(start_date_str, end_date_str, window_ranges, missing_ranges, strategy):
+    """
+    Peticiones [(url, params), ...] de una ventana. 'evolucion': un rango por moneda con huecos
+    en la ventana (window_ranges, {moneda: (desde, hasta)}). 'fecha': una petición por día hábil
+    que le falta a alguna moneda.
+    """
+    if strategy == "fecha":
+        return [
+            (get_date_url(), {"fecha": day_str})
+            for day_str in get_missing_days(start_date_str, end_date_str, missing_ranges)
+        ]
+    return [
+        (get_evolution_url(moneda), {"fechadesde": range_start.strftime('%Y-%m-%d'), "fechahasta": range_end.strftime('%Y-%m-%d')})
+        for moneda, (range_start, range_end) in window_ranges.items()
+    ]
+
+def combine_block_frames(batches, start_by_moneda, start_date_str, end_date_str):
+    """
+    Une en un solo DataFrame las cotizaciones (CotizacionesColumns) de todas las peticiones de un
+    bloque, para cargarlo de una vez. Se descartan las filas fuera del bloque, de monedas sin
+    huecos en él o anteriores al primer día pedido de cada moneda ({moneda: fecha}); el endpoint
+    por fecha devuelve todas las monedas, y en días sin cotización repite el día hábil anterior.
+    Retorna None si alguna petición del bloque falló.
+    """
+    if any(batch is None for batch in batches):
+        return None
+    block = CotizacionesColumns.concat(batches).select(
+        start_by_moneda, date.fromisoformat(start_date_str), date.fromisoformat(end_date_str)
+    )
+    with stage("to_dataframe") as metrics:
+        df = block.to_frame()
+        metrics["rows"] = len(df)
+    return df
+
+def fetch_blocks_sequentially(client, blocks, block_requests):
+    """Descarga los bloques de a uno (sin aiohttp o con BCRA_ASYNC_FETCH=false), a medida que se cargan."""
+    for (start_date_str, end_date_str), requests_in_block in zip(blocks, block_requests):
+        print(f"\nProcesando bloque de fechas: {start_date_str} a {end_date_str}")
+        batches = []
+        for url, params in requests_in_block:
+            if "fecha" in params:
+                batches.append(fetch_bcra_data_by_date(params["fecha"], client))
+            else:
+                batches.append(fetch_bcra_dolar_data_evolution(params["fechadesde"], params["fechahasta"], client, url))
+            if batches[-1] is None:
+                break
+        yield batches
+
+# --- Parseo de una página de la API ---
+def parse_cotizaciones_results(results, monedas=None):
+    """
+    Convierte los 'results' de una página de la API en buffers columnares (CotizacionesColumns,
+    ver bcra_columns.py) con fecha, moneda y tipo_cambio, sin pasar por un DataFrame por página.
+    Solo se toman los detalles de las monedas indicadas (por defecto BCRA_API_COD_MONEDAS); las
+    filas sin tipo de cambio numérico se descartan.
+    """
+    # 'results' es una lista de objetos 'CotizacionesFecha', cada uno con 'fecha' y la lista
+    # 'detalle' (de la que se toma 'tipoCotizacion'); el endpoint por fecha devuelve un solo objeto.
+    with stage("parse") as metrics:
+        batch = CotizacionesColumns.from_results(results, set(monedas or BCRA_API_COD_MONEDAS))
+        metrics["rows"] = len(batch)
+    return batch
 
 # --- Función para extraer datos de la API de Evolución de Moneda ---
-def fetch_bcra_dolar_data_evolution(start_date_str, end_date_str):
+def fetch_bcra_dolar_data_evolution(start_date_str, end_date_str, client=None, url=None):
     """
     Consume el endpoint de evolución de moneda del BCRA
     (/estadisticascambiarias/v1.0/Cotizaciones/{moneda})
     para obtener datos de cotización del dólar vendedor en un rango de fechas,
     manejando la paginación.
-    Retorna un DataFrame de Pandas.
+    client: BCRAClient a usar (sesión, reintentos y limitador compartidos); si no se indica, se crea uno.
+    url: endpoint de la moneda a consultar (por defecto el de BCRA_API_COD_MONEDA).
+    Retorna las cotizaciones como CotizacionesColumns (DataFrame con to_frame()), o None si la
+    consulta falló después de los reintentos.
     """
-    headers = {
-        # Esta API no requiere token, pero podemos enviar un User-Agent básico
-        "User-Agent": "Mozilla/5.0 (compatible; BCRA_Data_Engineer_Challenge/1.0)",
-    }
+    client = client or BCRAClient(headers=BCRA_API_HEADERS, cache=open_response_cache())
     
-    all_df_data = []
+    all_batches = []
     current_offset = 0
-    limit_per_request = 1000 # Max limit from documentation is 1000
+    limit_per_request = BCRA_API_PAGE_LIMIT
 
-    # Construir la URL del endpoint
-    # api.bcra.gob.ar/estadisticascambiarias/v1.0/Cotizaciones/{moneda}
-    url = f"{BCRA_API_BASE_URL}{BCRA_API_ENDPOINT_EVOLUCION_MONEDA}/{BCRA_API_COD_MONEDA}"
+    url = url or get_evolution_url()
     
     print(f"Consultando API BCRA: {url} para fechas desde {start_date_str} hasta {end_date_str}...")
 
@@ -95,144 +288,222 @@ def fetch_bcra_dolar_data_evolution(start_date_str, end_date_str):
 
         print(f"  Petición con offset={current_offset}, limit={limit_per_request} para rango {start_date_str} a {end_date_str}...")
         try:
-            response = requests.get(url, headers=headers, params=params, verify=False, timeout=60) # Aumentar timeout
-            response.raise_for_status() # Lanza una excepción para errores HTTP (4xx o 5xx)
-            api_response_json = response.json()
+            # Reintenta errores de conexión, 429 y 5xx; lanza HTTPError si se agotan los reintentos
+            api_response_json = client.get_json(url, params)
 
             if not api_response_json.get('results'):
                 print("  No se encontraron más datos para este rango o la respuesta es vacía.")
                 break # Salir del bucle de paginación
             
-            # Procesar los resultados: 'results' es una lista de objetos 'CotizacionesFecha'
-            # Cada uno tiene 'fecha' y 'detalle'. 'detalle' es una lista.
-            processed_records = []
-            for item in api_response_json['results']:
-                cotizacion_fecha = item.get('fecha')
-                detalles = item.get('detalle', [])
-                
-                # Buscar el tipo de cambio vendedor en el detalle
-                # La documentación del ejemplo para EUR muestra tipoPase como el valor principal.
-                # Para USD vendedor, asumiremos que tipoPase es el valor a extraer.
-                # Si hubiera múltiples detalles, se podría filtrar por descripcion="DOLAR VENDEDOR"
-                
-                if detalles:
-                    for detalle in detalles:
-                        if detalle.get('codigoMoneda') == BCRA_API_COD_MONEDA: # Asegurarse de que sea la moneda correcta si hay varias
-                            tipo_cambio_valor = detalle.get('tipoCotizacion')
-                            processed_records.append({
-                                'fecha': cotizacion_fecha,
-                                'moneda': BCRA_API_COD_MONEDA, # Guardar como 'USD'
-                                'tipo_cambio': tipo_cambio_valor,
-                                'fuente': 'BCRA'
-                            })
-                            break
-
-            if not processed_records:
-                print(f"  No se encontraron registros relevantes de '{BCRA_API_COD_MONEDA}' para este bloque.")
+            batch = parse_cotizaciones_results(api_response_json['results'])
+            if batch.empty:
+                print(f"  No se encontraron registros relevantes de '{url.rsplit('/', 1)[-1]}' para este bloque.")
                 break # Si no hay registros procesados, salir de paginación
-            
-            df_chunk = pd.DataFrame(processed_records)
-            
-            # Convertir 'fecha' a tipo DATE
-            df_chunk['fecha'] = pd.to_datetime(df_chunk['fecha']).dt.date
-            df_chunk['tipo_cambio'] = pd.to_numeric(df_chunk['tipo_cambio'], errors='coerce')
-            df_chunk = df_chunk.dropna(subset=['tipo_cambio'])
-
-            if df_chunk.empty:
-                print("  Chunk procesado vacío, terminando paginación.")
-                break
 
-            all_df_data.append(df_chunk)
+            all_batches.append(batch)
             
-            # Update offset for the next request
-            if len(df_chunk) < limit_per_request: 
+            # Update offset for the next request. Si la API recorta el 'limit' pedido, se avanza lo que
+            # realmente devolvió; la última página es la que completa metadata.resultset.count o, si
+            # la respuesta no lo trae, una página incompleta
+            current_offset += len(api_response_json['results'])
+            resultset = (api_response_json.get('metadata') or {}).get('resultset') or {}
+            if resultset.get('count') is not None:
+                if current_offset >= resultset['count']:
+                    break
+            elif len(api_response_json['results']) < min(limit_per_request, resultset.get('limit') or limit_per_request):
                 break
-            current_offset += limit_per_request
             
         except requests.exceptions.HTTPError as e:
             print(f"  Error HTTP al consultar la API (offset {current_offset}): {e.response.status_code} - {e.response.text}")
-            return pd.DataFrame()
+            return None
         except requests.exceptions.RequestException as e:
             print(f"  Error de conexión al consultar la API (offset {current_offset}): {e}")
-            return pd.DataFrame()
+            return None
         except Exception as e:
             print(f"  Error inesperado al procesar datos de la API (offset {current_offset}): {e}")
-            return pd.DataFrame()
+            return None
     
-    if not all_df_data:
+    if not all_batches:
         print("No se obtuvieron datos de cotizaciones después de procesar todas las fechas y paginaciones.")
-        return pd.DataFrame()
+        return CotizacionesColumns()
 
-    df = pd.concat(all_df_data, ignore_index=True)
-    
-    df = df[['fecha', 'moneda', 'tipo_cambio', 'fuente']] # Reorder final columns
+    # Las páginas se unen como arrays; el DataFrame se arma una vez por bloque, para la carga
+    batch = CotizacionesColumns.concat(all_batches)
     
-    print(f"Datos obtenidos de la API (total): {len(df)} registros.")
-    return df
+    print(f"Datos obtenidos de la API (total): {len(batch)} registros.")
+    return batch
+
+def fetch_bcra_data_by_date(date_str, client):
+    """
+    Consume el endpoint de cotizaciones por fecha (/estadisticascambiarias/v1.0/Cotizaciones?fecha=...),
+    que trae todas las monedas de un día en una sola respuesta.
+    Retorna las cotizaciones de las monedas de BCRA_API_COD_MONEDAS (CotizacionesColumns), o None si la consulta falló.
+    """
+    print(f"  Petición de todas las monedas para la fecha {date_str}...")
+    try:
+        api_response_json = client.get_json(get_date_url(), {"fecha": date_str})
+        return parse_cotizaciones_results(api_response_json.get('results') or [])
+    except requests.exceptions.HTTPError as e:
+        print(f"  Error HTTP al consultar la API (fecha {date_str}): {e.response.status_code} - {e.response.text}")
+    except requests.exceptions.RequestException as e:
+        print(f"  Error de conexión al consultar la API (fecha {date_str}): {e}")
+    except Exception as e:
+        print(f"  Error inesperado al procesar datos de la API (fecha {date_str}): {e}")
+    return None
+
+def plan_fetch_windows(planner, missing_ranges):
+    """
+    Arma las ventanas de descarga sobre los huecos ({moneda: [(desde, hasta, días), ...]}),
+    dimensionadas con lo observado en corridas anteriores (WindowPlanner), y sus peticiones
+    según la estrategia con menos consultas.
+    Retorna (ventanas [(desde, hasta)], rangos de cada ventana por moneda, peticiones de cada ventana).
+    """
+    if not missing_ranges:
+        return [], [], []
+    blocks = planner.plan_windows(missing_ranges)
+    window_ranges = [get_window_ranges(start_date_str, end_date_str, missing_ranges) for start_date_str, end_date_str in blocks]
+    strategy = choose_fetch_strategy(
+        sum(map(len, window_ranges)),
+        sum(len(get_missing_days(start_date_str, end_date_str, missing_ranges)) for start_date_str, end_date_str in blocks),
+        len(missing_ranges)
+    )
+    block_requests = [
+        get_block_requests(start_date_str, end_date_str, ranges, missing_ranges, strategy)
+        for (start_date_str, end_date_str), ranges in zip(blocks, window_ranges)
+    ]
+    print(f"Plan: {len(blocks)} ventanas de hasta {planner.window_months()} meses, {sum(map(len, block_requests))} consultas.")
+    return blocks, window_ranges, block_requests
+
+def fetch_windows(client, blocks, block_requests):
+    """
+    Descarga las ventanas: en paralelo con aiohttp si está disponible (y BCRA_ASYNC_FETCH), si no en secuencia.
+    Retorna, por ventana, la lista de cotizaciones de cada petición o None si la ventana falló.
+    """
+    if not blocks:
+        return []
+    if BCRA_ASYNC_FETCH and async_fetch_available():
+        return fetch_blocks_concurrently(client, block_requests, BCRA_API_PAGE_LIMIT, parse_cotizaciones_results)
+    return fetch_blocks_sequentially(client, blocks, block_requests)
 
 # --- Main pipeline function (run_bcra_pipeline) ---
 def run_bcra_pipeline():
     """
     Main function for the BCRA exchange rate extraction and loading pipeline.
-    It fetches historical data using the /estadisticascambiarias/v1.0/Cotizaciones/{moneda} endpoint.
+    It fetches historical data for every currency in BCRA_API_COD_MONEDAS using the
+    /estadisticascambiarias/v1.0/Cotizaciones/{moneda} or /Cotizaciones?fecha= endpoint.
+    Retorna el código de salida de la corrida (ver common/run_ledger.py).
     """
     cloud_engine = None
+    connection = None
+    client = BCRAClient(headers=BCRA_API_HEADERS, cache=open_response_cache())
+    planner = WindowPlanner(BCRA_API_PAGE_LIMIT)
+    succeeded = False
+    error = None
+    mode = "incremental"
+    run = start_run("bcra")
     try:
         cloud_engine = get_cloud_db_engine()
-        create_cotizaciones_table(cloud_engine)
-
-        last_date = get_last_loaded_date(cloud_engine)
+        # Una sola conexión para toda la corrida: la tabla, los huecos y la carga de todas las ventanas
+        connection = cloud_engine.connect()
+        create_cotizaciones_table(connection)
 
-        if last_date:
-            start_date_pull = last_date + timedelta(days=1)
-            print(f"Modo incremental: Última fecha cargada: {last_date}. Consultando desde: {start_date_pull.strftime('%Y-%m-%d')}")
-        else:
+        has_data = connection.execute(
+            text("SELECT EXISTS (SELECT 1 FROM cotizaciones WHERE moneda = ANY(CAST(:monedas AS TEXT[])))"),
+            {"monedas": BCRA_API_COD_MONEDAS}
+        ).scalar()
+        if not has_data:
             # Según la documentación, esta API puede tener historial hasta 2024-06-12 en ejemplos.
             # Para la carga histórica, vamos a intentar desde el inicio de la serie.
-            start_date_pull = datetime(2002, 1, 1).date() # Fecha más antigua para la mayoría de series del BCRA
-            print(f"Modo histórico: No hay datos en la DB. Consultando desde: {start_date_pull.strftime('%Y-%m-%d')}")
-        
+            mode = "historical"
+            print(f"Modo histórico: No hay datos en la DB. Consultando desde: {BCRA_HISTORY_START_DATE.strftime('%Y-%m-%d')}")
+
+        # Huecos de cada moneda (días hábiles sin cotización ni marca de 'sin datos') en toda la serie,
+        # no solo después de MAX(fecha): así se recuperan los bloques que fallaron en corridas anteriores
         end_date_today = datetime.now().date()
-        
-        if start_date_pull > end_date_today:
-            print("La base de datos ya está actualizada. No hay nuevas cotizaciones para extraer.")
-            return
+        missing_ranges = find_missing_ranges(connection, BCRA_API_COD_MONEDAS, BCRA_HISTORY_START_DATE, end_date_today)
+        for moneda, ranges in missing_ranges.items():
+            missing_days = sum(days for _, _, days in ranges)
+            print(
+                f"Modo {'histórico' if mode == 'historical' else 'incremental'} ({moneda}): {missing_days} días hábiles "
+                f"faltantes en {len(ranges)} rangos, desde {ranges[0][0]} hasta {ranges[-1][1]}."
+            )
 
-        # Strategy to load data in annual blocks to manage API range limits and pagination
-        current_block_start_date = start_date_pull
+        if not missing_ranges:
+            print("La base de datos ya está actualizada. No hay nuevas cotizaciones para extraer.")
+        blocks, window_ranges, block_requests = plan_fetch_windows(planner, missing_ranges)
         total_loaded_rows = 0
+        merge_counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+        failed_blocks = 0
 
-        while current_block_start_date <= end_date_today:
-            # Define the end of the block (e.g., end of the current year or end of the general range)
-            next_year_start = (current_block_start_date.replace(year=current_block_start_date.year + 1, month=1, day=1))
-            block_end_date = min(next_year_start - timedelta(days=1), end_date_today)
+        block_frames = fetch_windows(client, blocks, block_requests)
 
-            print(f"\nProcesando bloque de fechas: {current_block_start_date.strftime('%Y-%m-%d')} a {block_end_date.strftime('%Y-%m-%d')}")
-            df_cotizaciones_block = fetch_bcra_dolar_data_evolution(current_block_start_date.strftime('%Y-%m-%d'), block_end_date.strftime('%Y-%m-%d'))
+        # Una ventana que falla no frena las siguientes: su hueco se vuelve a planificar en la próxima corrida
+        for (start_date_str, end_date_str), ranges, frames in zip(blocks, window_ranges, block_frames):
+            start_by_moneda = {moneda: range_start for moneda, (range_start, _) in ranges.items()}
+            df_cotizaciones_block = combine_block_frames(frames, start_by_moneda, start_date_str, end_date_str)
+            if df_cotizaciones_block is None:
+                print(f"AVISO: la descarga de la ventana {start_date_str} a {end_date_str} falló. Se reintentará en la próxima corrida.")
+                failed_blocks += 1
+                continue
 
             if not df_cotizaciones_block.empty:
-                print(f"Cargando {len(df_cotizaciones_block)} cotizaciones del bloque en la nube...")
-                with cloud_engine.connect() as connection:
-                    df_cotizaciones_block.to_sql('cotizaciones', connection, if_exists='append', index=False)
-                print("Cotizaciones del bloque cargadas exitosamente.")
-                total_loaded_rows += len(df_cotizaciones_block)
+                print(
+                    f"Cargando {len(df_cotizaciones_block)} cotizaciones ({df_cotizaciones_block['moneda'].nunique()} monedas) "
+                    f"del bloque {start_date_str} a {end_date_str} en la nube..."
+                )
+                # Una sola carga por bloque con todas las monedas: COPY a la tabla temporal y upsert
+                with stage("load", table="cotizaciones") as metrics:
+                    inserted, updated, unchanged, metrics["bytes"] = merge_cotizaciones_block(df_cotizaciones_block, connection)
+                    metrics["rows"] = len(df_cotizaciones_block)
+                print(f"Cotizaciones del bloque cargadas exitosamente: {inserted} nuevas, {updated} actualizadas, {unchanged} sin cambios.")
+                total_loaded_rows += inserted + updated
+                merge_counts["inserted"] += inserted
+                merge_counts["updated"] += updated
+                merge_counts["unchanged"] += unchanged
             else:
-                print("No hay datos para este bloque de fechas.")
+                print(f"No hay datos para el bloque {start_date_str} a {end_date_str}.")
 
-            current_block_start_date = block_end_date + timedelta(days=1)
+            # Los días pedidos que la API no devolvió (feriados) no se vuelven a pedir
+            days_without_data = mark_days_without_data(connection, ranges, end_date_today)
+            if days_without_data:
+                print(f"  {days_without_data} días hábiles sin cotización marcados en 'cotizaciones_sin_datos'.")
 
+        if failed_blocks:
+            print(f"AVISO: {failed_blocks} de {len(blocks)} ventanas fallaron; sus huecos quedan para la próxima corrida.")
         if total_loaded_rows > 0:
-            print(f"\n¡Pipeline de ingesta de API BCRA completado! Total de {total_loaded_rows} registros cargados.")
+            print(
+                f"\n¡Pipeline de ingesta de API BCRA completado! Total de {total_loaded_rows} registros cargados "
+                f"({merge_counts['inserted']} nuevos, {merge_counts['updated']} actualizados, {merge_counts['unchanged']} sin cambios)."
+            )
         else:
             print("\nProceso de ingesta de API BCRA finalizado. No se cargaron nuevos registros.")
+        if failed_blocks:
+            error = f"{failed_blocks} ventanas fallaron"
+        else:
+            succeeded = True
 
     except Exception as e:
+        error = str(e)
         print(f"\nERROR en el pipeline de BCRA API: {e}")
     finally:
+        client.report()
+        client.close()
+        # Filas por día y filas por segundo de esta corrida, para dimensionar las ventanas de la próxima
+        planner.observe(client.stats.page_rows, client.stats.page_days, client.stats.page_seconds)
+        planner.save()
+        if connection:
+            connection.close()
+        rows_by_table, _ = run.get_stage_totals(("load",))
+        _, bytes_downloaded = run.get_stage_totals(("http_request",))
+        exit_code = record_run(cloud_engine, run, mode, succeeded, rows_by_table, bytes_downloaded, error)
         if cloud_engine:
+            report_pool_stats(cloud_engine, "nube")
             cloud_engine.dispose()
         print("Conexión a la base de datos en la nube cerrada.")
+        run.finish(succeeded)
+    return exit_code
 
 if __name__ == "__main__":
-    run_bcra_pipeline()
-    print("Proceso de ingesta de API BCRA finalizado.")
\ No newline at end of file
+    exit_code = run_bcra_pipeline()
+    print("Proceso de ingesta de API BCRA finalizado.")
+    sys.exit(exit_code)
\ No newline at end of file
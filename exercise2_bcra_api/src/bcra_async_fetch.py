@@ -0,0 +1,163 @@
+"""
+Descarga concurrente de las cotizaciones del BCRA con asyncio y aiohttp.
+
+En lugar de recorrer los bloques anuales y sus páginas de a uno, se piden todos los bloques a la
+vez: la primera página de cada bloque informa en metadata.resultset.count cuántas cotizaciones
+tiene el rango, y con eso se piden juntas las páginas restantes. Un semáforo acota las peticiones
+simultáneas (BCRA_FETCH_CONCURRENCY) y el token bucket del BCRAClient (bcra_client.py) espacia las
+peticiones a la API (BCRA_FETCH_RATE_PER_SECOND), así una carga histórica tarda lo que las
+peticiones más lentas y no la suma de todas, sin saturar la API. Los reintentos siguen la misma
+política que la descarga secuencial (backoff con jitter, Retry-After, 429).
+
+Cada bloque es una lista de peticiones: rangos paginados del endpoint de evolución (uno por
+moneda) o días del endpoint por fecha (todas las monedas en una respuesta). Los resultados se
+devuelven en el orden de los bloques, listos para cargarse en orden. Cada página se decodifica
+una sola vez a buffers columnares (bcra_columns.py).
+"""
+import asyncio
+import time
+
+# aiohttp es opcional: sin él, el pipeline sigue con la descarga secuencial
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from common.instrumentation import stage
+
+from bcra_client import BCRA_FETCH_CONCURRENCY, RETRYABLE_STATUS, parse_retry_after
+from bcra_columns import CotizacionesColumns, decode_json
+
+def async_fetch_available():
+    """Indica si está instalado aiohttp."""
+    return aiohttp is not None
+
+async def fetch_page(session, semaphore, client, url, params):
+    """
+    Pide una página respetando el semáforo y el limitador del cliente, con sus reintentos.
+    Retorna el JSON de la respuesta (de la caché del cliente si está guardada).
+    """
+    cached = client.get_cached(url, params)
+    if cached is not None:
+        return cached
+
+    attempt = 0
+    while True:
+        delay = None
+        async with semaphore:
+            await asyncio.sleep(client.bucket.reserve())
+            start_time = time.perf_counter()
+            try:
+                with stage("http_request", endpoint="cotizaciones") as metrics:
+                    async with session.get(url, params=params, ssl=None if client.verify else False) as response:
+                        body = await response.read()
+                        latency = time.perf_counter() - start_time
+                        client.stats.record(latency)
+                        reason = f"HTTP {response.status}"
+                        if response.status in RETRYABLE_STATUS:
+                            delay = client.register_failure(
+                                attempt, response.status, parse_retry_after(response.headers.get("Retry-After"))
+                            )
+                        if delay is None:
+                            response.raise_for_status()
+                            api_response_json = decode_json(body)
+                            metrics["bytes"] = len(body)
+                            metrics["rows"] = len(api_response_json.get('results') or [])
+                            client.stats.record_page(params, metrics["rows"], latency)
+                            client.bucket.recover()
+                            client.store(url, params, body)
+                            return api_response_json
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                delay = client.register_failure(attempt)
+                if delay is None:
+                    raise
+                reason = type(e).__name__
+        # La espera del reintento no ocupa un lugar del semáforo
+        print(f"  {reason} de la API ({params}); reintento {attempt + 1}/{client.max_retries} en {delay:.1f}s...")
+        await asyncio.sleep(delay)
+        attempt += 1
+
+async def fetch_range(session, semaphore, client, url, start_date_str, end_date_str, limit, parse_results):
+    """
+    Descarga todas las páginas de un rango de fechas. Con metadata.resultset.count las páginas
+    restantes se piden en paralelo; si la respuesta no lo trae, se pagina de a una hasta una
+    página incompleta. Retorna las cotizaciones del rango (CotizacionesColumns).
+    """
+    def page_params(offset):
+        return {"fechadesde": start_date_str, "fechahasta": end_date_str, "limit": limit, "offset": offset}
+
+    first_page = await fetch_page(session, semaphore, client, url, page_params(0))
+    pages = [first_page]
+    resultset = (first_page.get('metadata') or {}).get('resultset') or {}
+    count = resultset.get('count')
+    # Si la API recorta el 'limit' pedido, las páginas siguientes avanzan de a lo que realmente devuelve
+    page_size = min(limit, resultset.get('limit') or limit)
+
+    if count is not None:
+        page_size = min(page_size, len(first_page.get('results') or [])) or page_size
+        pages += await asyncio.gather(*(
+            fetch_page(session, semaphore, client, url, page_params(offset))
+            for offset in range(page_size, count, page_size)
+        ))
+    else:
+        offset = 0
+        while len(pages[-1].get('results') or []) >= page_size:
+            offset += page_size
+            pages.append(await fetch_page(session, semaphore, client, url, page_params(offset)))
+
+    return CotizacionesColumns.concat(parse_results(page['results']) for page in pages if page.get('results'))
+
+async def fetch_block(session, semaphore, client, block_requests, limit, parse_results):
+    """
+    Descarga todas las peticiones [(url, params), ...] de un bloque a la vez: las que traen
+    'fechadesde'/'fechahasta' son rangos paginados, el resto una sola página.
+    Retorna la lista de cotizaciones (CotizacionesColumns) en el orden de las peticiones.
+    """
+    async def fetch_request(url, params):
+        if "fechadesde" in params:
+            return await fetch_range(
+                session, semaphore, client, url, params["fechadesde"], params["fechahasta"], limit, parse_results
+            )
+        page = await fetch_page(session, semaphore, client, url, params)
+        return parse_results(page.get('results') or [])
+
+    return list(await asyncio.gather(*(fetch_request(url, params) for url, params in block_requests)))
+
+async def fetch_blocks(client, block_requests, limit, parse_results):
+    """Descarga todos los bloques con una sola sesión; los errores se devuelven en lugar de lanzarse."""
+    timeout = aiohttp.ClientTimeout(total=client.timeout)
+    semaphore = asyncio.Semaphore(BCRA_FETCH_CONCURRENCY)
+    # Conexiones keep-alive reutilizadas entre páginas; aiohttp negocia gzip/deflate por defecto
+    connector = aiohttp.TCPConnector(limit=BCRA_FETCH_CONCURRENCY)
+    async with aiohttp.ClientSession(headers=client.headers, timeout=timeout, connector=connector) as session:
+        return await asyncio.gather(
+            *(
+                fetch_block(session, semaphore, client, requests_in_block, limit, parse_results)
+                for requests_in_block in block_requests
+            ),
+            return_exceptions=True
+        )
+
+def fetch_blocks_concurrently(client, block_requests, limit, parse_results):
+    """
+    Descarga concurrentemente los bloques; block_requests tiene, por bloque, la lista de
+    peticiones [(url, params), ...] (fechas 'YYYY-MM-DD').
+    parse_results: función que convierte los 'results' de una página en CotizacionesColumns.
+    Retorna una lista alineada con 'block_requests': la lista de cotizaciones de cada bloque (una
+    por petición) o None si el bloque falló.
+    """
+    print(
+        f"Consultando API BCRA: {sum(map(len, block_requests))} consultas en {len(block_requests)} bloques en paralelo "
+        f"(hasta {BCRA_FETCH_CONCURRENCY} peticiones simultáneas, {client.bucket.max_rate:g}/s)..."
+    )
+    results = asyncio.run(fetch_blocks(client, block_requests, limit, parse_results))
+
+    frames = []
+    for requests_in_block, result in zip(block_requests, results):
+        if isinstance(result, BaseException):
+            first_params = requests_in_block[0][1] if requests_in_block else {}
+            print(f"  Error al consultar un bloque ({first_params}): {type(result).__name__}: {result}")
+            frames.append(None)
+        else:
+            frames.append(result)
+    return frames
@@ -0,0 +1,142 @@
+"""
+Caché local y persistente de las respuestas de la API del BCRA (SQLite, cuerpos comprimidos con zlib).
+
+Las cotizaciones de fechas ya cerradas no cambian, así que una respuesta cuyo rango terminó hace
+más de BCRA_CACHE_SETTLE_DAYS días se guarda sin vencimiento; las de rangos recientes (el BCRA
+puede publicar o corregir el último día) vencen a los BCRA_CACHE_TTL_SECONDS segundos. Con la
+caché llena, reconstruir 'cotizaciones' desde cero no hace peticiones a la API.
+
+La clave es la URL (endpoint y moneda) más los parámetros (rango de fechas o fecha, limit y offset).
+Si el archivo supera BCRA_CACHE_MAX_MB se borran las entradas usadas hace más tiempo (LRU).
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import date, timedelta
+
+from bcra_columns import decode_json
+
+BCRA_CACHE_ENABLED = os.getenv("BCRA_CACHE_ENABLED", "true").lower() == "true"
+BCRA_CACHE_PATH = os.getenv(
+    "BCRA_CACHE_PATH", os.path.join(os.path.dirname(__file__), '..', '.cache', 'bcra_responses.sqlite3')
+)
+BCRA_CACHE_TTL_SECONDS = int(os.getenv("BCRA_CACHE_TTL_SECONDS", "3600"))
+# Días después de los cuales un rango se considera cerrado (sin vencimiento en la caché)
+BCRA_CACHE_SETTLE_DAYS = int(os.getenv("BCRA_CACHE_SETTLE_DAYS", "7"))
+BCRA_CACHE_MAX_MB = float(os.getenv("BCRA_CACHE_MAX_MB", "100"))
+
+CACHE_DDL = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    params TEXT NOT NULL,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS responses_last_access_idx ON responses (last_access);
+"""
+
+class ResponseCache:
+    """Caché de respuestas JSON en SQLite; se puede usar desde varios hilos."""
+
+    def __init__(self, path=BCRA_CACHE_PATH, ttl_seconds=BCRA_CACHE_TTL_SECONDS,
+                 settle_days=BCRA_CACHE_SETTLE_DAYS, max_mb=BCRA_CACHE_MAX_MB):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.settle_days = settle_days
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(CACHE_DDL)
+
+    @staticmethod
+    def make_key(url, params):
+        """Clave estable de una petición: URL más parámetros ordenados."""
+        canonical = json.dumps({"url": url, "params": params or {}}, sort_keys=True, default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest(), canonical
+
+    def expires_at(self, params, now):
+        """None (no vence) si el rango (o la fecha) pedido terminó hace más de settle_days días; si no, ahora + TTL."""
+        params = params or {}
+        try:
+            range_end = date.fromisoformat(str(params.get("fechahasta") or params.get("fecha")))
+        except ValueError:
+            return now + self.ttl_seconds
+        if range_end < date.today() - timedelta(days=self.settle_days):
+            return None
+        return now + self.ttl_seconds
+
+    def get(self, url, params):
+        """JSON guardado para la petición, o None si no está o venció."""
+        key, _ = self.make_key(url, params)
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT body, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] < now):
+                self.misses += 1
+                return None
+            self._connection.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._connection.commit()
+            self.hits += 1
+        return decode_json(zlib.decompress(row[0]))
+
+    def put(self, url, params, body):
+        """Guarda el cuerpo (bytes JSON) de una respuesta correcta y aplica el tope de tamaño."""
+        key, canonical = self.make_key(url, params)
+        compressed = zlib.compress(body, 6)
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, url, params, body, size, created_at, last_access, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, canonical, compressed, len(compressed), now, now, self.expires_at(params, now))
+            )
+            self.evict()
+            self._connection.commit()
+
+    def evict(self):
+        """Borra las entradas vencidas y, si se supera el tope, las usadas hace más tiempo (con el lock tomado)."""
+        self._connection.execute("DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),))
+        total_size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total_size <= self.max_bytes:
+            return
+        excess = total_size - self.max_bytes
+        freed = 0
+        keys = []
+        for key, size in self._connection.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            keys.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._connection.executemany("DELETE FROM responses WHERE key = ?", keys)
+
+    def report(self):
+        """Imprime aciertos y fallos de la caché en la corrida."""
+        if self.hits or self.misses:
+            print(f"Caché de respuestas BCRA ('{self.path}'): {self.hits} aciertos, {self.misses} peticiones a la API.")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+def open_response_cache():
+    """Abre la caché configurada, o None si está desactivada o no se puede abrir."""
+    if not BCRA_CACHE_ENABLED:
+        return None
+    try:
+        return ResponseCache()
+    except sqlite3.Error as e:
+        print(f"AVISO: no se pudo abrir la caché de respuestas del BCRA ({e}); se consulta la API sin caché.")
+        return None
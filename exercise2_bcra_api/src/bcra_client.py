@@ -0,0 +1,276 @@
+"""
+Cliente HTTP de la API del BCRA compartido por la descarga secuencial y la concurrente.
+
+- Sesión de requests con pool de conexiones keep-alive (una conexión TLS reutilizada por
+  página en lugar de una por petición) y respuestas comprimidas (gzip/deflate).
+- Reintentos ante errores de conexión, timeouts, 429 y 5xx con backoff exponencial y jitter;
+  si la respuesta trae Retry-After, se espera al menos lo que indica.
+- Limitador token bucket adaptativo: ante un 429 baja la tasa a la mitad y con cada respuesta
+  correcta la vuelve a subir de a poco hasta BCRA_FETCH_RATE_PER_SECOND, así la descarga se
+  mantiene cerca de la mayor tasa que la API tolera.
+- Latencia por petición (p50, p95, máxima), reintentos y respuestas 429, informados al final.
+- Caché de respuestas opcional (bcra_cache.ResponseCache): una respuesta guardada y vigente se
+  devuelve sin consultar la API.
+
+La descarga concurrente (bcra_async_fetch.py) recibe el mismo cliente y usa su limitador, su
+política de reintentos y sus estadísticas con una sesión de aiohttp.
+"""
+import os
+import random
+import threading
+import time
+from datetime import date, datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+from common.instrumentation import stage
+
+from bcra_columns import decode_json
+
+BCRA_FETCH_CONCURRENCY = int(os.getenv("BCRA_FETCH_CONCURRENCY", "8"))
+# Peticiones por segundo a la API (0 = sin límite) y ráfaga máxima del token bucket
+BCRA_FETCH_RATE_PER_SECOND = float(os.getenv("BCRA_FETCH_RATE_PER_SECOND", "10"))
+BCRA_FETCH_BURST = int(os.getenv("BCRA_FETCH_BURST", str(BCRA_FETCH_CONCURRENCY)))
+BCRA_FETCH_TIMEOUT = int(os.getenv("BCRA_FETCH_TIMEOUT", "60"))
+BCRA_FETCH_MAX_RETRIES = int(os.getenv("BCRA_FETCH_MAX_RETRIES", "5"))
+# Backoff exponencial: base * 2^intento segundos, con tope, multiplicado por un jitter aleatorio
+BCRA_FETCH_BACKOFF_BASE = float(os.getenv("BCRA_FETCH_BACKOFF_BASE", "0.5"))
+BCRA_FETCH_BACKOFF_MAX = float(os.getenv("BCRA_FETCH_BACKOFF_MAX", "30"))
+# El certificado de api.bcra.gob.ar no siempre valida con la cadena de confianza por defecto
+BCRA_API_VERIFY_SSL = os.getenv("BCRA_API_VERIFY_SSL", "false").lower() == "true"
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """
+    Token bucket thread-safe. reserve() toma un token y devuelve cuántos segundos hay que esperar
+    para usarlo, así sirve tanto para hilos (time.sleep) como para asyncio (asyncio.sleep).
+    """
+
+    def __init__(self, rate, burst, min_rate=0.5):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate) if rate > 0 else 0.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def acquire(self):
+        """Espera (bloqueando) hasta tener un token."""
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+    def throttle(self):
+        """La API pidió bajar el ritmo (429): la tasa se reduce a la mitad."""
+        with self._lock:
+            if self.rate > 0:
+                self.rate = max(self.min_rate, self.rate / 2)
+
+    def recover(self):
+        """Respuesta correcta: la tasa sube un 5% de la máxima, sin superarla."""
+        with self._lock:
+            if 0 < self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+class LatencyStats:
+    """
+    Latencias, reintentos y respuestas 429 de las peticiones (thread-safe). De las páginas
+    correctas del endpoint de evolución acumula además filas, días del rango pedido y segundos,
+    que usa el planificador de ventanas (bcra_planner.py).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.retries = 0
+        self.throttled = 0
+        self.page_rows = 0
+        self.page_days = 0
+        self.page_seconds = 0.0
+
+    def record(self, latency):
+        with self._lock:
+            self.latencies.append(latency)
+
+    def record_page(self, params, rows, latency):
+        """
+        Registra una página correcta de un rango (params con 'fechadesde' y 'fechahasta'). Los días
+        del rango se cuentan una sola vez, con la primera página (offset 0): las siguientes páginas
+        suman filas y segundos pero no vuelven a sumar los mismos días.
+        """
+        params = params or {}
+        if "fechadesde" not in params or "fechahasta" not in params:
+            return
+        days = 0
+        if int(params.get("offset") or 0) == 0:
+            days = (date.fromisoformat(params["fechahasta"]) - date.fromisoformat(params["fechadesde"])).days + 1
+        with self._lock:
+            self.page_rows += rows
+            self.page_days += days
+            self.page_seconds += latency
+
+    def record_retry(self, status=None):
+        with self._lock:
+            self.retries += 1
+            self.throttled += 1 if status == 429 else 0
+
+    def as_dict(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            retries, throttled = self.retries, self.throttled
+
+        def percentile(fraction):
+            return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 1)
+
+        return {
+            "requests": len(latencies),
+            "p50_ms": percentile(0.5) if latencies else 0.0,
+            "p95_ms": percentile(0.95) if latencies else 0.0,
+            "max_ms": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+            "retries": retries,
+            "throttled": throttled,
+        }
+
+def parse_retry_after(value):
+    """Segundos indicados por un header Retry-After (en segundos o como fecha HTTP), o None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+class BCRAClient:
+    """Cliente de la API del BCRA con sesión compartida, reintentos y limitador de tasa."""
+
+    def __init__(self, headers=None, pool_size=BCRA_FETCH_CONCURRENCY, rate=BCRA_FETCH_RATE_PER_SECOND,
+                 burst=BCRA_FETCH_BURST, max_retries=BCRA_FETCH_MAX_RETRIES, timeout=BCRA_FETCH_TIMEOUT,
+                 verify=BCRA_API_VERIFY_SSL, cache=None):
+        self.headers = {"Accept-Encoding": "gzip, deflate", **(headers or {})}
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.verify = verify
+        self.bucket = TokenBucket(rate, burst)
+        self.stats = LatencyStats()
+        self.cache = cache
+
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.verify = verify
+        # Los reintentos los maneja get_json (con Retry-After y el limitador), no urllib3
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if not verify:
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """Espera antes del reintento número 'attempt' (desde 0): exponencial con jitter, o Retry-After."""
+        delay = min(BCRA_FETCH_BACKOFF_MAX, BCRA_FETCH_BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+        return max(delay, retry_after) if retry_after is not None else delay
+
+    def register_failure(self, attempt, status=None, retry_after=None):
+        """
+        Registra una respuesta reintentable y devuelve cuánto esperar antes de reintentar, o None si
+        ya no quedan reintentos.
+        """
+        if status == 429:
+            self.bucket.throttle()
+        if attempt >= self.max_retries:
+            return None
+        self.stats.record_retry(status)
+        return self.backoff_delay(attempt, retry_after)
+
+    def get_cached(self, url, params):
+        """JSON de la caché para la petición, o None si no hay caché o la respuesta no está guardada."""
+        if self.cache is None:
+            return None
+        with stage("http_cache_hit", endpoint="cotizaciones") as metrics:
+            api_response_json = self.cache.get(url, params)
+            if api_response_json is not None:
+                metrics["rows"] = len(api_response_json.get('results') or [])
+        return api_response_json
+
+    def store(self, url, params, body):
+        """Guarda en la caché (si hay) el cuerpo de una respuesta correcta."""
+        if self.cache is not None:
+            self.cache.put(url, params, body)
+
+    def get_json(self, url, params=None):
+        """
+        GET con reintentos; retorna el JSON de la respuesta (de la caché si está guardada). Si se
+        agotan los reintentos se lanza la última excepción de requests (HTTPError para respuestas
+        con error).
+        """
+        cached = self.get_cached(url, params)
+        if cached is not None:
+            return cached
+
+        attempt = 0
+        while True:
+            delay = None
+            self.bucket.acquire()
+            start_time = time.perf_counter()
+            try:
+                with stage("http_request", endpoint="cotizaciones") as metrics:
+                    response = self.session.get(url, params=params, timeout=self.timeout)
+                    latency = time.perf_counter() - start_time
+                    self.stats.record(latency)
+                    reason = f"HTTP {response.status_code}"
+                    if response.status_code in RETRYABLE_STATUS:
+                        delay = self.register_failure(
+                            attempt, response.status_code, parse_retry_after(response.headers.get("Retry-After"))
+                        )
+                    if delay is None:
+                        response.raise_for_status()
+                        api_response_json = decode_json(response.content)
+                        metrics["bytes"] = len(response.content)
+                        metrics["rows"] = len(api_response_json.get('results') or [])
+                        self.stats.record_page(params, metrics["rows"], latency)
+                        self.bucket.recover()
+                        self.store(url, params, response.content)
+                        return api_response_json
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                delay = self.register_failure(attempt)
+                if delay is None:
+                    raise
+                reason = type(e).__name__
+            print(f"  {reason} de la API; reintento {attempt + 1}/{self.max_retries} en {delay:.1f}s...")
+            time.sleep(delay)
+            attempt += 1
+
+    def report(self):
+        """Imprime latencias y reintentos de las peticiones hechas con este cliente."""
+        stats = self.stats.as_dict()
+        if stats["requests"]:
+            print(
+                f"API BCRA: {stats['requests']} peticiones, latencia p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms, "
+                f"máxima {stats['max_ms']} ms; {stats['retries']} reintentos ({stats['throttled']} por 429); "
+                f"tasa final {self.bucket.rate:g}/s."
+            )
+        if self.cache is not None:
+            self.cache.report()
+
+    def close(self):
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
@@ -0,0 +1,263 @@
+"""
+Planificador de la ingesta del BCRA: qué rangos faltan en 'cotizaciones' y en qué ventanas pedirlos.
+
+En lugar de seguir solo desde MAX(fecha), una consulta SQL arma la serie de días hábiles de cada
+moneda (lunes a viernes desde BCRA_HISTORY_START_DATE) y devuelve los rangos consecutivos de días
+que no están cargados (islas), así los huecos que dejó un bloque fallido se vuelven a pedir. Los
+días hábiles que la API ya respondió sin cotización (feriados, o fechas anteriores al inicio de la
+serie de una moneda) se guardan en 'cotizaciones_sin_datos' para no pedirlos en cada corrida; los
+de los últimos BCRA_GAP_SETTLE_DAYS días no se marcan porque el BCRA todavía puede publicarlos.
+
+Las ventanas de consulta no son años fijos: WindowPlanner las dimensiona con lo observado en
+corridas anteriores (filas por día del rango pedido y filas por segundo de respuesta) para que
+cada petición traiga casi una página completa sin pasar de BCRA_WINDOW_TARGET_SECONDS. Las
+observaciones se guardan junto a la caché de respuestas (BCRA_PLANNER_STATE_PATH).
+
+Ese tamaño se redondea a uno de WINDOW_GRID_MONTHS y las ventanas siguen una grilla fija del
+calendario (meses, trimestres, años...), no el primer día faltante: así la misma historia se pide
+con las mismas fechas en cada corrida y la caché de respuestas (bcra_cache.py) la reconoce.
+"""
+import json
+import os
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+BCRA_GAP_SETTLE_DAYS = int(os.getenv("BCRA_GAP_SETTLE_DAYS", "7"))
+# Tiempo de respuesta buscado por petición y límites del tamaño de ventana (en días)
+BCRA_WINDOW_TARGET_SECONDS = float(os.getenv("BCRA_WINDOW_TARGET_SECONDS", "10"))
+BCRA_WINDOW_MIN_DAYS = int(os.getenv("BCRA_WINDOW_MIN_DAYS", "30"))
+BCRA_WINDOW_MAX_DAYS = int(os.getenv("BCRA_WINDOW_MAX_DAYS", "3650"))
+BCRA_PLANNER_STATE_PATH = os.getenv(
+    "BCRA_PLANNER_STATE_PATH", os.path.join(os.path.dirname(__file__), '..', '.cache', 'bcra_planner_state.json')
+)
+# Densidad inicial: unos 250 días hábiles con cotización por año
+DEFAULT_ROWS_PER_DAY = 250 / 365
+# Fracción de la página que se busca llenar: una ventana que trae justo 'limit' filas obliga a pedir una página más
+PAGE_FILL = 0.9
+# Peso de lo observado en la corrida frente a lo acumulado (promedio móvil exponencial)
+OBSERVATION_WEIGHT = 0.5
+# Tamaños de ventana permitidos, en meses; cada ventana es una celda de la grilla de ese tamaño
+WINDOW_GRID_MONTHS = (1, 2, 3, 6, 12, 24, 60, 120)
+DAYS_PER_MONTH = 365.25 / 12
+
+COTIZACIONES_SIN_DATOS_DDL = """
+CREATE TABLE IF NOT EXISTS cotizaciones_sin_datos (
+    fecha DATE NOT NULL,
+    moneda TEXT NOT NULL,
+    checked_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (fecha, moneda)
+);
+"""
+
+# Islas de días hábiles faltantes por moneda: el número de día hábil menos el número de fila
+# entre los faltantes es constante dentro de cada rango consecutivo (los fines de semana no cortan un hueco).
+MISSING_RANGES_QUERY = """
+WITH dias AS (
+    SELECT m.moneda, d::date AS fecha, row_number() OVER (PARTITION BY m.moneda ORDER BY d) AS dia_habil
+    FROM unnest(CAST(:monedas AS TEXT[])) AS m(moneda)
+    CROSS JOIN generate_series(CAST(:desde AS DATE), CAST(:hasta AS DATE), interval '1 day') AS d
+    WHERE extract(isodow FROM d) < 6
+),
+faltantes AS (
+    SELECT dias.moneda, dias.fecha,
+           dias.dia_habil - row_number() OVER (PARTITION BY dias.moneda ORDER BY dias.fecha) AS isla
+    FROM dias
+    WHERE NOT EXISTS (SELECT 1 FROM cotizaciones c WHERE c.fecha = dias.fecha AND c.moneda = dias.moneda)
+      AND NOT EXISTS (SELECT 1 FROM cotizaciones_sin_datos s WHERE s.fecha = dias.fecha AND s.moneda = dias.moneda)
+)
+SELECT moneda, MIN(fecha), MAX(fecha), COUNT(*)
+FROM faltantes
+GROUP BY moneda, isla
+ORDER BY moneda, MIN(fecha)
+"""
+
+# Días hábiles de los rangos pedidos que la API no devolvió (y que ya no se van a publicar)
+MARK_DAYS_WITHOUT_DATA_SQL = """
+INSERT INTO cotizaciones_sin_datos (fecha, moneda)
+SELECT d::date, r.moneda
+FROM unnest(CAST(:monedas AS TEXT[]), CAST(:desde AS DATE[]), CAST(:hasta AS DATE[])) AS r(moneda, desde, hasta)
+CROSS JOIN LATERAL generate_series(r.desde, LEAST(r.hasta, CAST(:settled_until AS DATE)), interval '1 day') AS d
+WHERE extract(isodow FROM d) < 6
+  AND NOT EXISTS (SELECT 1 FROM cotizaciones c WHERE c.fecha = d::date AND c.moneda = r.moneda)
+ON CONFLICT DO NOTHING
+"""
+
+def create_no_data_table(connection):
+    """Crea la tabla 'cotizaciones_sin_datos' si no existe (el commit queda a cargo de quien llama)."""
+    connection.execute(text(COTIZACIONES_SIN_DATOS_DDL))
+
+def find_missing_ranges(connection, monedas, start_date, end_date):
+    """
+    Rangos de días hábiles faltantes entre start_date y end_date, con una sola consulta.
+    Retorna {moneda: [(desde, hasta, días hábiles faltantes), ...]} en orden de fecha; las monedas
+    completas no aparecen.
+    """
+    result = connection.execute(
+        text(MISSING_RANGES_QUERY),
+        {"monedas": list(monedas), "desde": start_date, "hasta": end_date}
+    )
+    missing_ranges = {}
+    for moneda, range_start, range_end, missing_days in result:
+        missing_ranges.setdefault(moneda, []).append((range_start, range_end, missing_days))
+    # Cerrar la transacción de lectura: no debe quedar abierta mientras se consulta la API
+    connection.commit()
+    return missing_ranges
+
+def mark_days_without_data(connection, requested_ranges, today=None):
+    """
+    Registra en 'cotizaciones_sin_datos' los días hábiles de los rangos pedidos ({moneda: (desde, hasta)})
+    que siguen sin cotización, salvo los de los últimos BCRA_GAP_SETTLE_DAYS días.
+    Retorna la cantidad de días marcados.
+    """
+    if not requested_ranges:
+        return 0
+    settled_until = (today or date.today()) - timedelta(days=BCRA_GAP_SETTLE_DAYS)
+    monedas = list(requested_ranges)
+    result = connection.execute(
+        text(MARK_DAYS_WITHOUT_DATA_SQL),
+        {
+            "monedas": monedas,
+            "desde": [requested_ranges[moneda][0] for moneda in monedas],
+            "hasta": [requested_ranges[moneda][1] for moneda in monedas],
+            "settled_until": settled_until,
+        }
+    )
+    connection.commit()
+    return result.rowcount
+
+def business_days(start_date, end_date):
+    """Días hábiles (lunes a viernes) entre dos fechas, inclusive."""
+    current_date = start_date
+    while current_date <= end_date:
+        if current_date.weekday() < 5:
+            yield current_date
+        current_date += timedelta(days=1)
+
+def merge_ranges(ranges):
+    """Une rangos [(desde, hasta), ...] que se superponen o son contiguos."""
+    merged = []
+    for range_start, range_end in sorted(ranges):
+        if merged and range_start <= merged[-1][1] + timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], range_end))
+        else:
+            merged.append((range_start, range_end))
+    return merged
+
+class WindowPlanner:
+    """Tamaño adaptativo de las ventanas de consulta, a partir de lo observado en corridas anteriores."""
+
+    def __init__(self, page_limit, target_seconds=BCRA_WINDOW_TARGET_SECONDS, min_days=BCRA_WINDOW_MIN_DAYS,
+                 max_days=BCRA_WINDOW_MAX_DAYS, state_path=BCRA_PLANNER_STATE_PATH):
+        self.page_limit = page_limit
+        self.target_seconds = target_seconds
+        self.min_days = min_days
+        self.max_days = max_days
+        self.state_path = state_path
+        self.rows_per_day = DEFAULT_ROWS_PER_DAY
+        self.rows_per_second = None
+        self.load()
+
+    def load(self):
+        """Lee las observaciones guardadas; si no hay, se usan los valores por defecto."""
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                state = json.load(f)
+            self.rows_per_day = float(state.get("rows_per_day") or DEFAULT_ROWS_PER_DAY)
+            self.rows_per_second = float(state["rows_per_second"]) if state.get("rows_per_second") else None
+        except (OSError, ValueError, TypeError) as e:
+            print(f"AVISO: no se pudo leer el estado del planificador '{self.state_path}': {e}")
+
+    def save(self):
+        """Guarda las observaciones para la próxima corrida."""
+        if not self.state_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+            with open(self.state_path, 'w', encoding='utf-8') as f:
+                json.dump({"rows_per_day": self.rows_per_day, "rows_per_second": self.rows_per_second}, f)
+        except OSError as e:
+            print(f"AVISO: no se pudo guardar el estado del planificador '{self.state_path}': {e}")
+
+    def observe(self, rows, days, seconds):
+        """Incorpora lo observado en la corrida: filas devueltas, días de los rangos pedidos y segundos de respuesta."""
+        if days > 0 and rows > 0:
+            observed = rows / days
+            self.rows_per_day += OBSERVATION_WEIGHT * (observed - self.rows_per_day)
+        if seconds > 0 and rows > 0:
+            observed = rows / seconds
+            self.rows_per_second = observed if self.rows_per_second is None else (
+                self.rows_per_second + OBSERVATION_WEIGHT * (observed - self.rows_per_second)
+            )
+
+    def window_days(self):
+        """Días por ventana: casi una página completa, acotada por el tiempo de respuesta buscado."""
+        target_rows = self.page_limit * PAGE_FILL
+        if self.rows_per_second:
+            target_rows = min(target_rows, self.rows_per_second * self.target_seconds)
+        days = int(target_rows / max(self.rows_per_day, 1e-6))
+        return max(self.min_days, min(self.max_days, days))
+
+    def window_months(self):
+        """Meses por ventana: el mayor de WINDOW_GRID_MONTHS que entra en window_days()."""
+        fitting = [months for months in WINDOW_GRID_MONTHS if months * DAYS_PER_MONTH <= self.window_days()]
+        return fitting[-1] if fitting else WINDOW_GRID_MONTHS[0]
+
+    def plan_windows(self, missing_ranges):
+        """
+        Ventanas [('YYYY-MM-DD', 'YYYY-MM-DD'), ...] que cubren los huecos de todas las monedas
+        ({moneda: [(desde, hasta, días), ...]}); los tramos sin huecos no se piden. Cada ventana es
+        una celda de window_months() meses de la grilla del calendario, recortada al hueco.
+        """
+        months = self.window_months()
+        windows = []
+        all_ranges = [(range_start, range_end) for ranges in missing_ranges.values() for range_start, range_end, _ in ranges]
+        for range_start, range_end in merge_ranges(all_ranges):
+            cell_start = grid_cell_start(range_start, months)
+            while cell_start <= range_end:
+                next_cell_start = add_months(cell_start, months)
+                window_start = max(cell_start, range_start)
+                window_end = min(next_cell_start - timedelta(days=1), range_end)
+                windows.append((window_start.strftime('%Y-%m-%d'), window_end.strftime('%Y-%m-%d')))
+                cell_start = next_cell_start
+        return windows
+
+def grid_cell_start(day, months):
+    """Primer día de la celda de 'months' meses que contiene a 'day' (celdas contadas desde el año 0)."""
+    month_index = (day.year * 12 + day.month - 1) // months * months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+def add_months(first_day, months):
+    """Primer día del mes que está 'months' meses después de 'first_day' (que es día 1)."""
+    month_index = first_day.year * 12 + first_day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+def get_window_ranges(start_date_str, end_date_str, missing_ranges):
+    """
+    Rango a pedir de cada moneda dentro de una ventana: desde su primer día faltante hasta el
+    último ({moneda: (desde, hasta)}). Las monedas sin huecos en la ventana no aparecen.
+    """
+    window_start = date.fromisoformat(start_date_str)
+    window_end = date.fromisoformat(end_date_str)
+    window_ranges = {}
+    for moneda, ranges in missing_ranges.items():
+        overlapping = [
+            (max(range_start, window_start), min(range_end, window_end))
+            for range_start, range_end, _ in ranges
+            if range_start <= window_end and range_end >= window_start
+        ]
+        if overlapping:
+            window_ranges[moneda] = (overlapping[0][0], overlapping[-1][1])
+    return window_ranges
+
+def get_missing_days(start_date_str, end_date_str, missing_ranges):
+    """Días hábiles faltantes de alguna moneda dentro de una ventana, en orden ('YYYY-MM-DD')."""
+    window_start = date.fromisoformat(start_date_str)
+    window_end = date.fromisoformat(end_date_str)
+    missing_days = set()
+    for ranges in missing_ranges.values():
+        for range_start, range_end, _ in ranges:
+            missing_days.update(business_days(max(range_start, window_start), min(range_end, window_end)))
+    return [day.strftime('%Y-%m-%d') for day in sorted(missing_days)]
@@ -0,0 +1,41 @@
+"""
+Pruebas de las estadísticas del cliente del BCRA que alimentan al planificador de ventanas.
+
+Uso:
+    python -m pytest -q exercise2_bcra_api/tests
+"""
+import os
+import sys
+
+import pytest
+
+EXERCISE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.abspath(os.path.join(EXERCISE_DIR, '..')))
+sys.path.append(os.path.join(EXERCISE_DIR, 'src'))
+
+from bcra_client import LatencyStats
+from bcra_planner import DEFAULT_ROWS_PER_DAY, OBSERVATION_WEIGHT, WindowPlanner
+
+def test_rango_en_varias_paginas_cuenta_sus_dias_una_vez():
+    # 2024 es bisiesto: 366 días pedidos, 250 cotizaciones repartidas en tres páginas de 100
+    stats = LatencyStats()
+    for offset, rows in ((0, 100), (100, 100), (200, 50)):
+        params = {"fechadesde": "2024-01-01", "fechahasta": "2024-12-31", "limit": 100, "offset": offset}
+        stats.record_page(params, rows, 0.5)
+
+    assert stats.page_rows == 250
+    assert stats.page_days == 366
+    assert stats.page_seconds == pytest.approx(1.5)
+
+    planner = WindowPlanner(100, state_path="")
+    planner.observe(stats.page_rows, stats.page_days, stats.page_seconds)
+    expected = DEFAULT_ROWS_PER_DAY + OBSERVATION_WEIGHT * (250 / 366 - DEFAULT_ROWS_PER_DAY)
+    assert planner.rows_per_day == pytest.approx(expected)
+
+def test_varios_rangos_suman_sus_dias():
+    stats = LatencyStats()
+    stats.record_page({"fechadesde": "2024-01-01", "fechahasta": "2024-01-31", "offset": 0}, 22, 0.1)
+    stats.record_page({"fechadesde": "2024-02-01", "fechahasta": "2024-02-29"}, 21, 0.1)
+
+    assert stats.page_days == 31 + 29
+    assert stats.page_rows == 43
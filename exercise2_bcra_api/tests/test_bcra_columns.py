@@ -0,0 +1,113 @@
+"""
+Pruebas del parseo columnar de las respuestas del BCRA (bcra_columns.py).
+
+data/evolucion_usd_1000.json es una página de 1000 cotizaciones del endpoint de evolución,
+grabada del simulador (benchmarks/fake_bcra_server.py) con el formato de la API.
+
+Uso:
+    python -m pytest -q exercise2_bcra_api/tests
+"""
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+EXERCISE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.abspath(os.path.join(EXERCISE_DIR, '..')))
+sys.path.append(os.path.join(EXERCISE_DIR, 'src'))
+
+from bcra_columns import CotizacionesColumns, decode_json
+
+PAGE_PATH = os.path.join(os.path.dirname(__file__), 'data', 'evolucion_usd_1000.json')
+
+def read_page():
+    with open(PAGE_PATH, 'rb') as f:
+        return f.read()
+
+def parse_like_before(body, moneda):
+    """El parseo anterior: response.json(), una lista de dicts y un DataFrame por página."""
+    processed_records = []
+    for item in json.loads(body)['results']:
+        for detalle in item.get('detalle', []):
+            if detalle.get('codigoMoneda') == moneda:
+                processed_records.append({
+                    'fecha': item.get('fecha'),
+                    'moneda': moneda,
+                    'tipo_cambio': detalle.get('tipoCotizacion'),
+                    'fuente': 'BCRA',
+                })
+                break
+    df = pd.DataFrame(processed_records)
+    df['fecha'] = pd.to_datetime(df['fecha']).dt.date
+    df['tipo_cambio'] = pd.to_numeric(df['tipo_cambio'], errors='coerce')
+    return df.dropna(subset=['tipo_cambio'])[['fecha', 'moneda', 'tipo_cambio', 'fuente']]
+
+def test_pagina_grabada_igual_que_el_parseo_anterior():
+    body = read_page()
+    expected = parse_like_before(body, 'USD').sort_values('fecha', ignore_index=True)
+
+    df = CotizacionesColumns.from_results(decode_json(body)['results'], {'USD'}).to_frame()
+
+    assert len(df) == 1000
+    assert list(df.columns) == list(expected.columns)
+    assert pd.to_datetime(df['fecha']).dt.date.tolist() == expected['fecha'].tolist()
+    assert df['moneda'].tolist() == expected['moneda'].tolist()
+    assert df['fuente'].tolist() == expected['fuente'].tolist()
+    # Mismos float que json/pandas, bit a bit
+    assert np.array_equal(df['tipo_cambio'].to_numpy(dtype=np.float64), expected['tipo_cambio'].to_numpy(dtype=np.float64))
+
+def test_tipo_cotizacion_nulo_o_no_numerico_se_descarta():
+    results = [
+        {'fecha': '2024-01-02', 'detalle': [{'codigoMoneda': 'USD', 'tipoCotizacion': 808.5}]},
+        {'fecha': '2024-01-03', 'detalle': [{'codigoMoneda': 'USD', 'tipoCotizacion': None}]},
+        {'fecha': '2024-01-04', 'detalle': [{'codigoMoneda': 'USD', 'tipoCotizacion': 's/d'}]},
+        {'fecha': '2024-01-05', 'detalle': [{'codigoMoneda': 'USD', 'tipoCotizacion': '810.25'}]},
+        {'fecha': 'sin fecha', 'detalle': [{'codigoMoneda': 'USD', 'tipoCotizacion': 811.0}]},
+        {'fecha': '2024-01-08', 'detalle': [{'codigoMoneda': 'USD'}]},
+    ]
+
+    batch = CotizacionesColumns.from_results(results, {'USD'})
+
+    assert batch.fecha.astype(str).tolist() == ['2024-01-02', '2024-01-05']
+    assert batch.tipo_cambio.tolist() == [808.5, 810.25]
+
+def test_filtra_monedas_y_rango_de_cada_una():
+    results = [
+        {'fecha': '2024-01-02', 'detalle': [
+            {'codigoMoneda': 'USD', 'tipoCotizacion': 808.5},
+            {'codigoMoneda': 'EUR', 'tipoCotizacion': 885.1},
+            {'codigoMoneda': 'BRL', 'tipoCotizacion': 165.2},
+        ]},
+        {'fecha': '2024-01-03', 'detalle': [
+            {'codigoMoneda': 'USD', 'tipoCotizacion': 809.0},
+            {'codigoMoneda': 'EUR', 'tipoCotizacion': 886.0},
+        ]},
+    ]
+    # El endpoint por fecha devuelve un solo objeto en lugar de una lista
+    single = {'fecha': '2024-01-04', 'detalle': [{'codigoMoneda': 'EUR', 'tipoCotizacion': 887.0}]}
+
+    batch = CotizacionesColumns.concat([
+        CotizacionesColumns.from_results(results, {'USD', 'EUR'}),
+        CotizacionesColumns(),
+        CotizacionesColumns.from_results(single, {'USD', 'EUR'}),
+    ])
+    assert sorted(set(batch.moneda)) == ['EUR', 'USD']
+    assert len(batch) == 5
+
+    # USD pendiente desde el 3, EUR desde el 2; la ventana termina el 3
+    df = batch.select({'USD': '2024-01-03', 'EUR': '2024-01-02'}, '2024-01-01', '2024-01-03').to_frame()
+    assert list(zip(pd.to_datetime(df['fecha']).dt.strftime('%Y-%m-%d'), df['moneda'], df['tipo_cambio'])) == [
+        ('2024-01-02', 'EUR', 885.1),
+        ('2024-01-03', 'EUR', 886.0),
+        ('2024-01-03', 'USD', 809.0),
+    ]
+
+def test_to_frame_no_repite_claves():
+    results = [{'fecha': '2024-01-02', 'detalle': [{'codigoMoneda': 'USD', 'tipoCotizacion': 808.5}]}]
+    page = CotizacionesColumns.from_results(results, {'USD'})
+
+    df = CotizacionesColumns.concat([page, page]).to_frame()
+
+    assert len(df) == 1
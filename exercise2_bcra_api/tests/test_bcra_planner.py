@@ -0,0 +1,37 @@
+"""
+Pruebas de las ventanas de consulta que arma el planificador del BCRA.
+
+Uso:
+    python -m pytest -q exercise2_bcra_api/tests
+"""
+import os
+import sys
+from datetime import date
+
+EXERCISE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.abspath(os.path.join(EXERCISE_DIR, '..')))
+sys.path.append(os.path.join(EXERCISE_DIR, 'src'))
+
+from bcra_planner import WindowPlanner
+
+def test_ventanas_siguen_la_grilla_del_calendario():
+    planner = WindowPlanner(1000, state_path="")
+    planner.rows_per_day = 1.0  # 900 días por ventana: celdas de 24 meses
+    missing_ranges = {"USD": [(date(2019, 3, 7), date(2024, 5, 20), 0)]}
+
+    assert planner.window_months() == 24
+    assert planner.plan_windows(missing_ranges) == [
+        ("2019-03-07", "2019-12-31"),
+        ("2020-01-01", "2021-12-31"),
+        ("2022-01-01", "2023-12-31"),
+        ("2024-01-01", "2024-05-20"),
+    ]
+
+def test_misma_historia_da_las_mismas_ventanas_aunque_cambie_lo_observado():
+    missing_ranges = {"USD": [(date(2002, 1, 2), date(2024, 12, 31), 0)], "EUR": [(date(2010, 6, 1), date(2024, 12, 31), 0)]}
+    planner = WindowPlanner(1000, state_path="")
+    planner.rows_per_day = 0.68
+    first_run = planner.plan_windows(missing_ranges)
+    # Otra densidad observada que cae en el mismo tamaño de grilla
+    planner.rows_per_day = 0.75
+    assert planner.plan_windows(missing_ranges) == first_run
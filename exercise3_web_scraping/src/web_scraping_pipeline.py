@@ -1,18 +1,26 @@
 # sudata-de-challenge-kpojoa/exercise3_web_scraping/src/web_scraping_pipeline.py
 
 from selenium import webdriver
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options as ChromeOptions
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
 from webdriver_manager.chrome import ChromeDriverManager
 
 from bs4 import BeautifulSoup
 import pandas as pd
 from datetime import datetime
+import queue
+import threading
 import time
 import re
+from urllib.parse import urlparse
 
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 import os
+import sys
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -20,6 +28,13 @@ current_dir = os.path.dirname(__file__)
 project_root = os.path.join(current_dir, '..', '..')
 load_dotenv(os.path.join(project_root, '.env'))
 
+# Shared database connection layer (common/ at the repository root)
+sys.path.append(project_root)
+from common.db_connection import get_engine, report_pool_stats
+from common.exchange_rates import CURRENCY_ALIASES, load_exchange_rates
+from common.instrumentation import stage, start_run
+from common.run_ledger import record_run
+
 # --- Database Credentials ---
 DB_CLOUD_HOST = os.getenv("DB_CLOUD_HOST")
 DB_CLOUD_PORT = os.getenv("DB_CLOUD_PORT")
@@ -29,15 +44,25 @@ DB_CLOUD_PASSWORD = os.getenv("DB_CLOUD_PASSWORD")
 
 # --- Scraping Configuration ---
 BASE_URL = "https://www.zonaprop.com.ar/terrenos-venta-posadas.html"
-DELAY_SECONDS = 3  # Delay between page requests to be respectful to the website
-MAX_PAGES_TO_SCRAPE = 2  # Number of listing pages to scrape
-MIN_RESULTS_REQUIRED = 20 # Minimum number of results to collect
+MAX_PAGES_TO_SCRAPE = int(os.getenv("SCRAPING_MAX_PAGES", "2"))  # Number of listing pages to scrape
+MIN_RESULTS_REQUIRED = int(os.getenv("SCRAPING_MIN_RESULTS", "20")) # Minimum number of results to collect (0 = every page)
+# Browser pool: one headless Chrome per worker, all fed from the same page queue
+SCRAPING_WORKERS = int(os.getenv("SCRAPING_WORKERS", "4"))
+SCRAPING_HEADLESS = os.getenv("SCRAPING_HEADLESS", "true").lower() == "true"
+SCRAPING_USER_AGENT = os.getenv("SCRAPING_USER_AGENT") # Headless Chrome announces itself as HeadlessChrome
+# Politeness budget: minimum seconds between two page requests to the same domain, shared by every worker
+DOMAIN_MIN_INTERVAL_SECONDS = float(os.getenv("SCRAPING_DOMAIN_MIN_INTERVAL", "1.5"))
+PAGE_LOAD_TIMEOUT_SECONDS = 30
+# Maximum wait for the ad cards to render (replaces the fixed 3 second sleep per page)
+PAGE_WAIT_SECONDS = int(os.getenv("SCRAPING_PAGE_WAIT_SECONDS", "10"))
+# Times a page is put back in the queue after its browser crashed or timed out
+SCRAPING_PAGE_RETRIES = int(os.getenv("SCRAPING_PAGE_RETRIES", "2"))
+AD_CARD_SELECTOR = "div.postingCard-module__posting-container"
 
 # --- Database Connection ---
 def get_cloud_db_engine():
-    """Creates and returns an SQLAlchemy engine for the cloud database."""
-    db_connection_str = f"postgresql+psycopg2://{DB_CLOUD_USER}:{DB_CLOUD_PASSWORD}@{DB_CLOUD_HOST}:{DB_CLOUD_PORT}/{DB_CLOUD_NAME}"
-    return create_engine(db_connection_str)
+    """Returns the shared, pooled SQLAlchemy engine for the cloud database."""
+    return get_engine("scraping_cloud", DB_CLOUD_HOST, DB_CLOUD_PORT, DB_CLOUD_NAME, DB_CLOUD_USER, DB_CLOUD_PASSWORD)
 
 # --- DDL Definition for 'propiedades_posadas' table ---
 PROPIEDADES_TABLE_DDL = """
@@ -47,6 +72,8 @@ CREATE TABLE IF NOT EXISTS propiedades_posadas (
     ubicacion TEXT,
     precio_moneda VARCHAR(10),
     precio_valor NUMERIC(15, 2),
+    precio_ars NUMERIC(18, 2),
+    precio_usd NUMERIC(15, 2),
     metros_cuadrados_terreno NUMERIC(10, 2),
     frente_terreno_mts NUMERIC(10, 2),
     largo_terreno_mts NUMERIC(10, 2),
@@ -58,6 +85,9 @@ CREATE TABLE IF NOT EXISTS propiedades_posadas (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
+-- Tables created before the normalized prices existed
+ALTER TABLE propiedades_posadas ADD COLUMN IF NOT EXISTS precio_ars NUMERIC(18, 2);
+ALTER TABLE propiedades_posadas ADD COLUMN IF NOT EXISTS precio_usd NUMERIC(15, 2);
 """
 
 def create_propiedades_table(engine):
@@ -68,6 +98,17 @@ def create_propiedades_table(engine):
             connection.execute(text(PROPIEDADES_TABLE_DDL))
     print("Tabla 'propiedades_posadas' creada/verificada exitosamente.")
 
+# --- normalize_price_currency: Maps the currency shown on an ad to an ISO code ---
+def normalize_price_currency(currency_raw):
+    """
+    Returns the ISO code of an ad's currency ('USD', 'U$S' -> 'USD'; '$' -> 'ARS').
+    Ads without a currency are assumed to be in USD, as most land listings are.
+    """
+    if not currency_raw:
+        return "USD"
+    currency = currency_raw.upper()
+    return CURRENCY_ALIASES.get(currency, currency)
+
 # --- parse_ad_data: Extracts data from the listing page HTML ---
 def parse_ad_data(ad_element):
     """
@@ -121,7 +162,7 @@ def parse_ad_data(ad_element):
         currency_raw = price_match_in_desc.group(1)
         value_str = price_match_in_desc.group(2)
         value_str = value_str.replace('.', '').replace(',', '.')
-        data['precio_moneda'] = (currency_raw.upper().replace('$', 'USD') if currency_raw else "USD")
+        data['precio_moneda'] = normalize_price_currency(currency_raw)
         try: data['precio_valor'] = float(value_str)
         except ValueError: data['precio_valor'] = None
     else:
@@ -132,7 +173,7 @@ def parse_ad_data(ad_element):
             if price_match_div:
                 currency_div = price_match_div.group(1)
                 value_str_div = price_match_div.group(2)
-                data['precio_moneda'] = (currency_div.upper().replace('$', 'USD') if currency_div else "USD")
+                data['precio_moneda'] = normalize_price_currency(currency_div)
                 try: data['precio_valor'] = float(value_str_div)
                 except ValueError: data['precio_valor'] = None
             elif "consultar precio" in price_text_div.lower():
@@ -174,87 +215,276 @@ def parse_ad_data(ad_element):
     return data
 
 
-# --- scrape_zonaprop: Orchestrates the scraping process with Selenium ---
-def scrape_zonaprop():
+# --- parse_listing_page: Parses every ad card of a listing page ---
+def parse_listing_page(page_source, page_num=1):
     """
-    Performs web scraping of property listings from Zonaprop.com.ar using Selenium with Google Chrome.
-    It navigates through listing pages and extracts data.
+    Parses the HTML of a listing page and returns the ads that have an id and a URL.
+    Returns None when the page has no ad cards at all (end of the listing).
     """
-    all_ads_data = []
-    total_scraped_count = 0
-    page_num = 1
-    driver = None
-
-    print(f"Iniciando scraping de Zonaprop para terrenos en Posadas desde: {BASE_URL} (usando Selenium con Chrome)")
-
-    try:
-        # Configure Chrome options (e.g., headless mode for server environments)
-        chrome_options = ChromeOptions()
-        # chrome_options.add_argument("--headless")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        
-        # Initialize the WebDriver for Chrome
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=chrome_options)
-        driver.set_page_load_timeout(30) # Set page load timeout
-
-        while total_scraped_count < MIN_RESULTS_REQUIRED and page_num <= MAX_PAGES_TO_SCRAPE:
-            url = f"{BASE_URL.replace('.html', '')}-pagina-{page_num}.html" if page_num > 1 else BASE_URL
-            print(f"  Navegando a página {page_num}: {url}")
-
+    with stage("html_parse") as metrics:
+        soup = BeautifulSoup(page_source, 'html.parser')
+
+        # Identify individual ad elements
+        ad_elements = soup.find_all('div', class_='postingCard-module__posting-container')
+        metrics["rows"] = len(ad_elements)
+        metrics["bytes"] = len(page_source)
+    if not ad_elements:
+        return None
+
+    page_ads = []
+    with stage("parse_ads") as metrics:
+        for ad_element in ad_elements:
             try:
-                driver.get(url)
-                time.sleep(DELAY_SECONDS) # Give time for dynamic content to load
-
-                soup = BeautifulSoup(driver.page_source, 'html.parser')
-
-                # Identify individual ad elements
-                ad_elements = soup.find_all('div', class_='postingCard-module__posting-container')
-                
-                if not ad_elements:
-                    print(f"  No se encontraron anuncios en la página {page_num}. Terminando scraping.")
-                    break
-
-                ads_on_page_count = 0
-                for ad_element in ad_elements:
-                    try:
-                        parsed_data = parse_ad_data(ad_element)
-                        if parsed_data.get('id_anuncio') and parsed_data.get('url_anuncio'):
-                            all_ads_data.append(parsed_data)
-                            ads_on_page_count += 1
-                            total_scraped_count += 1
-                            if total_scraped_count >= MIN_RESULTS_REQUIRED:
-                                print(f"  Alcanzado el mínimo de {MIN_RESULTS_REQUIRED} resultados.")
-                                break
-                    except Exception as e:
-                        print(f"    Error al parsear un anuncio en página {page_num}: {e}")
-                        continue
-
-                print(f"  Scrapeados {ads_on_page_count} anuncios en página {page_num}. Total: {total_scraped_count}")
-
-                page_num += 1
-
+                parsed_data = parse_ad_data(ad_element)
+                if parsed_data.get('id_anuncio') and parsed_data.get('url_anuncio'):
+                    page_ads.append(parsed_data)
             except Exception as e:
-                print(f"  Error durante la navegación o carga de página {url}: {e}")
-                break
+                print(f"    Error al parsear un anuncio en página {page_num}: {e}")
+                continue
+        metrics["rows"] = len(page_ads)
+    return page_ads
+
+
+# --- DomainThrottle: Politeness budget shared by every browser worker ---
+class DomainThrottle:
+    """
+    Spaces page requests to the same domain at least 'min_interval' seconds apart, across all
+    workers. reserve() books the next free slot and returns how long to wait for it.
+    """
 
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self.next_slot = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, url):
+        domain = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(domain, now))
+            self.next_slot[domain] = slot + self.min_interval
+        return slot - now
+
+# --- create_driver: Starts one headless Chrome for a worker ---
+def create_driver(driver_path):
+    """Starts a Chrome WebDriver (headless unless SCRAPING_HEADLESS=false)."""
+    chrome_options = ChromeOptions()
+    if SCRAPING_HEADLESS:
+        chrome_options.add_argument("--headless=new")
+        chrome_options.add_argument("--window-size=1920,1080")
+    if SCRAPING_USER_AGENT:
+        chrome_options.add_argument(f"--user-agent={SCRAPING_USER_AGENT}")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+
+    driver = webdriver.Chrome(service=Service(driver_path), options=chrome_options)
+    driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT_SECONDS) # Set page load timeout
+    return driver
+
+def get_page_url(page_num):
+    """URL of a listing page (the first one has no page suffix)."""
+    return f"{BASE_URL.replace('.html', '')}-pagina-{page_num}.html" if page_num > 1 else BASE_URL
+
+# --- scrape_listing_page: Loads and parses one listing page in a worker's browser ---
+def scrape_listing_page(driver, page_num, throttle):
+    """
+    Waits for the domain's politeness slot, loads the page and waits until the ad cards are
+    rendered (instead of a fixed sleep). Returns the page's ads, or None at the end of the listing.
+    Browser errors are raised, so the worker can restart it and retry the page.
+    """
+    url = get_page_url(page_num)
+    with stage("politeness_wait"):
+        time.sleep(throttle.reserve(url))
+    print(f"  Navegando a página {page_num}: {url}")
+    with stage("browser_get"):
+        driver.get(url)
+    with stage("page_wait"):
+        try:
+            WebDriverWait(driver, PAGE_WAIT_SECONDS).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, AD_CARD_SELECTOR))
+            )
+        except TimeoutException:
+            # No ad cards rendered: past the last page (parse_listing_page returns None) or a slow page
+            pass
+    return parse_listing_page(driver.page_source, page_num)
+
+# --- scrape_zonaprop: Orchestrates the scraping process with a pool of Selenium browsers ---
+def scrape_zonaprop():
+    """
+    Performs web scraping of property listings from Zonaprop.com.ar with a pool of
+    SCRAPING_WORKERS headless Chrome browsers fed from a shared page queue.
+    Every request to the domain goes through one DomainThrottle. A worker whose browser
+    crashes or times out restarts it and puts its page back in the queue (up to
+    SCRAPING_PAGE_RETRIES times). Ads are returned in page order.
+    """
+    # Lowest page first, so a page put back after a crash is retried before the pages after it
+    pages = queue.PriorityQueue()
+    for page_num in range(1, MAX_PAGES_TO_SCRAPE + 1):
+        pages.put(page_num)
+
+    throttle = DomainThrottle(DOMAIN_MIN_INTERVAL_SECONDS)
+    results = {} # page_num -> list of ads, or None past the end of the listing
+    attempts = {}
+    failed_pages = []
+    lock = threading.Lock()
+
+    def page_not_needed(page_num):
+        """True when the listing already ended before this page or the earlier pages are enough."""
+        with lock:
+            if any(ads is None and ended_at < page_num for ended_at, ads in results.items()):
+                return True
+            if MIN_RESULTS_REQUIRED <= 0:
+                return False
+            collected = 0
+            for previous_page in range(1, page_num):
+                if not results.get(previous_page):
+                    return False
+                collected += len(results[previous_page])
+                if collected >= MIN_RESULTS_REQUIRED:
+                    return True
+            return False
+
+    def worker(worker_id):
+        driver = None
+        try:
+            while True:
+                try:
+                    page_num = pages.get_nowait()
+                except queue.Empty:
+                    return
+                if page_not_needed(page_num):
+                    continue
+                try:
+                    if driver is None:
+                        driver = create_driver(driver_path)
+                    page_ads = scrape_listing_page(driver, page_num, throttle)
+                    with lock:
+                        results[page_num] = page_ads
+                    if page_ads is not None:
+                        print(f"  Scrapeados {len(page_ads)} anuncios en página {page_num} (worker {worker_id}).")
+                except Exception as e:
+                    # The browser crashed or hung (a dead chromedriver raises connection errors, not
+                    # WebDriverException): restart it and give the page back to the queue
+                    print(f"  Error del navegador en la página {page_num} (worker {worker_id}): {type(e).__name__}: {e}. Reiniciando navegador...")
+                    if driver is not None:
+                        try:
+                            driver.quit()
+                        except Exception:
+                            pass
+                        driver = None
+                    with lock:
+                        attempts[page_num] = attempts.get(page_num, 0) + 1
+                        retry = attempts[page_num] <= SCRAPING_PAGE_RETRIES
+                        if not retry:
+                            failed_pages.append(page_num)
+                    if retry:
+                        pages.put(page_num)
+                    else:
+                        print(f"  AVISO: la página {page_num} falló {attempts[page_num]} veces; se omite.")
+        finally:
+            # A browser that already died can fail to quit; that must not hide the worker's own error
+            if driver is not None:
+                try:
+                    driver.quit()
+                except Exception:
+                    pass
+
+    print(
+        f"Iniciando scraping de Zonaprop para terrenos en Posadas desde: {BASE_URL} "
+        f"({SCRAPING_WORKERS} navegadores Chrome{' headless' if SCRAPING_HEADLESS else ''}, "
+        f"hasta {MAX_PAGES_TO_SCRAPE} páginas, una petición cada {DOMAIN_MIN_INTERVAL_SECONDS:g}s por dominio)"
+    )
+    try:
+        # Resolve the driver once: concurrent installs would race on the same download
+        driver_path = ChromeDriverManager().install()
+        workers = [
+            threading.Thread(target=worker, args=(worker_id,), daemon=True)
+            for worker_id in range(1, min(SCRAPING_WORKERS, MAX_PAGES_TO_SCRAPE) + 1)
+        ]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        print("Navegadores Selenium cerrados.")
     except Exception as e:
         print(f"\nERROR al iniciar o durante el proceso de Selenium: {e}")
-    finally:
-        if driver:
-            driver.quit()
-            print("Navegador Selenium cerrado.")
-    
-    print(f"\nScraping finalizado. Total de anuncios recolectados: {total_scraped_count}")
+
+    # Collect in page order up to the end of the listing and the minimum required. Stop at the
+    # first page without a result: the pages after a gap are not consecutive with the ones before it
+    all_ads_data = []
+    for page_num in range(1, MAX_PAGES_TO_SCRAPE + 1):
+        if page_num not in results:
+            if any(later_page > page_num for later_page in results):
+                print(f"  AVISO: falta la página {page_num}; se descartan las páginas siguientes.")
+            break
+        if results[page_num] is None:
+            print(f"  No se encontraron anuncios en la página {page_num}. Fin del listado.")
+            break
+        all_ads_data.extend(results[page_num])
+        if MIN_RESULTS_REQUIRED > 0 and len(all_ads_data) >= MIN_RESULTS_REQUIRED:
+            all_ads_data = all_ads_data[:MIN_RESULTS_REQUIRED]
+            print(f"  Alcanzado el mínimo de {MIN_RESULTS_REQUIRED} resultados.")
+            break
+    if failed_pages:
+        print(f"AVISO: páginas que no se pudieron scrapear: {sorted(failed_pages)}")
+
+    print(f"\nScraping finalizado. Total de anuncios recolectados: {len(all_ads_data)}")
     return pd.DataFrame(all_ads_data)
 
+# --- add_normalized_prices: Converts every price to ARS and USD in one pass ---
+def add_normalized_prices(df_propiedades, rates):
+    """
+    Fills 'precio_ars' and 'precio_usd' with the BCRA rate in force on each ad's 'fecha_scrapeo'
+    (common/exchange_rates.py: vectorized as-of lookups over the whole column, weekends and
+    holidays take the previous business day). Prices that can't be converted stay empty.
+    """
+    if rates is None or df_propiedades.empty:
+        df_propiedades['precio_ars'] = None
+        df_propiedades['precio_usd'] = None
+        return 0
+
+    with stage("price_normalization") as metrics:
+        valores = pd.to_numeric(df_propiedades['precio_valor'], errors='coerce')
+        monedas = df_propiedades['precio_moneda'].fillna('')
+        fechas = pd.to_datetime(df_propiedades['fecha_scrapeo'], errors='coerce').to_numpy()
+        df_propiedades['precio_ars'] = rates.convert(valores, monedas, fechas, 'ARS').round(2)
+        df_propiedades['precio_usd'] = rates.convert(valores, monedas, fechas, 'USD').round(2)
+        converted = int(df_propiedades['precio_usd'].notna().sum())
+        metrics["rows"] = converted
+
+    missing = int(valores.notna().sum()) - converted
+    if missing:
+        print(f"AVISO: {missing} precios sin cotización para su moneda y fecha; quedan sin normalizar.")
+    return converted
+
+# --- load_propiedades: Loads the scraped ads into the cloud database ---
+def load_propiedades(df_propiedades, engine, rates=None):
+    """
+    Drops duplicated ads, fills the normalized prices (if 'rates' is given, an
+    ExchangeRateIndex) and appends the rest to 'propiedades_posadas'.
+    """
+    print(f"Cargando {len(df_propiedades)} propiedades en la base de datos en la nube...")
+    df_propiedades.drop_duplicates(subset=['id_anuncio'], inplace=True)
+    converted = add_normalized_prices(df_propiedades, rates)
+    if rates is not None:
+        print(f"Precios normalizados a ARS y USD: {converted} de {len(df_propiedades)}.")
+    print(f"Cargando {len(df_propiedades)} propiedades únicas...")
+
+    with engine.connect() as connection, stage("load", table="propiedades_posadas") as metrics:
+        df_propiedades.to_sql('propiedades_posadas', connection, if_exists='append', index=False, schema='public')
+        metrics["rows"] = len(df_propiedades)
+    return len(df_propiedades)
+
 # --- run_web_scraping_pipeline: Main function of the scraping pipeline ---
 def run_web_scraping_pipeline():
     """
     Main function for the web scraping pipeline.
+    Returns the process exit code of the run (see common/run_ledger.py).
     """
     cloud_engine = None
+    succeeded = False
+    error = None
+    run = start_run("scraping")
     try:
         cloud_engine = get_cloud_db_engine()
         create_propiedades_table(cloud_engine)
@@ -262,24 +492,29 @@ def run_web_scraping_pipeline():
         df_propiedades = scrape_zonaprop()
 
         if not df_propiedades.empty:
-            print(f"Cargando {len(df_propiedades)} propiedades en la base de datos en la nube...")
-            df_propiedades.drop_duplicates(subset=['id_anuncio'], inplace=True)
-            print(f"Cargando {len(df_propiedades)} propiedades únicas...")
-            
-            with cloud_engine.connect() as connection:
-                df_propiedades.to_sql('propiedades_posadas', connection, if_exists='append', index=False, schema='public')
-            
+            # The BCRA series is read once (or from its on-disk cache) for all the ads
+            rates = load_exchange_rates(cloud_engine)
+            load_propiedades(df_propiedades, cloud_engine, rates)
             print("Propiedades cargadas exitosamente.")
         else:
             print("No se encontraron propiedades para cargar.")
+        succeeded = True
 
     except Exception as e:
+        error = str(e)
         print(f"\nERROR en el pipeline de web scraping: {e}")
     finally:
+        rows_by_table, _ = run.get_stage_totals(("load",))
+        _, bytes_downloaded = run.get_stage_totals(("html_parse",))
+        exit_code = record_run(cloud_engine, run, "listing", succeeded, rows_by_table, bytes_downloaded, error)
         if cloud_engine:
+            report_pool_stats(cloud_engine, "cloud")
             cloud_engine.dispose()
         print("Conexión a la base de datos cerrada.")
+        run.finish(succeeded)
+    return exit_code
 
 if __name__ == "__main__":
-    run_web_scraping_pipeline()
-    print("Proceso de Web Scraping finalizado.")
\ No newline at end of file
+    exit_code = run_web_scraping_pipeline()
+    print("Proceso de Web Scraping finalizado.")
+    sys.exit(exit_code)
\ No newline at end of file
@@ -0,0 +1,91 @@
+"""
+Pruebas del índice de cotizaciones (common/exchange_rates.py).
+
+Uso:
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+import numpy as np
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(REPO_ROOT)
+
+from common.exchange_rates import ExchangeRateIndex, load_exchange_rates, normalize_currency_codes
+
+def build_index():
+    # Viernes 5 y lunes 8 de enero de 2024; el martes 9 es "feriado" y se publica el miércoles 10
+    return ExchangeRateIndex(
+        ['USD', 'EUR', 'USD', 'USD', 'EUR'],
+        ['2024-01-10', '2024-01-05', '2024-01-05', '2024-01-08', '2024-01-08'],
+        [812.0, 885.0, 808.5, 810.0, 887.5],
+    )
+
+def test_fin_de_semana_y_feriado_toman_el_dia_habil_anterior():
+    rates = build_index()
+    fechas = ['2024-01-05', '2024-01-06', '2024-01-07', '2024-01-08', '2024-01-09', '2024-01-10']
+
+    assert rates.rates_as_of(['USD'] * 6, fechas).tolist() == [808.5, 808.5, 808.5, 810.0, 810.0, 812.0]
+
+def test_hueco_mayor_al_maximo_no_se_arrastra():
+    rates = build_index()
+
+    result = rates.rates_as_of(['USD', 'USD'], ['2024-01-20', '2024-01-21'])
+
+    assert result[0] == 812.0
+    assert np.isnan(result[1])
+
+def test_alias_de_moneda():
+    assert normalize_currency_codes(['$', ' ar$ ', 'Pesos', 'U$S', 'us$', 'EUR']).tolist() == [
+        'ARS', 'ARS', 'ARS', 'USD', 'USD', 'EUR',
+    ]
+
+    # '$' es peso y no se convierte; 'U$S' usa la serie del dólar
+    rates = build_index()
+    assert rates.rates_as_of(['$', 'U$S'], ['2024-01-08', '2024-01-08']).tolist() == [1.0, 810.0]
+    assert rates.convert([100.0, 2.0], ['$', 'U$S'], ['2024-01-08', '2024-01-08']).tolist() == [100.0, 1620.0]
+
+def test_moneda_desconocida_o_fecha_anterior_a_la_serie_da_nan():
+    rates = build_index()
+
+    result = rates.rates_as_of(['GBP', 'USD', 'USD', 'ARS'], ['2024-01-08', '2024-01-04', 'NaT', '2024-01-08'])
+
+    assert np.isnan(result[:3]).all()
+    assert result[3] == 1.0
+
+def test_convierte_entre_monedas_con_la_cotizacion_de_cada_fecha():
+    rates = build_index()
+
+    result = rates.convert([100.0, 100.0, np.nan], ['EUR', 'EUR', 'EUR'], ['2024-01-05', '2024-01-07', '2024-01-08'], 'USD')
+
+    assert np.allclose(result[:2], [100.0 * 885.0 / 808.5, 100.0 * 885.0 / 808.5])
+    assert np.isnan(result[2])
+
+def test_archivo_npz_conserva_el_indice(tmp_path):
+    rates = build_index()
+    path = str(tmp_path / 'cache' / 'exchange_rates.npz')
+
+    rates.save(path)
+    loaded = ExchangeRateIndex.load(path)
+
+    assert os.listdir(tmp_path / 'cache') == ['exchange_rates.npz']
+    assert loaded.monedas == ['EUR', 'USD']
+    assert np.array_equal(loaded.moneda, rates.moneda)
+    assert np.array_equal(loaded.fecha, rates.fecha)
+    assert np.array_equal(loaded.tipo_cambio, rates.tipo_cambio)
+    fechas = ['2024-01-06', '2024-01-09', '2024-01-04']
+    assert np.array_equal(loaded.rates_as_of(['USD'] * 3, fechas), rates.rates_as_of(['USD'] * 3, fechas), equal_nan=True)
+
+class FailingEngine:
+    def connect(self):
+        raise ConnectionError("sin base")
+
+def test_sin_base_se_usa_el_archivo_vencido(tmp_path):
+    path = str(tmp_path / 'exchange_rates.npz')
+    build_index().save(path)
+
+    rates = load_exchange_rates(FailingEngine(), cache_path=path, ttl_seconds=0)
+
+    assert len(rates) == 5
+    assert load_exchange_rates(FailingEngine(), cache_path=str(tmp_path / 'otro.npz'), ttl_seconds=0) is None